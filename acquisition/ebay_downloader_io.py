@@ -10,6 +10,7 @@ from acquisition.item import Item
 from acquisition.items import Items
 from acquisition.ebay_shopping_api import EbayShoppingAPI
 from category import Category
+from utils.tracing import span
 from utils.with_verbose import WithVerbose
 from ebaysdk.exception import ConnectionError
 
@@ -60,7 +61,7 @@ class EbayDownloaderIO(WithVerbose):
             if isfile(self.items_file + '.bak'):
                 remove(self.items_file + '.bak')
             rename(self.items_file, self.items_file + '.bak')
-        with open(self.items_file, 'wb') as file:
+        with span('save_items', 'io', items=len(items)), open(self.items_file, 'wb') as file:
             pickle.dump(items, file, protocol=protocol)
 
     def import_likes(self, api: EbayShoppingAPI, items: Items) -> Items:
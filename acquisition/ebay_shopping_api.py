@@ -7,6 +7,7 @@ from acquisition.ebay_item import EbayItem
 from acquisition.items import Items
 from acquisition.shopping_api import ShoppingApi
 from category import Category
+from utils.tracing import span
 
 
 class EbayShoppingAPI(ShoppingApi):
@@ -47,7 +48,8 @@ class EbayShoppingAPI(ShoppingApi):
             # 'sortOrder': 'EndTimeSoonest',
             'paginationInput': {'entriesPerPage': limit, 'pageNumber': page},
         }
-        response = self._search_api.execute('findItemsAdvanced', query)
+        with span('search', 'api', ebay_category=category.name, page=page):
+            response = self._search_api.execute('findItemsAdvanced', query)
         try:
             return Items([
                 EbayItem(self, category, result['itemId'])
@@ -65,5 +67,6 @@ class EbayShoppingAPI(ShoppingApi):
             'IncludeSelector': 'Description,ItemSpecifics'
         }
 
-        response = self._api.execute('GetSingleItem', query)
+        with span('get_item', 'api', item_id=item_id):
+            response = self._api.execute('GetSingleItem', query)
         return response.dict()['Item']
@@ -0,0 +1,122 @@
+from collections import defaultdict
+from os import remove
+from os.path import basename, normpath
+from typing import Dict, Iterable, List, Set, Tuple
+
+from acquisition import image_storage
+from acquisition.item import Item
+from acquisition.items import Items
+from utils.with_verbose import WithVerbose
+
+
+class ImageCache(WithVerbose):
+    """
+    Keeps the images under a download root within a disk budget. Images not referenced by a liked item
+    are evicted least recently used first, along with their scaled copies. Freshly downloaded images
+    have a current access time, training records when an image was last read from its file with
+    image_storage.record_access(). Reads from an image archive are not recorded.
+    """
+
+    def __init__(self, root: str, max_bytes: int, verbose: bool=False) -> None:
+        """
+        :param root: download root folder
+        :param max_bytes: disk space the images (including scaled copies) may use
+        :param verbose: If set, print status/progress information
+        """
+        WithVerbose.__init__(self, verbose)
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def evict(self, items: Items) -> Tuple[int, int]:
+        """
+        Remove the least recently used images until the images fit into the disk budget. Images of
+        liked items are never removed. Removed images are taken out of the items' picture files, so the
+        items download them again when they are needed.
+        :param items: Items whose picture files are updated
+        :return: (number of images removed, number of bytes freed)
+        """
+        usage = self._usage()
+        total_bytes = sum(size for _, size, _ in usage.values())
+        self._print_status(
+            '{} images, {:.2f}GB used, {:.2f}GB allowed'.format(
+                len(usage), total_bytes / 1024 ** 3, self.max_bytes / 1024 ** 3
+            )
+        )
+        if total_bytes <= self.max_bytes:
+            return 0, 0
+
+        protected = _image_names([item for item in items if item.is_liked])
+        evicted = set()  # type: Set[str]
+        freed = 0
+        for image_file, (_, size, files) in sorted(usage.items(), key=lambda entry: entry[1][0]):
+            if total_bytes - freed <= self.max_bytes:
+                break
+            if basename(image_file) in protected:
+                continue
+            _remove_all(files)
+            evicted.add(normpath(image_file))
+            freed += size
+
+        self._forget(items, evicted)
+        self._print_status('{} images evicted, {:.2f}GB freed'.format(len(evicted), freed / 1024 ** 3))
+        return len(evicted), freed
+
+    def remove_unreferenced(self, items: Items) -> Tuple[int, int]:
+        """
+        Remove all images, along with their scaled copies, which do not belong to any of the items.
+        :param items: Items whose images are kept
+        :return: (number of images removed, number of bytes freed)
+        """
+        referenced = _image_names(items)
+        removed, freed = 0, 0
+        for image_file, (_, size, files) in self._usage().items():
+            if basename(image_file) not in referenced:
+                _remove_all(files)
+                removed += 1
+                freed += size
+        self._print_status('{} images removed, {:.2f}GB freed'.format(removed, freed / 1024 ** 3))
+        return removed, freed
+
+    def _usage(self) -> Dict[str, Tuple[int, int, List[str]]]:
+        """
+        :return: {original image file: (last access time, bytes used, all files belonging to the image)}
+        """
+        last_access = {}  # type: Dict[str, int]
+        sizes = defaultdict(int)  # type: Dict[str, int]
+        files = defaultdict(list)  # type: Dict[str, List[str]]
+        for image_file, entry in image_storage.stored_files(self.root):
+            file_stat = entry.stat(follow_symlinks=False)
+            sizes[image_file] += file_stat.st_size
+            files[image_file].append(entry.path)
+            if entry.path == image_file:
+                last_access[image_file] = file_stat.st_atime_ns
+        return {
+            image_file: (last_access.get(image_file, 0), sizes[image_file], files[image_file])
+            for image_file in files
+        }
+
+    def _forget(self, items: Items, evicted: Set[str]) -> None:
+        if not evicted:
+            return
+        for item in items:
+            item.picture_files = [
+                image_file for image_file in item.picture_files if normpath(image_file) not in evicted
+            ]
+        items.is_download_complete = False
+
+
+def _image_names(items: Iterable[Item]) -> Set[str]:
+    """File names of all pictures of the given items, independent of the layout they are stored in."""
+    return {
+        image_storage.url_to_file_name(url) for item in items for url in item.picture_urls
+    } | {
+        basename(image_file) for item in items for image_file in item.picture_files
+    }
+
+
+def _remove_all(files: List[str]) -> None:
+    for file in files:
+        try:
+            remove(file)
+        except FileNotFoundError:
+            pass
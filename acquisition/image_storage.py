@@ -0,0 +1,257 @@
+"""
+Directory layouts for the downloaded item images.
+
+Images are stored either flat, directly in the download root, or sharded into two levels of
+subdirectories named after the leading hex digits of the MD5 hash of the file name, e.g.
+data/eBay/3f/a2/<file name>. A download root is sharded if it contains the layout marker file. While
+the marker says the migration into the sharded layout is still running, images not yet moved are
+looked up in the flat layout as well.
+"""
+
+import re
+from hashlib import md5
+from os import makedirs, remove, rename, rmdir, scandir, stat, utime, DirEntry
+from os.path import join, isfile, isdir, basename, normpath, dirname
+from time import monotonic, time_ns
+from typing import Dict, List, Iterable, Iterator, Tuple
+
+from utils.with_verbose import WithVerbose
+
+LAYOUT_FILE = '.layout'
+SHARDED = 'sharded'
+MIGRATING = 'migrating'
+FLAT = 'flat'
+# seconds the layout of a download root is remembered, so a migration by another process is noticed
+LAYOUT_CACHE_SECONDS = 60.
+# access times more recent than this are not updated, to save metadata writes on every run
+ACCESS_RESOLUTION_NS = 24 * 3600 * 10 ** 9
+SHARD_LEVELS = 2
+SHARD_DIR_PATTERN = re.compile('^[0-9a-f]{2}$')
+SCALED_DIR_PATTERN = re.compile(r'^\d+x\d+$')
+
+
+_layouts = {}  # type: Dict[str, Tuple[float, str]]
+
+
+def layout(root: str) -> str:
+    """
+    :param root: download root folder
+    :return: FLAT, SHARDED or MIGRATING, if a migration to the sharded layout has not finished yet
+    """
+    if root not in _layouts or monotonic() - _layouts[root][0] >= LAYOUT_CACHE_SECONDS:
+        _layouts[root] = (monotonic(), _read_layout(root))
+    return _layouts[root][1]
+
+
+def clear_layout_cache() -> None:
+    _layouts.clear()
+
+
+def is_sharded(root: str) -> bool:
+    """
+    :param root: download root folder
+    :return: True if the images under root are stored in the sharded layout, or are being moved there
+    """
+    return layout(root) != FLAT
+
+
+def url_to_file_name(url: str) -> str:
+    """
+    :param url: URL of a picture of an item
+    :return: name of the file the picture is stored in, without folder
+    """
+    return '_'.join(url.split('/')[-4:])
+
+
+def shard_dirs(filename: str) -> List[str]:
+    """
+    :param filename: image file name without folder
+    :return: subdirectories the image is stored in when the download root is sharded
+    """
+    digest = md5(filename.encode('utf-8')).hexdigest()
+    return [digest[2 * level:2 * level + 2] for level in range(SHARD_LEVELS)]
+
+
+def sharded_path(root: str, filename: str) -> str:
+    return join(root, *shard_dirs(filename), filename)
+
+
+def image_path(root: str, filename: str) -> str:
+    """
+    Get the path for an image file in the layout used by root. While a migration to the sharded layout
+    is running, flat files not yet migrated are found as well.
+    :param root: download root folder
+    :param filename: image file name without folder
+    :return: path of the image file
+    """
+    root_layout = layout(root)
+    if root_layout == FLAT:
+        return join(root, filename)
+    path = sharded_path(root, filename)
+    if root_layout == MIGRATING and not isfile(path) and isfile(join(root, filename)):
+        return join(root, filename)
+    return path
+
+
+def root_of(image_file: str) -> str:
+    """
+    :param image_file: path of an original image file stored in either layout
+    :return: download root folder the image file belongs to
+    """
+    folder = dirname(image_file)
+    shards = (basename(dirname(folder)), basename(folder))
+    root = dirname(dirname(folder))
+    if all(SHARD_DIR_PATTERN.match(shard) for shard in shards) and is_sharded(root):
+        return root
+    return folder
+
+
+def remove_scaled_copies(image_file: str) -> int:
+    """
+    Delete the precomputed scaled copies of an image file whose contents have changed.
+    :param image_file: path of the original image file
+    :return: number of scaled copies removed
+    """
+    removed = 0
+    for entry in scandir(dirname(image_file)):
+        if entry.is_dir(follow_symlinks=False) and SCALED_DIR_PATTERN.match(entry.name):
+            try:
+                remove(join(entry.path, basename(image_file) + '.png'))
+                removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
+
+
+def relocate(image_file: str, root: str) -> str:
+    """
+    :param image_file: path of an image file stored in any layout
+    :param root: download root folder the image file belongs to
+    :return: path of the image file in the layout currently used by root
+    """
+    folder = dirname(image_file)
+    if normpath(folder) != normpath(root) and normpath(dirname(dirname(folder))) != normpath(root):
+        return image_file
+    return image_path(root, basename(image_file))
+
+
+def image_files(root: str) -> Iterator[str]:
+    """
+    List all original image files under root without stat()ing every file, in either layout.
+    Scaled copies and temporary files are not included.
+    :param root: download root folder
+    :return: iterator over the paths of all image files
+    """
+    yield from _files_in(root)
+    for level_1 in _shard_dirs_in(root):
+        for level_2 in _shard_dirs_in(level_1):
+            yield from _files_in(level_2)
+
+
+def stored_files(root: str) -> Iterator[Tuple[str, DirEntry]]:
+    """
+    List all files under root that belong to an image, the original image files as well as their
+    scaled copies, in either layout.
+    :param root: download root folder
+    :return: iterator over pairs of (path of the original image file, directory entry of the file)
+    """
+    yield from _stored_files_in(root)
+    for level_1 in _shard_dirs_in(root):
+        for level_2 in _shard_dirs_in(level_1):
+            yield from _stored_files_in(level_2)
+
+
+def record_access(image_files: Iterable[str]) -> None:
+    """
+    Mark the given image files as used now, so an ImageCache evicts them last. Only the access time is
+    updated, the modification time stays untouched for backups. Files accessed less than
+    ACCESS_RESOLUTION_NS ago are left alone.
+    :param image_files: paths of the image files
+    :return: None
+    """
+    now = time_ns()
+    for image_file in image_files:
+        try:
+            file_stat = stat(image_file)
+            if file_stat.st_atime_ns < now - ACCESS_RESOLUTION_NS:
+                utime(image_file, ns=(now, file_stat.st_mtime_ns))
+        except OSError:
+            pass
+
+
+def migrate_to_sharded(root: str, verbose: bool=False) -> int:
+    """
+    Move all images in a flat download root, along with their precomputed scaled copies, into the
+    sharded layout. The migration can be interrupted and restarted at any time.
+    :param root: download root folder
+    :param verbose: If set, print progress information
+    :return: number of image files moved
+    """
+    _write_layout(root, MIGRATING)
+    moved = 0
+    for entry in scandir(root):
+        if entry.is_file(follow_symlinks=False) and _is_image_file_name(entry.name):
+            _move(entry.path, sharded_path(root, entry.name))
+            moved += 1
+            WithVerbose.print_status(verbose, 'Moved {} image files'.format(moved), end='\r')
+        elif entry.is_dir(follow_symlinks=False) and SCALED_DIR_PATTERN.match(entry.name):
+            _migrate_scaled_copies(root, entry.name)
+    WithVerbose.print_status(verbose, 'Moved {} image files'.format(moved))
+    _write_layout(root, SHARDED)
+    return moved
+
+
+def _migrate_scaled_copies(root: str, scaled_dir: str) -> None:
+    for entry in scandir(join(root, scaled_dir)):
+        original_name = entry.name[:-len('.png')]
+        _move(entry.path, join(root, *shard_dirs(original_name), scaled_dir, entry.name))
+    rmdir(join(root, scaled_dir))
+
+
+def _move(source: str, destination: str) -> None:
+    makedirs(dirname(destination), exist_ok=True)
+    rename(source, destination)
+
+
+def _read_layout(root: str) -> str:
+    if not isfile(join(root, LAYOUT_FILE)):
+        return FLAT
+    with open(join(root, LAYOUT_FILE)) as file:
+        return file.read().strip()
+
+
+def _write_layout(root: str, root_layout: str) -> None:
+    with open(join(root, LAYOUT_FILE), 'w') as file:
+        file.write(root_layout + '\n')
+    _layouts.pop(root, None)
+
+
+def _stored_files_in(folder: str) -> Iterator[Tuple[str, DirEntry]]:
+    for entry in scandir(folder):
+        if entry.is_file(follow_symlinks=False) and _is_image_file_name(entry.name):
+            yield entry.path, entry
+        elif entry.is_dir(follow_symlinks=False) and SCALED_DIR_PATTERN.match(entry.name):
+            for scaled in scandir(entry.path):
+                if scaled.is_file(follow_symlinks=False) and _is_image_file_name(scaled.name):
+                    yield join(folder, scaled.name[:-len('.png')]), scaled
+
+
+def _files_in(folder: str) -> Iterator[str]:
+    return (
+        entry.path for entry in scandir(folder)
+        if entry.is_file(follow_symlinks=False) and _is_image_file_name(entry.name)
+    )
+
+
+def _shard_dirs_in(folder: str) -> Iterator[str]:
+    if not isdir(folder):
+        return iter(())
+    return (
+        entry.path for entry in scandir(folder)
+        if entry.is_dir(follow_symlinks=False) and SHARD_DIR_PATTERN.match(entry.name)
+    )
+
+
+def _is_image_file_name(name: str) -> bool:
+    # the layout marker and the lists of precomputed scaled copies are hidden files
+    return not name.startswith('.') and not name.endswith('.tmp')
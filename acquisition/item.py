@@ -1,17 +1,20 @@
 import re
-from os.path import join, isfile
+from os.path import join, isfile, basename, dirname
 from collections import defaultdict
-from os import remove, makedirs
-from typing import Set, Dict, List
+from os import remove, makedirs, replace
+from shutil import copy2
+from typing import Set, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
 from urllib.request import urlretrieve
 from urllib.error import URLError, ContentTooShortError
 from http.client import RemoteDisconnected
 import concurrent.futures
-import asyncio
 
+from acquisition import image_storage
 from acquisition.shopping_api import ShoppingApi
 from acquisition.tag_processor import TagProcessor
 from category import Category
+from utils.tracing import span
 
 
 class Item:
@@ -25,6 +28,7 @@ class Item:
         # 'material': 'material', 'obermaterial': 'material',
     }
     MAX_DOWNLOAD_THREADS = 18  # limit imposed by the eBay API (we don't use the API here, but BSTS)
+    MASTER_JPEG_QUALITY = 90
 
     def __init__(self, api: ShoppingApi, category: Category, item_id: int) -> None:
         try:
@@ -41,6 +45,7 @@ class Item:
         finally:
             self.category = category
             self.picture_files = []  # type: List[str]
+            self.picture_sizes = {}  # type: Dict[str, Tuple[int, int]]
             self.tags = set()  # type: Set[str]
 
     def like(self) -> None:
@@ -59,23 +64,46 @@ class Item:
     def valid(self) -> bool:
         return self._valid
 
-    def download_images(self) -> None:
+    def download_images(self, max_edge: Optional[int]=None, originals_dir: Optional[str]=None) -> None:
         """
         Download the images associated with this Item to self.download_root.
-        :param verbose: If set, print a progress message
+        :param max_edge: If set, images are stored as masters no wider or higher than max_edge pixels
+        :param originals_dir: If set, keep the full size originals of downscaled masters in this folder
         :return: None
         """
         makedirs(self.download_root, exist_ok=True)
-        if len(self.picture_files) == len(self.picture_urls) \
-                and all(is_image_file(f) for f in self.picture_files):
-            return
+        if len(self.picture_files) != len(self.picture_urls) \
+                or not all(is_image_file(f) for f in self.picture_files):
+            with span('download_item_images', 'download', item_id=self.id, images=len(self.picture_urls)):
+                self._download_missing_images()
 
-        loop = asyncio.get_event_loop()
+        if max_edge and not self.has_masters(max_edge):
+            with span('store_masters', 'images', item_id=self.id):
+                sizes = getattr(self, 'picture_sizes', {})
+                self.picture_sizes = {
+                    image_file: sizes[image_file] if self._fits(sizes, image_file, max_edge)
+                    else self._store_master(image_file, max_edge, originals_dir)
+                    for image_file in self.picture_files
+                }
+
+    def has_masters(self, max_edge: int) -> bool:
+        """
+        :param max_edge: maximum width and height of the masters
+        :return: True if all images are recorded as stored no wider or higher than max_edge pixels
+        """
+        sizes = getattr(self, 'picture_sizes', {})  # items pickled before masters were introduced
+        return all(self._fits(sizes, image_file, max_edge) for image_file in self.picture_files)
+
+    @staticmethod
+    def _fits(sizes: Dict[str, Tuple[int, int]], image_file: str, max_edge: int) -> bool:
+        return image_file in sizes and max(sizes[image_file]) <= max_edge
+
+    def _download_missing_images(self) -> None:
         try:
-            loop.run_until_complete(self._download_images(max_threads=self.MAX_DOWNLOAD_THREADS))
+            self._download_images(max_threads=self.MAX_DOWNLOAD_THREADS)
         except ContentTooShortError as e:
             print('\n{}, retrying...'.format(e))
-            loop.run_until_complete(self._download_images(max_threads=self.MAX_DOWNLOAD_THREADS // 4))
+            self._download_images(max_threads=self.MAX_DOWNLOAD_THREADS // 4)
         except (URLError, RemoteDisconnected):
             pass
 
@@ -83,6 +111,27 @@ class Item:
             self.url_to_file(url) for url in self.picture_urls if is_image_file(self.url_to_file(url))
         ]
 
+    @classmethod
+    def _store_master(cls, image_file: str, max_edge: int, originals_dir: Optional[str]) -> Tuple[int, int]:
+        """
+        Replace image_file by a re-encoded copy no wider or higher than max_edge pixels.
+        :return: (width, height) of the stored master
+        """
+        from PIL import Image
+        with Image.open(image_file) as image:
+            if max(image.size) <= max_edge:
+                return image.size
+            if originals_dir:
+                makedirs(originals_dir, exist_ok=True)
+                copy2(image_file, join(originals_dir, basename(image_file)))
+            master = image.convert('RGB')
+        # Image.Resampling only exists from Pillow 9.1 on
+        master.thumbnail((max_edge, max_edge), getattr(Image, 'Resampling', Image).BICUBIC)
+        master.save(image_file + '.tmp', format='JPEG', quality=cls.MASTER_JPEG_QUALITY)
+        replace(image_file + '.tmp', image_file)
+        image_storage.remove_scaled_copies(image_file)
+        return master.size
+
     def set_tags(self, all_available_tags: Set[str]) -> None:
         """
         Out of all available tags, set those that have a value on this Item.
@@ -118,7 +167,17 @@ class Item:
 
     @classmethod
     def url_to_file(cls, url: str) -> str:
-        return join(cls.download_root, '_'.join(url.split('/')[-4:]))
+        """
+        :param url: URL of a picture of an item
+        :return: path the picture is stored under, in the layout used by the download root
+        """
+        return image_storage.image_path(cls.download_root, image_storage.url_to_file_name(url))
+
+    def relocate_picture_files(self) -> None:
+        """Update the stored picture files after the layout of the download root has changed."""
+        self.picture_files = [
+            image_storage.relocate(image_file, self.download_root) for image_file in self.picture_files
+        ]
 
     @classmethod
     def _show_image(cls, filename: str, show: bool) -> None:
@@ -135,14 +194,22 @@ class Item:
                 except FileNotFoundError:
                     pass
 
-    async def _download_images(self, max_threads: int) -> None:
+    def _download_images(self, max_threads: int) -> None:
+        # a plain thread pool instead of an event loop, so items can be downloaded from any thread
         with concurrent.futures.ThreadPoolExecutor(max_workers=max_threads) as executor:
-            loop = asyncio.get_event_loop()
             futures = [
-                loop.run_in_executor(executor, urlretrieve, url, self.url_to_file(url))
+                executor.submit(self._retrieve, url, self.url_to_file(url))
                 for url in self.picture_urls if not is_image_file(self.url_to_file(url))
             ]
-            await asyncio.gather(*futures)
+            for future in futures:
+                future.result()
+
+    @staticmethod
+    def _retrieve(url: str, image_file: str) -> None:
+        makedirs(dirname(image_file), exist_ok=True)
+        with span('download_image', 'download', url=url, host=urlparse(url).netloc):
+            urlretrieve(url, image_file)
+        image_storage.remove_scaled_copies(image_file)
 
     def __str__(self) -> str:
             return """Id: {}
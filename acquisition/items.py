@@ -2,10 +2,11 @@ from collections import defaultdict
 from datetime import timedelta
 from random import sample, seed, shuffle
 from time import time
-from typing import List, Union, Dict, Sized, Iterable, Set, Iterator, overload
+from typing import List, Union, Dict, Sized, Iterable, Set, Iterator, Optional, overload
 
 from acquisition.item import Item
 from category import Category
+from utils.tracing import span
 from utils.with_verbose import WithVerbose
 
 
@@ -51,11 +52,16 @@ class Items(WithVerbose, Sized, Iterable):
     def categories(self) -> Set[Category]:
         return {i.category for i in self.items}
 
-    def filter(self, category: Category=None) -> 'Items':
+    def filter(self, category: Union[Category, str, None]=None) -> 'Items':
+        """
+        :param category: Category, or name of the category, whose items are kept
+        :return: the items whose category name starts with the name of category
+        """
         if not category:
             raise ValueError()
+        name = category if isinstance(category, str) else category.name
         return Items(
-            [item for item in self.items if item.category.name.lower().startswith(category.name.lower())],
+            [item for item in self.items if item.category.name.lower().startswith(name.lower())],
             self.verbose, self.is_download_complete
         )
 
@@ -79,8 +85,15 @@ class Items(WithVerbose, Sized, Iterable):
         self._print_status(len(self), '->', len(new_items), 'items')
         self.items = new_items
 
-    def download_images(self) -> None:
-        if self.is_download_complete:
+    def download_images(self, max_edge: Optional[int]=None, originals_dir: Optional[str]=None) -> None:
+        """
+        Download the images of all Item objects in this item set, dropping items without any image.
+        Images of an item set downloaded before are converted to masters if max_edge is set.
+        :param max_edge: If set, images are stored as masters no wider or higher than max_edge pixels
+        :param originals_dir: If set, keep the full size originals of downscaled masters in this folder
+        :return: None
+        """
+        if self.is_download_complete and (not max_edge or all(item.has_masters(max_edge) for item in self)):
             return
         start_time = time()
         elapsed_time = 0.
@@ -92,7 +105,7 @@ class Items(WithVerbose, Sized, Iterable):
                     timedelta(seconds=int(elapsed_time * (len(self) - i) / (i + 1)))
                 ), end='\r'
             )
-            item.download_images()
+            item.download_images(max_edge, originals_dir)
         self.items = [item for item in self.items if item.picture_files]
         self.is_download_complete = True
         self._print_status(
@@ -118,9 +131,10 @@ class Items(WithVerbose, Sized, Iterable):
         :return: a dict of the form {tag: number_it_occurs}
         """
         counted_tags = defaultdict(int)  # type: Dict[str, int]
-        for item in self.items:
-            for tag in item.get_possible_tags():
-                counted_tags[tag] += 1
+        with span('count_tags', 'tags', items=len(self.items)):
+            for item in self.items:
+                for tag in item.get_possible_tags():
+                    counted_tags[tag] += 1
         return counted_tags
 
     def set_liked(self, item_id: int) -> None:
@@ -153,8 +167,9 @@ class Items(WithVerbose, Sized, Iterable):
         return Items(items, self.verbose)
 
     def update_tags(self, valid_tags: Dict[str, int]) -> None:
-        for item in self.items:
-            item.set_tags(set(valid_tags.keys()))
+        with span('update_tags', 'tags', items=len(self.items)):
+            for item in self.items:
+                item.set_tags(set(valid_tags.keys()))
 
     def equal_number_of_liked_and_unliked(self, random_seed: int=None) -> 'Items':
         seed(random_seed)
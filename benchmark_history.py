@@ -0,0 +1,86 @@
+import json
+import sys
+from argparse import ArgumentParser, Namespace
+
+from performance.history import BenchmarkHistory, compare, incomplete, render_markdown, sweep_entries
+
+HISTORY_FILE = 'performance_history.jsonl'
+PERFORMANCE_FILE = 'Performance.md'
+TIME_THRESHOLD = 0.1
+ACCURACY_THRESHOLD = 0.02
+
+
+def parse_command_line() -> Namespace:
+    parser = ArgumentParser(
+        description="Record results of run_performance_analysis.py, find regressions and render them"
+    )
+    parser.add_argument(
+        '--history-file', default=HISTORY_FILE, help=f"Benchmark history (default: {HISTORY_FILE})"
+    )
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    record = commands.add_parser('record', help='Add the JSON output of a sweep to the history')
+    record.add_argument('sweep_file', help='JSON output file of run_performance_analysis.py')
+    record.add_argument('--run-id', default=None, help='Name of the sweep (default: time and host)')
+
+    commands.add_parser('list', help='List the sweeps in the history')
+
+    comparison = commands.add_parser(
+        'compare', help='Compare two sweeps; exit with status 1 if there are regressions'
+    )
+    comparison.add_argument(
+        'baseline', nargs='?', help='Sweep compared against (default: previous sweep on the same host)'
+    )
+    comparison.add_argument('current', nargs='?', help='Sweep checked for regressions (default: last)')
+    comparison.add_argument(
+        '--time-threshold', type=float, default=TIME_THRESHOLD,
+        help=f"Relative increase in run time per epoch reported as regression (default: {TIME_THRESHOLD})"
+    )
+    comparison.add_argument(
+        '--accuracy-threshold', type=float, default=ACCURACY_THRESHOLD,
+        help=f"Decrease in test set accuracy reported as regression (default: {ACCURACY_THRESHOLD})"
+    )
+
+    render = commands.add_parser('render', help='Write the latest sweep on every host as Markdown')
+    render.add_argument('--output', default=PERFORMANCE_FILE, help=f"(default: {PERFORMANCE_FILE})")
+    return parser.parse_args()
+
+
+def main(args: Namespace) -> int:
+    history = BenchmarkHistory(args.history_file)
+    if args.command == 'record':
+        with open(args.sweep_file) as file:
+            entries = sweep_entries(json.load(file), args.run_id)
+        history.append(entries)
+        print(f'{len(entries)} results recorded as {entries[0]["run"] if entries else args.run_id}')
+    elif args.command == 'list':
+        for run_id in history.runs():
+            entries = history.run(run_id)
+            print(run_id, entries[0]['commit'], f'{len(entries)} configurations')
+    elif args.command == 'compare':
+        runs = history.runs()
+        current = args.current or (runs[-1] if runs else None)
+        baseline = args.baseline or (history.previous_run(current) if current else None)
+        if not (baseline and current):
+            print('Need two sweeps on the same host to compare', file=sys.stderr)
+            return 2
+        baseline_entries, current_entries = history.run(baseline), history.run(current)
+        regressions = compare(baseline_entries, current_entries, args.time_threshold, args.accuracy_threshold)
+        not_compared = incomplete(baseline_entries, current_entries)
+        print(f'{current} compared to {baseline}: {len(regressions)} regressions')
+        for regression in regressions:
+            print(' ', regression)
+        if not_compared:
+            print(f'{len(not_compared)} configurations not compared')
+            for entry in not_compared:
+                print(' ', entry)
+        return 1 if regressions else 0
+    elif args.command == 'render':
+        with open(args.output, 'w') as file:
+            file.write(render_markdown(history))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(parse_command_line()))
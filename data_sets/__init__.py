@@ -2,3 +2,4 @@ from .image_file_data_sets import ImageFileDataSets
 from .contains_images import crop_bottom, add_border
 from .ebay_data_sets import EbayDataSets
 from .ebay_data_generator import EbayDataGenerator
+from .image_pyramid import ImagePyramid
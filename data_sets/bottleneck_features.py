@@ -0,0 +1,118 @@
+from os.path import basename, isfile, join, splitext
+from typing import Dict, List, Optional
+
+import numpy
+from keras import Model
+
+from data_sets.ebay_data_generator import EbayDataGenerator
+from inference.prediction_cache import file_hash
+from network_types import BACKBONES, backbone
+from utils.with_verbose import WithVerbose
+
+
+class BottleneckFeatures(WithVerbose):
+    """
+    Pooled outputs of a fixed backbone network for the pictures of a data set. Each picture is run
+    through the backbone only once; the features are cached on disk, keyed by backbone, backbone weights
+    and image size, so that only the fully connected layers need to be trained on them.
+    """
+
+    # changed whenever features computed earlier are no longer valid, e.g. since pretrained backbones
+    # normalize their input
+    VERSION = 2
+
+    def __init__(
+            self, image_data: EbayDataGenerator, network_name: str, weights: Optional[str], cache_dir: str,
+            uint8_input: bool=False, verbose: bool=False
+    ) -> None:
+        """
+        :param image_data: data set from which the pictures are read
+        :param network_name: name of the backbone network, one of network_types.BACKBONES
+        :param weights: backbone weights: 'imagenet' or a weights file
+        :param cache_dir: folder in which the features are stored
+        :param uint8_input: If set, the backbone takes uint8 images and normalizes them itself
+        :param verbose: If set, print status/progress information
+        :raises ValueError: if no weights are given. A randomly initialized backbone is not stored, so
+                            cached features could not be reproduced by the backbone of a later run
+        """
+        WithVerbose.__init__(self, verbose)
+        if not weights:
+            raise ValueError('Bottleneck features need pretrained backbone weights')
+        self.image_data = image_data
+        self.network_name = network_name
+        self.weights = weights
+        self.uint8_input = uint8_input
+        self.cache_file = join(
+            cache_dir,
+            'features_v{}_{}_{}_{}x{}{}.npz'.format(
+                self.VERSION, network_name, _weights_key(weights), *image_data.size,
+                '_uint8' if uint8_input else ''
+            )
+        )
+        self._backbone = None  # type: Optional[Model]
+        self._features = self._load()
+
+    @property
+    def num_features(self) -> int:
+        if self._features:
+            return len(next(iter(self._features.values())))
+        return int(self.backbone.output_shape[-1])
+
+    @property
+    def backbone(self) -> Model:
+        if self._backbone is None:
+            self._backbone = backbone(
+                BACKBONES[self.network_name], (*self.image_data.size, self.image_data.DEPTH), self.weights,
+                self.uint8_input
+            )
+        return self._backbone
+
+    def features(self, image_files: List[str]) -> numpy.ndarray:
+        """
+        :param image_files: picture files for which the features are returned
+        :return: float32 array of shape (len(image_files), num_features)
+        """
+        missing = [
+            image_file for image_file in dict.fromkeys(image_files) if image_file not in self._features
+        ]
+        if missing:
+            self._compute(missing)
+            self._save()
+        return numpy.asarray([self._features[image_file] for image_file in image_files], dtype=numpy.float32)
+
+    def _compute(self, image_files: List[str]) -> None:
+        batch_size = self.image_data.batch_size
+        for start in range(0, len(image_files), batch_size):
+            self._print_status(
+                'Computing bottleneck features: {}/{}'.format(start, len(image_files)), end='\r'
+            )
+            batch_files = image_files[start:start + batch_size]
+            images = numpy.asarray(
+                [self.image_data.load_image(image_file) for image_file in batch_files], dtype=numpy.uint8
+            )
+            predictions = self.backbone.predict(images, batch_size=batch_size)
+            for image_file, features in zip(batch_files, predictions):
+                self._features[image_file] = features
+        self._print_status('Computed bottleneck features for {} images'.format(len(image_files)))
+
+    def _load(self) -> Dict[str, numpy.ndarray]:
+        if not isfile(self.cache_file):
+            return {}
+        self._print_status('Loading', self.cache_file)
+        npz = numpy.load(self.cache_file)
+        return dict(zip(npz['files'].tolist(), npz['features']))
+
+    def _save(self) -> None:
+        self._print_status('Saving', self.cache_file)
+        files = list(self._features.keys())
+        numpy.savez(
+            self.cache_file, files=numpy.asarray(files),
+            features=numpy.asarray([self._features[image_file] for image_file in files], dtype=numpy.float32)
+        )
+
+
+def _weights_key(weights: str) -> str:
+    """:return: part of the cache file name identifying the weights, by content for weights files"""
+    if not isfile(weights):
+        return weights
+    return '{}_{}'.format(splitext(basename(weights))[0], file_hash(weights)[:16])
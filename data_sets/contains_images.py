@@ -20,6 +20,10 @@ def add_border(image: Image.Image, w: int, h: int) -> Image.Image:
     return new_image
 
 
+# resize methods by name, as recorded in model bundles
+RESIZE_METHODS = {'add_border': add_border, 'crop_bottom': crop_bottom}
+
+
 class ContainsImages:
 
     DEPTH = 3
@@ -1,12 +1,14 @@
 import random
-from os.path import join
-from typing import Tuple, Set, Generator, List, Dict, Sized, Optional
+from typing import Tuple, Set, Generator, Iterable, List, Dict, Sized, Optional
 
 import numpy
-from PIL import Image
+import tensorflow as tf
 
+from acquisition.image_storage import record_access
 from acquisition.items import Items
-from data_sets.contains_images import add_border, ContainsImages
+from data_sets.contains_images import ContainsImages
+from data_sets.image_archive import ImageArchive
+from data_sets.image_pyramid import load_scaled_image
 from data_sets.labeled_items import LabeledItems
 from utils.with_verbose import WithVerbose
 
@@ -31,6 +33,40 @@ class BatchGenerator(Sized):
         return len(self.batches)
 
 
+class BatchBuffers:
+    """
+    Ring of preallocated image and label arrays the batches are assembled in, so producing a batch
+    allocates no new arrays. A buffer is handed out again after all other buffers were, so a batch
+    stays valid only as long as fewer than num_buffers batches are produced after it.
+    """
+
+    def __init__(
+            self, num_buffers: int, batch_size: int, image_shape: Tuple[int, ...], num_classes: int
+    ) -> None:
+        """
+        :param num_buffers: number of batches which can be in use at the same time
+        :param batch_size: maximum number of images per batch
+        :param image_shape: shape of a single image, (height, width, depth)
+        :param num_classes: length of the one-hot encoded labels
+        """
+        self.images = [
+            numpy.empty((batch_size, *image_shape), dtype=numpy.uint8) for _ in range(num_buffers)
+        ]
+        self.labels = [
+            numpy.empty((batch_size, num_classes), dtype=numpy.float32) for _ in range(num_buffers)
+        ]
+        self._next = 0
+
+    def __len__(self) -> int:
+        return len(self.images)
+
+    def next(self) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """:return: the least recently used image and label buffers"""
+        index = self._next
+        self._next = (index + 1) % len(self)
+        return self.images[index], self.labels[index]
+
+
 class EbayDataGenerator(LabeledItems, WithVerbose, ContainsImages):
     """
     Returns the image data and labels for a data set in batches (of configurable size) instead of
@@ -38,10 +74,16 @@ class EbayDataGenerator(LabeledItems, WithVerbose, ContainsImages):
     """
 
     CACHE_FILE_PREFIX = 'style_scout'
+    # batches prepared in advance while the network is busy with the current batch
+    MAX_QUEUE_SIZE = 4
+    # batch buffers in use outside the queue: the one trained on, the one being assembled and the one
+    # tf.data converts
+    BUFFERS_IN_USE = 3
 
     def __init__(
             self, items: Items, valid_labels: Dict[str, int], size: Tuple[int, int],
-            test_share: float=0.2, batch_size: int=32, random_seed: int=None, verbose: bool=False
+            test_share: float=0.2, batch_size: int=32, random_seed: int=None,
+            image_archive: Optional[ImageArchive]=None, verbose: bool=False
     ) -> None:
         """
         Construct the generator from images and labels belonging to items passed in
@@ -50,6 +92,7 @@ class EbayDataGenerator(LabeledItems, WithVerbose, ContainsImages):
         :param size: tuple(width, height): Size the images are scaled to
         :param batch_size: The size of the batches returned by the generator function
         :param cache_dir: Where to store the precomputed batch data
+        :param image_archive: If set, images contained in this archive are read from it
         :param verbose: If set, print status/progress information
         """
         _check_constructor_arguments_valid(items, size, self.DEPTH)
@@ -58,7 +101,10 @@ class EbayDataGenerator(LabeledItems, WithVerbose, ContainsImages):
         WithVerbose.__init__(self, verbose)
 
         self.batch_size = batch_size
+        self.image_archive = image_archive
         self.num_items = len(items)
+        # images whose access was recorded, which is done once per run for the images actually read
+        self._accessed = set()  # type: Set[str]
         self._setup_batches(test_share, random_seed)
 
     def _setup_batches(self, test_share: float, random_seed: Optional[int]) -> None:
@@ -76,52 +122,113 @@ class EbayDataGenerator(LabeledItems, WithVerbose, ContainsImages):
     def test_length(self) -> int:
         return len(self.test)
 
-    def train_generator(self) -> Generator:
+    def train_generator(self, max_queue_size: int=MAX_QUEUE_SIZE) -> Generator:
         """
-        Generator function returning all images and their labels used as training set
+        Generator function returning all images and their labels used as training set. The batches are
+        assembled in reused buffers, see batch_buffers().
+        :param max_queue_size: number of batches the consumer holds at most besides the current one
         """
         if not self.train_length():
             raise ValueError("Length of training set is 0")
+        buffers = self.batch_buffers(max_queue_size)
         while True:
             for i in range(self.train_length()):
+                images, labels = buffers.next()
                 yield (
-                    self.images_for_batch(self.train.batches, i),
-                    self.labels_for_batch(self.train.batches, i)
+                    self.images_for_batch(self.train.batches, i, images),
+                    self.labels_for_batch(self.train.batches, i, labels)
                 )
             self.train.generate_batches()
 
-    def test_generator(self) -> Generator:
+    def test_generator(self, max_queue_size: int=MAX_QUEUE_SIZE) -> Generator:
         """
-        Generator function returning all images and their labels in the test set
+        Generator function returning all images and their labels in the test set. The batches are
+        assembled in reused buffers, see batch_buffers().
+        :param max_queue_size: number of batches the consumer holds at most besides the current one
         """
+        buffers = self.batch_buffers(max_queue_size)
         while True:
             for i in range(self.test_length()):
+                images, labels = buffers.next()
                 yield (
-                    self.images_for_batch(self.test.batches, i),
-                    self.labels_for_batch(self.test.batches, i)
+                    self.images_for_batch(self.test.batches, i, images),
+                    self.labels_for_batch(self.test.batches, i, labels)
                 )
 
-    def images_for_batch(self, batches: Batches, batch_index: int) -> numpy.ndarray:
+    def batch_buffers(self, max_queue_size: int=MAX_QUEUE_SIZE) -> BatchBuffers:
         """
-        :param batch_index: index of the batch (0 <= batch_index <= len(self)
-        :return: image data for batch number batch_index
+        :param max_queue_size: number of batches the consumer holds at most besides the current one
+        :return: enough buffers that none is overwritten while a consumer queueing up to max_queue_size
+                 batches still uses it
         """
-        return numpy.asarray([
-            self.downscale(Image.open(join(data_point[1])).convert('RGB'), method=add_border)
-            for data_point in batches[batch_index]
-        ])
+        return BatchBuffers(
+            max_queue_size + self.BUFFERS_IN_USE, self.batch_size, (self.size[1], self.size[0], self.DEPTH),
+            self.num_classes
+        )
 
-    def labels_for_batch(self, batches: Batches, batch_index: int) -> numpy.ndarray:
+    def dataset(self, batches: Iterable, max_queue_size: int=MAX_QUEUE_SIZE) -> tf.data.Dataset:
         """
-        :param batch_index: index of the batch (0 <= batch_index <= len(self)
-        :return: labels for batch number batch_index
+        Keras prefetches from plain generators into a queue of unbounded size, while tf.data uses the
+        numpy arrays it is given without copying them, which would let reused batch buffers be
+        overwritten while still queued. This dataset prefetches at most max_queue_size batches.
+        :param batches: (images, labels) batches from train_generator() or test_generator() called with
+                        the same max_queue_size
+        :param max_queue_size: number of batches prepared while the network works on the current one
+        :return: dataset yielding the batches
         """
-        return numpy.asarray(
-            [
-                self._dense_to_one_hot(data_point[0])
-                for data_point in batches[batch_index]
-            ]
+        signature = (
+            tf.TensorSpec((None, self.size[1], self.size[0], self.DEPTH), tf.uint8),
+            tf.TensorSpec((None, self.num_classes), tf.float32)
         )
+        dataset = tf.data.Dataset.from_generator(lambda: batches, output_signature=signature)
+        return dataset.prefetch(max_queue_size)
+
+    def images_for_batch(
+            self, batches: Batches, batch_index: int, out: Optional[numpy.ndarray]=None
+    ) -> numpy.ndarray:
+        """
+        :param batch_index: index of the batch (0 <= batch_index <= len(self)
+        :param out: if set, the images are stored in this array, which must hold at least a full batch
+        :return: uint8 image data for batch number batch_index
+        """
+        batch = batches[batch_index]
+        if out is None:
+            out = numpy.empty((len(batch), self.size[1], self.size[0], self.DEPTH), dtype=numpy.uint8)
+        images = out[:len(batch)]
+        for i, data_point in enumerate(batch):
+            images[i] = self.load_image(data_point[1])
+        return images
+
+    def labels_for_batch(
+            self, batches: Batches, batch_index: int, out: Optional[numpy.ndarray]=None
+    ) -> numpy.ndarray:
+        """
+        :param batch_index: index of the batch (0 <= batch_index <= len(self)
+        :param out: if set, the labels are stored in this array, which must hold at least a full batch
+        :return: one-hot encoded float32 labels for batch number batch_index
+        """
+        batch = batches[batch_index]
+        if out is None:
+            out = numpy.empty((len(batch), self.num_classes), dtype=numpy.float32)
+        labels = out[:len(batch)]
+        labels.fill(0)
+        rows = [i for i, (tags, _) in enumerate(batch) for _ in tags]
+        columns = [self.labels_to_numbers[tag] for tags, _ in batch for tag in tags]
+        labels[rows, columns] = 1
+        return labels
+
+    def load_image(self, image_file: str) -> numpy.ndarray:
+        """
+        :param image_file: picture file of an item
+        :return: image data scaled to the size of this data set
+        """
+        if self.image_archive is not None and image_file in self.image_archive:
+            # images read from the archive are not recorded, to avoid metadata calls on the original
+            return self.image_archive.load_scaled_image(image_file, self.size)
+        if image_file not in self._accessed:
+            self._accessed.add(image_file)
+            record_access([image_file])
+        return load_scaled_image(image_file, self.size)
 
     def _dense_to_one_hot(self, label: Set[str]) -> numpy.ndarray:
         labels_one_hot = numpy.zeros(self.num_classes)
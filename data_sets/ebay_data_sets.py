@@ -2,11 +2,11 @@ import os.path
 from typing import Tuple, Dict, Set
 
 import numpy
-from PIL import Image
 
 from acquisition.items import Items
 from data_sets.image_file_data_sets import ImageFileDataSets
-from data_sets.contains_images import ContainsImages, add_border
+from data_sets.contains_images import ContainsImages
+from data_sets.image_pyramid import load_scaled_image
 from data_sets.data_sets import DataSets
 from data_sets.images_labels_data_set import ImagesLabelsDataSet
 from data_sets.labeled_items import LabeledItems
@@ -18,7 +18,7 @@ class EbayDataSets(ImageFileDataSets, LabeledItems, WithVerbose):
     @classmethod
     def get_data(
             cls, data_file: str, items: Items, valid_labels: Dict[str, int], image_size: int,
-            test_share: float=0.2, verbose: bool=False
+            test_share: float=0.2, keep_uint8: bool=False, verbose: bool=False
     ) -> ImageFileDataSets:
         """
         Read an EbayDataSet from the given file name, if present; else create a new one and save it
@@ -28,16 +28,17 @@ class EbayDataSets(ImageFileDataSets, LabeledItems, WithVerbose):
         :param valid_labels: Labels corresponding to the labels of the data set
         :param image_size: Size the images are scaled to
         :param test_share: fraction of the data used as test data
+        :param keep_uint8: If set, the images are kept as uint8 for models normalizing their input themselves
         :param verbose: If set, print status/progress information
         :return: EbayDataSet read from the file or created from the passed parameters
         """
         data_file = EbayDataSets._npz_file_name(data_file)
         if data_file is not None and os.path.isfile(data_file):
-            data = EbayDataSets._create_from_file(data_file, image_size, items, valid_labels)
+            data = EbayDataSets._create_from_file(data_file, image_size, items, valid_labels, keep_uint8)
         else:
             data = EbayDataSets.extract_and_init(
                 items, valid_labels, (image_size, image_size), 0, test_share=test_share,
-                verbose=verbose
+                keep_uint8=keep_uint8, verbose=verbose
             )
             cls._save_to_file(data, data_file)
         return data
@@ -45,10 +46,12 @@ class EbayDataSets(ImageFileDataSets, LabeledItems, WithVerbose):
     @classmethod
     def extract_and_init(
             cls, items: Items, valid_labels: Dict[str, int], size: Tuple[int, int],
-            validation_share: float=None, test_share: float=0.2, verbose: bool=False
+            validation_share: float=None, test_share: float=0.2, keep_uint8: bool=False,
+            verbose: bool=False
     ) -> 'EbayDataSets':
         all_images, all_labels = cls._extract_images(items, size, verbose)
-        required_ram = all_images.size * (4 + 1) + all_labels.nbytes
+        # the uint8 images, and their float32 copy unless they are kept as they are
+        required_ram = all_images.size * (1 if keep_uint8 else 4 + 1) + all_labels.nbytes
         WithVerbose.print_status(
             verbose,
             'RAM needed for images and labels: {0:.2f}GB'.format(required_ram / 1024 / 1024 / 1024)
@@ -72,7 +75,7 @@ class EbayDataSets(ImageFileDataSets, LabeledItems, WithVerbose):
         return EbayDataSets(
             items, valid_labels, size,
             train_images, train_labels, test_images, test_labels, validation_images, validation_labels,
-            verbose
+            verbose, keep_uint8
         )
 
     def __init__(
@@ -80,7 +83,7 @@ class EbayDataSets(ImageFileDataSets, LabeledItems, WithVerbose):
             train_images: numpy.ndarray, train_labels: numpy.ndarray,
             test_images: numpy.ndarray, test_labels: numpy.ndarray,
             validation_images: numpy.ndarray, validation_labels: numpy.ndarray,
-            verbose: bool
+            verbose: bool, keep_uint8: bool=False
     ) -> None:
         """
         Construct the data set from images belonging to items passed in
@@ -94,6 +97,7 @@ class EbayDataSets(ImageFileDataSets, LabeledItems, WithVerbose):
         :param validation_images: Image data to be used as features for the validation set
         :param validation_labels: Labels to be used as labels for the validation set
         :param verbose: If set, print status/progress information
+        :param keep_uint8: If set, the images are kept as uint8 instead of being normalized to floats
         """
         _check_constructor_arguments_valid(
             size, self.DEPTH,
@@ -107,9 +111,9 @@ class EbayDataSets(ImageFileDataSets, LabeledItems, WithVerbose):
 
         DataSets.__init__(
             self,
-            ImagesLabelsDataSet(train_images, train_labels, self.DEPTH),
-            ImagesLabelsDataSet(validation_images, validation_labels, self.DEPTH),
-            ImagesLabelsDataSet(test_images, test_labels, self.DEPTH)
+            ImagesLabelsDataSet(train_images, train_labels, self.DEPTH, keep_uint8=keep_uint8),
+            ImagesLabelsDataSet(validation_images, validation_labels, self.DEPTH, keep_uint8=keep_uint8),
+            ImagesLabelsDataSet(test_images, test_labels, self.DEPTH, keep_uint8=keep_uint8)
         )
 
     @classmethod
@@ -125,10 +129,9 @@ class EbayDataSets(ImageFileDataSets, LabeledItems, WithVerbose):
             item.download_images()
             for image_file in item.picture_files:
                 try:
-                    image = Image.open(os.path.join(image_file)).convert('RGB')
+                    images.append(load_scaled_image(image_file, size))
                 except OSError:
                     continue
-                images.append(numpy.asarray(ContainsImages.scale_image(image, size, method=add_border)))
                 labels.append(tuple(item.tags))
 
         WithVerbose.print_status(verbose)
@@ -157,12 +160,14 @@ class EbayDataSets(ImageFileDataSets, LabeledItems, WithVerbose):
     @classmethod
     def _create_from_file(
             cls, data_file: str, image_size: int, items: Items, valid_labels: Dict[str, int],
-            verbose: bool=False
+            keep_uint8: bool=False, verbose: bool=False
     ) -> 'EbayDataSets':
         WithVerbose.print_status(verbose, 'Loading ' + data_file)
         npz = numpy.load(data_file)
+        if keep_uint8 and npz['train_images'].dtype != numpy.uint8:
+            raise ValueError('{} contains normalized images, not uint8 images'.format(data_file))
         return cls(
-            items, valid_labels, (image_size, image_size), verbose=verbose,
+            items, valid_labels, (image_size, image_size), verbose=verbose, keep_uint8=keep_uint8,
             train_images=npz['train_images'], train_labels=npz['train_labels'],
             test_images=npz['test_images'], test_labels=npz['test_labels'],
             validation_images=npz['validation_images'], validation_labels=npz['validation_labels']
@@ -0,0 +1,197 @@
+"""
+Packed archive of encoded images for sequential reading.
+
+Many images are concatenated into a few large shard files, <base>.00000.pack, <base>.00001.pack, ...
+The index <base>.index.json maps every image file name, without folder, to the shard, offset and length
+of its encoded bytes, so the archive stays valid when the images are moved to another folder layout.
+Shards are memory-mapped when read, so accessing an image costs no file open and no copy of the encoded
+data.
+"""
+
+import json
+from io import BufferedReader, BytesIO, RawIOBase
+from mmap import mmap, ACCESS_READ
+from os import replace
+from os.path import basename, dirname, isfile, join
+from typing import Dict, List, Optional, Tuple, Any
+
+import numpy
+from PIL import Image
+
+from acquisition.items import Items
+from data_sets.contains_images import ContainsImages, add_border
+from data_sets.image_pyramid import load_scaled_image
+from utils.with_verbose import WithVerbose
+
+Size = Tuple[int, int]
+
+DEFAULT_SHARD_SIZE = 1024 * 1024 * 1024
+INDEX_VERSION = 2
+
+
+def index_file(base: str) -> str:
+    return base + '.index.json'
+
+
+def shard_file(base: str, shard: int) -> str:
+    return '{}.{:05d}.pack'.format(base, shard)
+
+
+class ImageArchiveWriter(WithVerbose):
+    """Packs the images of an item set into an image archive."""
+
+    def __init__(
+            self, base: str, size: Optional[Size]=None, shard_size: int=DEFAULT_SHARD_SIZE,
+            verbose: bool=False
+    ) -> None:
+        """
+        :param base: path of the archive files without extension
+        :param size: If set, store the images scaled to this size instead of the original files
+        :param shard_size: size in bytes after which a new shard file is started
+        :param verbose: If set, print status/progress information
+        """
+        WithVerbose.__init__(self, verbose)
+        self.base = base
+        self.size = size
+        self.shard_size = shard_size
+
+    def build(self, items: Items) -> int:
+        """
+        Write the archive containing all images of the given items.
+        :param items: Items whose images are packed
+        :return: number of images in the archive
+        """
+        items.download_images()
+        image_files = sorted({image_file for item in items for image_file in item.picture_files})
+        entries = {}  # type: Dict[str, Tuple[int, int, int]]
+        shards = []  # type: List[str]
+        shard, offset = None, 0
+        try:
+            for i, image_file in enumerate(image_files):
+                self._print_status('Packing images: {}/{}'.format(i + 1, len(image_files)), end='\r')
+                try:
+                    data = self._encoded_image(image_file)
+                except OSError:
+                    continue
+                if shard is None or (offset and offset + len(data) > self.shard_size):
+                    if shard is not None:
+                        shard.close()
+                    shards.append(basename(shard_file(self.base, len(shards))))
+                    shard, offset = open(join(dirname(self.base), shards[-1]), 'wb'), 0
+                shard.write(data)
+                entries[basename(image_file)] = (len(shards) - 1, offset, len(data))
+                offset += len(data)
+        finally:
+            if shard is not None:
+                shard.close()
+        self._write_index(shards, entries)
+        self._print_status('\n{} images packed into {} shards'.format(len(entries), len(shards)))
+        return len(entries)
+
+    def _encoded_image(self, image_file: str) -> bytes:
+        if self.size is None:
+            with open(image_file, 'rb') as file:
+                return file.read()
+        buffer = BytesIO()
+        Image.fromarray(load_scaled_image(image_file, self.size)).save(buffer, format='PNG')
+        return buffer.getvalue()
+
+    def _write_index(self, shards: List[str], entries: Dict[str, Tuple[int, int, int]]) -> None:
+        with open(index_file(self.base) + '.tmp', 'w') as file:
+            json.dump(
+                {'version': INDEX_VERSION, 'size': self.size, 'shards': shards, 'images': entries}, file
+            )
+        replace(index_file(self.base) + '.tmp', index_file(self.base))
+
+
+class ImageArchive:
+    """Read access to the images in an image archive."""
+
+    def __init__(self, base: str) -> None:
+        """
+        :param base: path of the archive files without extension
+        """
+        with open(index_file(base)) as file:
+            index = json.load(file)
+        if index['version'] != INDEX_VERSION:
+            raise ValueError('Unsupported image archive version {}'.format(index['version']))
+        self.base = base
+        self.size = tuple(index['size']) if index['size'] else None  # type: Optional[Tuple[int, ...]]
+        self._shard_files = [join(dirname(base), shard) for shard in index['shards']]
+        self._shards = [None] * len(self._shard_files)  # type: List[Optional[mmap]]
+        self._entries = index['images']  # type: Dict[str, List[int]]
+
+    @classmethod
+    def exists(cls, base: str) -> bool:
+        return isfile(index_file(base))
+
+    def __contains__(self, image_file: Any) -> bool:
+        return basename(image_file) in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def encoded(self, image_file: str) -> memoryview:
+        """
+        :param image_file: file name of the image as stored in the item it belongs to
+        :return: the encoded image data, without copying it out of the shard
+        """
+        shard, offset, length = self._entries[basename(image_file)]
+        return memoryview(self._shard(shard))[offset:offset + length]
+
+    def open_image(self, image_file: str) -> Image.Image:
+        return Image.open(BufferedReader(_BufferReader(self.encoded(image_file))))
+
+    def load_scaled_image(self, image_file: str, size: Size) -> numpy.ndarray:
+        """
+        :param image_file: file name of the image as stored in the item it belongs to
+        :param size: tuple(width, height) the image is scaled to
+        :return: uint8 array of shape (height, width, 3)
+        """
+        image = self.open_image(image_file).convert('RGB')
+        if image.size == size:
+            return numpy.asarray(image)
+        return ContainsImages.scale_image(image, size, method=add_border)
+
+    def close(self) -> None:
+        for shard in self._shards:
+            if shard is not None:
+                shard.close()
+        self._shards = [None] * len(self._shard_files)
+
+    def _shard(self, shard: int) -> mmap:
+        mapped = self._shards[shard]
+        if mapped is None:
+            with open(self._shard_files[shard], 'rb') as file:
+                mapped = mmap(file.fileno(), 0, access=ACCESS_READ)
+            self._shards[shard] = mapped
+        return mapped
+
+
+class _BufferReader(RawIOBase):
+    """Read-only file object on a memoryview which copies only the chunks actually read."""
+
+    def __init__(self, buffer: memoryview) -> None:
+        super().__init__()
+        self._buffer = buffer
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, target: Any) -> int:
+        length = max(0, min(len(target), len(self._buffer) - self._position))
+        target[:length] = self._buffer[self._position:self._position + length]
+        self._position += length
+        return length
+
+    def seek(self, offset: int, whence: int=0) -> int:
+        start = (0, self._position, len(self._buffer))[whence]
+        self._position = max(0, start + offset)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
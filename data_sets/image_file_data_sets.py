@@ -6,6 +6,7 @@ import numpy
 
 from data_sets.data_sets import DataSets
 from data_sets.images_labels_data_set import ImagesLabelsDataSet
+from data_sets.labeled_items import top_k
 from data_sets.contains_images import ContainsImages
 from utils.with_verbose import WithVerbose
 
@@ -133,6 +134,10 @@ def _dense_to_one_hot(labels_dense: numpy.ndarray) -> Tuple[numpy.ndarray, Dict[
 
 
 def nth_index_and_value(l: List, n: int) -> Tuple[int, Any]:
-    v = sorted(l)[-n]
-    i = list(l).index(v)
-    return i, v
+    """
+    :param l: list of values
+    :param n: place of the value, 1 for the largest
+    :return: index and value of the n-th largest value; equal values are placed in order of their index
+    """
+    indices, values = top_k(numpy.asarray(l)[numpy.newaxis], n)
+    return int(indices[0, n - 1]), values[0, n - 1].item()
@@ -0,0 +1,182 @@
+"""
+Scaled copies of the item images for several image sizes, computed in a single decoding pass.
+
+The names of the images with a scaled copy of a size are listed in a manifest file in the download root,
+so reading an image does not need to check whether its scaled copy exists. Scaled copies are removed
+when their original is replaced, and rebuilt if they are older than their original.
+"""
+
+from collections import defaultdict
+from functools import partial
+from multiprocessing import Pool
+from os import makedirs, replace, stat
+from os.path import basename, dirname, isfile, join
+from typing import Dict, List, Set, Tuple, Iterable, Optional
+
+import numpy
+from PIL import Image
+
+from acquisition import image_storage
+from acquisition.items import Items
+from data_sets.contains_images import ContainsImages, add_border
+from utils.with_verbose import WithVerbose
+
+Size = Tuple[int, int]
+
+MANIFEST_FILE = '.scaled_{}x{}'
+
+_manifests = {}  # type: Dict[Tuple[str, Size], Set[str]]
+
+
+def scaled_image_file(image_file: str, size: Size) -> str:
+    """
+    :param image_file: original image file
+    :param size: tuple(width, height) the image is scaled to
+    :return: File name under which the copy of image_file scaled to size is stored
+    """
+    return join(dirname(image_file), '{}x{}'.format(*size), basename(image_file) + '.png')
+
+
+def manifest_file(root: str, size: Size) -> str:
+    """
+    :param root: download root folder
+    :param size: tuple(width, height) of the scaled copies
+    :return: File listing the names of the images under root with a scaled copy of the given size
+    """
+    return join(root, MANIFEST_FILE.format(*size))
+
+
+def precomputed(root: str, size: Size) -> Set[str]:
+    """
+    :param root: download root folder
+    :param size: tuple(width, height) of the scaled copies
+    :return: names of the images under root for which ImagePyramid.build() stored a scaled copy
+    """
+    if (root, size) not in _manifests:
+        _manifests[root, size] = _read_manifest(manifest_file(root, size))
+    return _manifests[root, size]
+
+
+def clear_manifest_cache() -> None:
+    _manifests.clear()
+
+
+def load_scaled_image(image_file: str, size: Size) -> numpy.ndarray:
+    """
+    Read an image scaled to the given size, using the precomputed copy if there is one.
+    :param image_file: original image file
+    :param size: tuple(width, height) the image is scaled to
+    :return: uint8 array of shape (height, width, 3)
+    :raises OSError: if the image can not be read
+    """
+    if basename(image_file) in precomputed(image_storage.root_of(image_file), size):
+        try:
+            return numpy.asarray(Image.open(scaled_image_file(image_file, size)).convert('RGB'))
+        except FileNotFoundError:
+            pass  # the original was replaced since the manifest was written
+    return ContainsImages.scale_image(Image.open(image_file).convert('RGB'), size, method=add_border)
+
+
+def scale_to_sizes(image_file: str, sizes: Iterable[Size]) -> Optional[int]:
+    """
+    Decode image_file once and store a scaled copy for every size not already present, or older than
+    image_file.
+    :param image_file: original image file
+    :param sizes: tuples(width, height) the image is scaled to
+    :return: number of scaled copies written, None if image_file can not be read
+    """
+    try:
+        modified = stat(image_file).st_mtime_ns
+    except OSError:
+        return None
+    missing = [size for size in sizes if _modified(scaled_image_file(image_file, size)) < modified]
+    if not missing:
+        return 0
+    try:
+        image = Image.open(image_file).convert('RGB')
+    except OSError:
+        return None
+    for size in missing:
+        scaled_file = scaled_image_file(image_file, size)
+        makedirs(dirname(scaled_file), exist_ok=True)
+        # write to a temporary file first so concurrent readers never see a partial image
+        Image.fromarray(ContainsImages.scale_image(image, size, method=add_border)).save(
+            scaled_file + '.tmp', format='PNG'
+        )
+        replace(scaled_file + '.tmp', scaled_file)
+    return len(missing)
+
+
+class ImagePyramid(WithVerbose):
+    """
+    Precomputes the scaled images for all image sizes used in training. Every original is decoded only
+    once, and the work is distributed over several processes. Scaled copies are stored losslessly, so
+    EbayDataGenerator and EbayDataSets get the same pixels as if they had scaled the images themselves.
+    Only scaled copies listed in the manifest files written by build() are used.
+    """
+
+    def __init__(self, sizes: Iterable[Size], processes: Optional[int]=None, verbose: bool=False) -> None:
+        """
+        :param sizes: tuples(width, height) the images are scaled to
+        :param processes: number of worker processes (default: number of CPUs)
+        :param verbose: If set, print status/progress information
+        """
+        WithVerbose.__init__(self, verbose)
+        self.sizes = tuple(sizes)
+        self.processes = processes
+
+    def build(self, items: Items) -> int:
+        """
+        Compute the scaled copies of all images of the given items that are not present yet.
+        :param items: Items whose images are scaled
+        :return: number of scaled copies written
+        """
+        items.download_images()
+        image_files = self._image_files(items)
+        written = 0
+        scaled = []  # type: List[str]
+        with Pool(self.processes) as pool:
+            results = pool.imap(partial(scale_to_sizes, sizes=self.sizes), image_files, chunksize=16)
+            for i, (image_file, num_written) in enumerate(zip(image_files, results)):
+                if num_written is not None:
+                    written += num_written
+                    scaled.append(image_file)
+                self._print_status('Scaling images: {}/{}'.format(i + 1, len(image_files)), end='\r')
+        self._write_manifests(scaled)
+        self._print_status(
+            '\n{} scaled images written for sizes {}'.format(
+                written, ', '.join('{}x{}'.format(*size) for size in self.sizes)
+            )
+        )
+        return written
+
+    def _write_manifests(self, image_files: List[str]) -> None:
+        names_by_root = defaultdict(set)  # type: Dict[str, Set[str]]
+        for image_file in image_files:
+            names_by_root[image_storage.root_of(image_file)].add(basename(image_file))
+        for root, names in names_by_root.items():
+            for size in self.sizes:
+                file_name = manifest_file(root, size)
+                # write to a temporary file first so concurrent readers never see a partial manifest
+                with open(file_name + '.tmp', 'w') as file:
+                    file.writelines(name + '\n' for name in sorted(_read_manifest(file_name) | names))
+                replace(file_name + '.tmp', file_name)
+        clear_manifest_cache()
+
+    @staticmethod
+    def _image_files(items: Items) -> List[str]:
+        return sorted({image_file for item in items for image_file in item.picture_files})
+
+
+def _read_manifest(file_name: str) -> Set[str]:
+    if not isfile(file_name):
+        return set()
+    with open(file_name) as file:
+        return {line.rstrip('\n') for line in file if line.strip()}
+
+
+def _modified(file_name: str) -> int:
+    try:
+        return stat(file_name).st_mtime_ns
+    except FileNotFoundError:
+        return -1
@@ -10,13 +10,16 @@ __author__ = 'Lene Preuss <lene.preuss@gmail.com>'
 class ImagesLabelsDataSet(DataSetBase, Sized):
 
     def __init__(
-            self, images: numpy.ndarray, labels: numpy.ndarray, depth: int=1, reshape: bool=False
+            self, images: numpy.ndarray, labels: numpy.ndarray, depth: int=1, reshape: bool=False,
+            keep_uint8: bool=False
     ) -> None:
         """Construct a DataSet.
 
         Args:
           images: 4D numpy.ndarray of shape (num images, image height, image width, image depth)
           labels: 1D numpy.ndarray of shape (num images)
+          keep_uint8: keep uint8 images as they are, for models normalizing their input themselves,
+                      instead of converting them to float32 between 0. and 1.
         """
 
         super().__init__(images, labels)
@@ -24,7 +27,8 @@ class ImagesLabelsDataSet(DataSetBase, Sized):
         # Convert shape from [num examples, rows, columns, depth] to [num examples, rows*columns]
         if reshape:
             images = images.reshape(images.shape[0], depth * images.shape[1] * images.shape[2])
-        images = normalize(images)
+        if not keep_uint8:
+            images = normalize(images)
         self._input = images
 
     def __len__(self) -> int:
@@ -1,6 +1,5 @@
 from collections import OrderedDict
-from operator import itemgetter
-from typing import Dict, Set, List
+from typing import Dict, Optional, Sequence, Set, List, Tuple
 
 import numpy
 
@@ -42,15 +41,69 @@ class LabeledItems:
         :param predictions: List of probabilities for each possible label
         :return: Dict with human-readable label as key and its probability as value, sorted by probability
         """
-        pairs = sorted(
-            [(label, probability) for label, probability in self.labels(predictions).items()],
-            key=itemgetter(1), reverse=True
-        )
-        return OrderedDict(pairs)
+        return OrderedDict(self.top_labels(numpy.asarray(predictions)[numpy.newaxis])[0])
+
+    def top_labels(
+            self, predictions: numpy.ndarray, k: Optional[int]=None, threshold: float=0.
+    ) -> List[List[Tuple[str, float]]]:
+        """
+        Decode a whole batch of predictions at once, see top_labels()
+        :param predictions: probabilities of the labels, one row per prediction
+        :param k: number of labels returned per prediction at most (default: all)
+        :param threshold: only labels with a higher probability are returned
+        :return: for every prediction, the most probable labels and their probability, most probable first
+        """
+        return top_labels(predictions, self.valid_labels, k, threshold)
 
     def _dense_to_one_hot(self, labels: Set[str]) -> numpy.ndarray:
         raise NotImplementedError()
 
 
+def top_k(predictions: numpy.ndarray, k: int) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    Find the k largest values in every row in linear time, sorting only those k values.
+    :param predictions: array of shape (rows, classes)
+    :param k: number of values per row
+    :return: indices and values of the k largest values of every row, largest first; of equal values,
+             the one with the lower index comes first; NaN counts as smaller than any other value
+    """
+    predictions = numpy.asarray(predictions)
+    k = min(k, predictions.shape[1])
+    if not k:
+        return numpy.zeros((len(predictions), 0), dtype=numpy.int64), predictions[:, :0]
+    # NaN compares unequal to everything, so no value would be selected in place of a NaN k-th largest
+    ranked = numpy.where(numpy.isnan(predictions), -numpy.inf, predictions)
+    kth_largest = -numpy.partition(-ranked, k - 1, axis=1)[:, k - 1:k]
+    larger = ranked > kth_largest
+    equal = ranked == kth_largest
+    # of the values equal to the k-th largest, take as many as are missing, with the lowest indices
+    missing = k - larger.sum(axis=1, keepdims=True)
+    selected = larger | (equal & (numpy.cumsum(equal, axis=1) <= missing))
+    indices = numpy.nonzero(selected)[1].reshape(len(predictions), k)
+    order = numpy.argsort(-numpy.take_along_axis(ranked, indices, axis=1), axis=1, kind='stable')
+    indices = numpy.take_along_axis(indices, order, axis=1)
+    return indices, numpy.take_along_axis(predictions, indices, axis=1)
+
+
+def top_labels(
+        predictions: numpy.ndarray, labels: Sequence[str], k: Optional[int]=None, threshold: float=0.
+) -> List[List[Tuple[str, float]]]:
+    """
+    :param predictions: probabilities of the labels, one row per prediction
+    :param labels: label of every column of predictions
+    :param k: number of labels returned per prediction at most (default: all)
+    :param threshold: only labels with a higher probability are returned
+    :return: for every prediction, the most probable labels and their probability, most probable first
+    """
+    indices, probabilities = top_k(predictions, k or len(labels))
+    # the values are sorted, so the ones above the threshold are a prefix of every row
+    counts = (probabilities > threshold).sum(axis=1)
+    names = numpy.array(list(labels), dtype=object)[indices]
+    return [
+        list(zip(names[row, :count].tolist(), probabilities[row, :count].tolist()))
+        for row, count in enumerate(counts)
+    ]
+
+
 def _check_constructor_arguments(items: Items, valid_labels: Dict[str, int]) -> None:
     assert isinstance(items, Items)
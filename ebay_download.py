@@ -1,12 +1,17 @@
+import atexit
 import json
 from argparse import ArgumentParser, Namespace
 from operator import itemgetter
 from typing import List, Dict
 
+from acquisition import image_storage
 from acquisition.ebay_downloader_io import EbayDownloaderIO
+from acquisition.image_cache import ImageCache
+from acquisition.item import Item
 from acquisition.items import Items
 from acquisition.ebay_shopping_api import EbayShoppingAPI
 from category import Category
+from utils import tracing
 
 MIN_TAG_NUM = 10
 SAVE_FOLDER = 'data'
@@ -55,12 +60,35 @@ def parse_command_line() -> Namespace:
     parser.add_argument(
         '--download-images', action='store_true', help="Download images"
     )
+    parser.add_argument(
+        '--max-image-size', type=int, default=None,
+        help="Downscale downloaded images so that neither width nor height exceed this size, "
+             "including the images of items downloaded before"
+    )
+    parser.add_argument(
+        '--originals-folder', default=None,
+        help="Folder in which the full size originals of downscaled images are kept (default: discard)"
+    )
     parser.add_argument(
         '--complete-tags-only', action='store_true', help="Filter out incomplete tags"
     )
     parser.add_argument(
         '--clean-image-files', help="remove all image files under this folder which do not belong to an item"
     )
+    parser.add_argument(
+        '--image-cache-size', type=float, default=None,
+        help="Disk space in GB the downloaded images may use; least recently used images of items that "
+             "are not liked are removed when it is exceeded"
+    )
+    parser.add_argument(
+        '--shard-image-files',
+        help="move all image files in this folder into hashed subdirectories and update the items"
+    )
+    parser.add_argument(
+        '--trace-file', default=None,
+        help="Record API calls, image downloads, tag processing and saving, and write them to this file as "
+             "Chrome trace events (view in chrome://tracing or https://ui.perfetto.dev)"
+    )
 
     return parser.parse_args()
 
@@ -91,7 +119,8 @@ def download_item_page(items: Items, categories: List[Category], io: EbayDownloa
     if args.verbose:
         print('\nPage {}, {} distinct items'.format(page, len(items)))
     try:
-        update_items(items, categories, page, args.items_per_page)
+        with tracing.span('update_items', 'api', page=page):
+            update_items(items, categories, page, args.items_per_page)
     finally:
         valid_tags = items.get_valid_tags(args.min_valid_tag)
         if args.verbose:
@@ -102,20 +131,21 @@ def download_item_page(items: Items, categories: List[Category], io: EbayDownloa
 
 
 def delete_images_not_in_items(items: Items, image_base_dir: str) -> None:
-    from os import listdir, remove
-    from os.path import isfile, join
-    items.download_images()
-    images_to_keep = {image_file for i in items for image_file in i.picture_files}
-    all_images = {join(image_base_dir, f) for f in listdir(image_base_dir) if isfile(join(image_base_dir, f))}
-    images_to_delete = all_images - images_to_keep
-    for i, file in enumerate(images_to_delete):
-        print(i, '/', len(images_to_delete), end='\r')
-        remove(file)
-    print()
+    ImageCache(image_base_dir, 0, verbose=True).remove_unreferenced(items)
+
+
+def shard_image_files(items: Items, image_base_dir: str) -> None:
+    image_storage.migrate_to_sharded(image_base_dir, verbose=args.verbose)
+    Item.download_root = image_base_dir
+    for item in items:
+        item.relocate_picture_files()
 
 
 if __name__ == '__main__':
     args = parse_command_line()
+    if args.trace_file:
+        # also saves the trace if the download is interrupted or ends early
+        atexit.register(tracing.start_tracing().save, args.trace_file)
 
     with open(args.ebay_auth_file) as file:
         auth = json.load(file)
@@ -133,6 +163,11 @@ if __name__ == '__main__':
         delete_images_not_in_items(items, args.clean_image_files)
         exit(0)
 
+    if args.shard_image_files:
+        shard_image_files(items, args.shard_image_files)
+        io.save_items(items)
+        exit(0)
+
     for page in range(args.page_from, args.page_to + 1):
         valid_tags = download_item_page(items, categories, io)
 
@@ -140,6 +175,9 @@ if __name__ == '__main__':
         items = items.filter_items_without_complete_tags()
 
     if args.download_images:
-        items.download_images()
+        items.download_images(args.max_image_size, args.originals_folder)
+
+    if args.image_cache_size is not None:
+        ImageCache(Item.download_root, int(args.image_cache_size * 1024 ** 3), args.verbose).evict(items)
 
     io.save_items(items)
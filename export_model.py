@@ -0,0 +1,130 @@
+import random
+from argparse import ArgumentParser, Namespace
+from os.path import getsize, isfile
+from typing import Dict, List, Optional, Tuple
+
+import numpy
+
+from acquisition.ebay_downloader_io import EbayDownloaderIO
+from acquisition.items import Items
+from inference.export import QUANTIZATIONS, TFLiteModel, compare_models, export_tflite
+from predict import Predictor, add_model_arguments
+
+OUTPUT_FILE = 'model.tflite'
+CALIBRATION_IMAGES = 100
+BATCH_SIZE = 32
+
+
+def parse_command_line() -> Namespace:
+    parser = ArgumentParser(
+        description="Export a trained network to TensorFlow Lite for fast inference on the CPU"
+    )
+    add_model_arguments(parser)
+    parser.add_argument(
+        '--item-file', '-i', required=True,
+        help="Pickle file of items, the pictures of which are used to calibrate and evaluate the exported "
+             "model"
+    )
+    parser.add_argument(
+        '--output-file', '-o', default=OUTPUT_FILE,
+        help=f"File the exported model is written to (default: {OUTPUT_FILE})"
+    )
+    parser.add_argument(
+        '--quantize', default='none', choices=QUANTIZATIONS,
+        help="'dynamic' stores the weights as 8 bit integers, 'int8' also computes with 8 bit integers, "
+             "calibrated on pictures from the item file (default: none)"
+    )
+    parser.add_argument(
+        '--calibration-images', type=int, default=CALIBRATION_IMAGES,
+        help=f"Number of pictures used to calibrate, and as many to compare the models "
+             f"(default: {CALIBRATION_IMAGES})"
+    )
+    parser.add_argument(
+        '--batch-size', '-b', type=int, default=BATCH_SIZE,
+        help=f"Images predicted at once when comparing the models (default: {BATCH_SIZE})"
+    )
+    parser.add_argument(
+        '--num-threads', type=int, default=None,
+        help="Threads used by the exported model (default: TensorFlow decides)"
+    )
+    return parser.parse_args()
+
+
+def sample_images(predictor: Predictor, pictures: List[str], number: int) -> Tuple[numpy.ndarray, List[str]]:
+    """
+    :param predictor: Predictor decoding the pictures
+    :param pictures: picture files to choose from
+    :param number: number of images to return at most
+    :return: randomly chosen readable pictures, decoded as model input, and their files
+    """
+    images, files = [], []
+    for picture in random.Random(0).sample(pictures, len(pictures)):
+        try:
+            images.append(predictor.decode_image(picture))
+        except OSError:
+            continue
+        files.append(picture)
+        if len(images) == number:
+            break
+    return numpy.asarray(images, dtype=numpy.float32), files
+
+
+def picture_labels(items: Items, labels: List[str]) -> Dict[str, int]:
+    """
+    :param items: items the pictures belong to
+    :param labels: labels in the order of the outputs of the network
+    :return: for every picture the output index of the tag of its item, -1 if the item has none or
+             several of the labels
+    """
+    numbers = {label: i for i, label in enumerate(labels)}
+    result = {}  # type: Dict[str, int]
+    for item in items:
+        known = [numbers[tag] for tag in item.tags if tag in numbers]
+        for picture in item.picture_files:
+            result[picture] = known[0] if len(known) == 1 else -1
+    return result
+
+
+def print_accuracies(report: Dict[str, Optional[float]]) -> None:
+    reference, candidate = report['reference_accuracy'], report['candidate_accuracy']
+    if reference is None or candidate is None:
+        print('  accuracy unknown: needs the labels from --model-bundle and pictures tagged with one of them')
+        return
+    print(f'  Keras accuracy:               {reference:.1%}')
+    print(f'  TFLite accuracy:              {candidate:.1%}, difference {candidate - reference:+.1%}')
+
+
+if __name__ == '__main__':
+    args = parse_command_line()
+    if args.tflite_model:
+        raise ValueError('--tflite-model cannot be exported again, pass --type and --weights-file')
+    items = EbayDownloaderIO(args.save_folder, items_file=args.item_file, verbose=args.verbose).load_items()
+    predictor = Predictor(args)
+    images, files = sample_images(
+        predictor, [picture for item in items for picture in item.picture_files], 2 * args.calibration_images
+    )
+    if not len(images):
+        raise ValueError('No readable pictures in {}'.format(args.item_file))
+    # calibrate and compare on different pictures, so the comparison is not flattered by the calibration
+    half = len(images) // 2
+    calibration_images, test_images = (images[:half], images[half:]) if half else (images, images)
+    test_files = files[half:] if half else files
+    test_labels = None  # type: Optional[numpy.ndarray]
+    if predictor.labels:
+        numbers = picture_labels(items, predictor.labels)
+        test_labels = numpy.asarray([numbers[picture] for picture in test_files])
+    size = export_tflite(predictor.model, args.output_file, args.quantize, calibration_images)
+    exported = TFLiteModel(args.output_file, args.num_threads)
+    report = compare_models(
+        predictor.model.predict_on_batch, exported.predict_on_batch, test_images, args.batch_size, test_labels
+    )
+    print(f'Exported {args.output_file}: {size / 1e6:.1f} MB', end='')
+    if predictor.io.weights_file() and isfile(predictor.io.weights_file()):
+        print(f', original weights {getsize(predictor.io.weights_file()) / 1e6:.1f} MB', end='')
+    print()
+    print(f'Compared on {len(test_images)} pictures:')
+    print(f'  same class predicted:         {report["agreement"]:.1%}')
+    print(f'  largest probability change:   {report["max_difference"]:.4f}')
+    print_accuracies(report)
+    print(f'  Keras:  {report["reference_seconds"]:.3f} s')
+    print(f'  TFLite: {report["candidate_seconds"]:.3f} s, speedup {report["speedup"]:.2f}x')
@@ -0,0 +1,275 @@
+import csv
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from os import cpu_count
+from os.path import isfile
+from time import time
+from typing import Callable, Deque, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+import numpy
+
+from acquisition.item import Item
+from data_sets.labeled_items import top_k
+from inference.prediction_cache import PredictionCache, file_hash
+from utils.with_verbose import WithVerbose
+
+Decoded = Tuple[int, str, Optional[numpy.ndarray], Optional[numpy.ndarray]]
+Prediction = Tuple[int, Optional[numpy.ndarray]]
+
+
+class BulkScorer(WithVerbose):
+    """
+    Scores all items of a collection: their pictures are decoded in parallel, predicted in batches of
+    fixed size and the predictions are averaged per item. Scores are appended to a CSV file as soon as
+    all pictures of an item are predicted, so an interrupted run continues where it stopped.
+    """
+
+    ID_COLUMN = 'id'
+    PICTURES_COLUMN = 'pictures'
+
+    def __init__(
+            self, predict: Callable[[numpy.ndarray], numpy.ndarray], decode: Callable[[str], numpy.ndarray],
+            batch_size: int=64, decode_workers: Optional[int]=None, labels: Optional[Sequence[str]]=None,
+            cache: Optional[PredictionCache]=None, top_k: Optional[int]=None, verbose: bool=False
+    ) -> None:
+        """
+        :param predict: function computing the predictions for a batch of images
+        :param decode: function reading an image file into the model input
+        :param batch_size: number of images predicted at once; the last batch is padded to this size
+        :param decode_workers: number of threads decoding images (default: number of CPUs)
+        :param labels: names of the classes the model predicts, used as column names
+        :param cache: if set, pictures predicted before are taken from this cache instead of the model
+        :param top_k: if set, write only the top_k most probable labels of every item and their
+                      probabilities instead of the probabilities of all labels
+        :param verbose: If set, print progress information
+        """
+        WithVerbose.__init__(self, verbose)
+        self.predict = predict
+        self.decode = decode
+        self.batch_size = batch_size
+        self.decode_workers = decode_workers or cpu_count() or 1
+        self.labels = list(labels) if labels else None
+        self.cache = cache
+        self.top_k = top_k
+        self.failed_pictures = 0
+        self.cached_pictures = 0
+        self.images_scored = 0
+
+    def score(self, items: Iterable[Item], output_file: str) -> int:
+        """
+        Score all items not yet scored in output_file and append their scores to it. Items without a
+        readable picture are not written, so they are tried again in the next run.
+        :param items: the items to score
+        :param output_file: CSV file with the columns id, pictures and the mean probability of each class,
+                            or label_1, probability_1, ... label_<top_k>, probability_<top_k>
+        :return: number of items scored
+        """
+        truncate_partial_row(output_file)
+        done = scored_ids(output_file)
+        todo = [item for item in items if str(item.id) not in done]
+        self._print_status('{} items already scored, {} to go'.format(len(done), len(todo)))
+        if not todo:
+            return 0
+        with open(output_file, 'a', newline='') as file:
+            writer = csv.writer(file)
+            scored = 0
+            start_time = time()
+            for finished_items in self.item_scores(todo):
+                finished_items = [(item, scores) for item, scores in finished_items if scores.num_pictures]
+                if not finished_items:
+                    continue
+                if file.tell() == 0:
+                    writer.writerow([self.ID_COLUMN, self.PICTURES_COLUMN] + self._columns())
+                values = self._values(numpy.asarray([scores.mean() for _, scores in finished_items]))
+                writer.writerows(
+                    [item.id, scores.num_pictures] + row
+                    for (item, scores), row in zip(finished_items, values)
+                )
+                scored += len(finished_items)
+                file.flush()
+                if finished_items:
+                    self._print_status(
+                        '{}/{} items, {:.1f} images/s'.format(
+                            scored, len(todo), self.images_scored / (time() - start_time)
+                        ), end='\r'
+                    )
+        self._print_status()
+        return scored
+
+    def _columns(self) -> List[str]:
+        assert self.labels is not None
+        if not self.top_k:
+            return self.labels
+        return [
+            '{}_{}'.format(column, place + 1)
+            for place in range(min(self.top_k, len(self.labels))) for column in ('label', 'probability')
+        ]
+
+    def _values(self, means: numpy.ndarray) -> List[list]:
+        """
+        :param means: mean predictions of the items, one row per item
+        :return: values written for every item after its id and number of pictures
+        """
+        if not self.top_k:
+            return means.tolist()
+        assert self.labels is not None
+        indices, probabilities = top_k(means, self.top_k)
+        labels = numpy.array(self.labels, dtype=object)[indices]
+        # interleave labels and probabilities
+        return numpy.stack((labels, probabilities.astype(object)), axis=2).reshape(len(means), -1).tolist()
+
+    def item_scores(self, items: Sequence[Item]) -> Iterator[List[Tuple[Item, 'ItemScores']]]:
+        """
+        :param items: the items to score
+        :return: after every batch, the items all pictures of which are predicted, with the aggregated
+                 predictions for their pictures, in the order of items
+        """
+        scores = [ItemScores(len(item.picture_files)) for item in items]
+        finished = 0
+        for results in self.picture_predictions(items):
+            for item_index, prediction in results:
+                if prediction is None:
+                    scores[item_index].failed()
+                else:
+                    scores[item_index].add(prediction)
+            start = finished
+            while finished < len(items) and scores[finished].complete:
+                finished += 1
+            yield list(zip(items[start:finished], scores[start:finished]))
+        yield list(zip(items[finished:], scores[finished:]))
+
+    def picture_predictions(self, items: Sequence[Item]) -> Iterator[List[Prediction]]:
+        """
+        :param items: the items the pictures of which are predicted
+        :return: lists of the item index and prediction of pictures, None for pictures which could not
+                 be read; after every model batch and after every batch_size pictures found in the cache
+        """
+        batch = None  # type: Optional[numpy.ndarray]
+        batch_pictures = []  # type: List[Tuple[int, str]]
+        results = []  # type: List[Prediction]
+        for item_index, hash, image, cached in self._decoded_pictures(items):
+            if cached is not None:
+                self.cached_pictures += 1
+                results.append((item_index, self._with_labels(cached)))
+            elif image is None:
+                self.failed_pictures += 1
+                results.append((item_index, None))
+            else:
+                if batch is None:
+                    batch = numpy.zeros((self.batch_size, *image.shape), dtype=image.dtype)
+                batch[len(batch_pictures)] = image
+                batch_pictures.append((item_index, hash))
+            if len(batch_pictures) == self.batch_size:
+                assert batch is not None
+                results.extend(self._predict(batch, batch_pictures))
+                batch_pictures = []
+            if len(results) >= self.batch_size:
+                yield results
+                results = []
+        if batch is not None and batch_pictures:
+            batch[len(batch_pictures):] = 0
+            results.extend(self._predict(batch, batch_pictures))
+        yield results
+
+    def _predict(self, batch: numpy.ndarray, pictures: List[Tuple[int, str]]) -> List[Prediction]:
+        predictions = self._with_labels(self.predict(batch)[:len(pictures)])
+        self.images_scored += len(pictures)
+        if self.cache is not None:
+            self.cache.put({hash: prediction for (_, hash), prediction in zip(pictures, predictions)})
+        return [(item_index, prediction) for (item_index, _), prediction in zip(pictures, predictions)]
+
+    def _with_labels(self, predictions: numpy.ndarray) -> numpy.ndarray:
+        if self.labels is None:
+            self.labels = ['class_{}'.format(i) for i in range(predictions.shape[-1])]
+        return predictions
+
+    def _decoded_pictures(self, items: Sequence[Item]) -> Iterator[Decoded]:
+        """Decode the pictures in parallel, keeping a bounded number of decoded images in memory."""
+        pictures = ((i, picture) for i, item in enumerate(items) for picture in item.picture_files)
+        pending = deque()  # type: Deque[Future]
+        with ThreadPoolExecutor(self.decode_workers) as executor:
+            for item_index, picture in pictures:
+                pending.append(executor.submit(self._decode, item_index, picture))
+                if len(pending) >= 2 * self.batch_size:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def _decode(self, item_index: int, picture: str) -> Decoded:
+        """
+        :return: item index, hash of the picture if a cache is used, image and the cached prediction
+        """
+        try:
+            if self.cache is None:
+                return item_index, '', self.decode(picture), None
+            hash = file_hash(picture)
+            cached = self.cache.get([hash]).get(hash)
+            return item_index, hash, self.decode(picture) if cached is None else None, cached
+        except OSError:
+            return item_index, '', None, None
+
+
+class ItemScores:
+    """Predictions for the pictures of one item."""
+
+    def __init__(self, num_pictures: int) -> None:
+        self.expected_pictures = num_pictures
+        self.num_pictures = 0
+        self.failed_pictures = 0
+        self._sum = None  # type: Optional[numpy.ndarray]
+
+    def add(self, prediction: numpy.ndarray) -> None:
+        self._sum = prediction.astype(numpy.float64) if self._sum is None else self._sum + prediction
+        self.num_pictures += 1
+
+    def failed(self) -> None:
+        self.failed_pictures += 1
+
+    @property
+    def complete(self) -> bool:
+        return self.num_pictures + self.failed_pictures == self.expected_pictures
+
+    def mean(self) -> numpy.ndarray:
+        assert self._sum is not None
+        return self._sum / self.num_pictures
+
+
+def scored_ids(output_file: str) -> Set[str]:
+    """
+    :param output_file: CSV file written by BulkScorer
+    :return: ids of the items already scored in output_file
+    """
+    if not isfile(output_file):
+        return set()
+    with open(output_file, newline='') as file:
+        # a row cut short by an interrupted run is scored again
+        lines = [line for line in file if line.endswith('\n')]
+    return {
+        row[BulkScorer.ID_COLUMN] for row in csv.DictReader(lines)
+        if all(value not in (None, '') for value in row.values())
+    }
+
+
+def truncate_partial_row(output_file: str, block_size: int=4096) -> None:
+    """
+    Remove a row cut short by an interrupted run from the end of output_file, so new rows are not
+    appended to it.
+    :param output_file: CSV file written by BulkScorer
+    :param block_size: number of bytes read at a time while looking for the end of the last full row
+    :return: None
+    """
+    if not isfile(output_file):
+        return
+    with open(output_file, 'r+b') as file:
+        end = file.seek(0, 2)
+        position = end
+        while position > 0:
+            start = max(0, position - block_size)
+            file.seek(start)
+            newline = file.read(position - start).rfind(b'\n')
+            if newline >= 0:
+                position = start + newline + 1
+                break
+            position = start
+        if position < end:
+            file.truncate(position)
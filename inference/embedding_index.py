@@ -0,0 +1,288 @@
+"""
+Similarity search over the pictures of items, to find items that look like given ones.
+
+Every picture is represented by its embedding, the output of the layer before the final softmax
+layer of a trained network. Embeddings are normalized to unit length, so their dot product is the
+cosine similarity, and stored as one float16 matrix with the id of the item each row belongs to.
+
+Queries are answered either exactly, by comparing with all rows in blocks, or approximately with an
+inverted file: the rows are grouped into partitions around k-means centroids, and only the partitions
+with the centroids closest to the query are searched.
+"""
+
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy
+from keras import Model
+from keras.layers import Dense
+
+from acquisition.item import Item
+from inference.bulk_scorer import BulkScorer
+from utils.with_verbose import WithVerbose
+
+# rows compared at once in exact search, bounding the float32 copy of the embeddings
+BLOCK_SIZE = 32768
+KMEANS_ITERATIONS = 10
+# k-means is trained on a sample of this many rows per partition
+KMEANS_SAMPLES_PER_PARTITION = 64
+
+
+def embedding_model(model: Model) -> Model:
+    """
+    :param model: a classifier ending in a Dense layer, as built by network_types.model()
+    :return: model computing the input of the last Dense layer, i.e. the output of the layer before it
+    """
+    last_layer = model.layers[-1]
+    if not isinstance(last_layer, Dense):
+        raise ValueError('Last layer of the model must be Dense, not {}'.format(type(last_layer).__name__))
+    return Model(inputs=model.input, outputs=last_layer.input)
+
+
+class EmbeddingIndex(WithVerbose):
+
+    def __init__(
+            self, embeddings: numpy.ndarray, item_ids: numpy.ndarray, centroids: Optional[numpy.ndarray]=None,
+            offsets: Optional[numpy.ndarray]=None, verbose: bool=False
+    ) -> None:
+        """
+        :param embeddings: float16 embeddings of unit length, one per row, see from_embeddings()
+        :param item_ids: id of the item the picture of each row belongs to
+        :param centroids: centroids of the partitions, if partitioned
+        :param offsets: rows of partition i are offsets[i]:offsets[i + 1], if partitioned
+        :param verbose: If set, print progress information
+        """
+        WithVerbose.__init__(self, verbose)
+        if len(embeddings) != len(item_ids):
+            raise ValueError('{} embeddings, but {} item ids'.format(len(embeddings), len(item_ids)))
+        self.embeddings = embeddings
+        self.item_ids = item_ids
+        self.centroids = centroids
+        self.offsets = offsets
+
+    @classmethod
+    def from_embeddings(
+            cls, embeddings: numpy.ndarray, item_ids: Union[Sequence[int], numpy.ndarray], verbose: bool=False
+    ) -> 'EmbeddingIndex':
+        """
+        :param embeddings: one embedding per row, of any length and precision
+        :param item_ids: id of the item the picture of each row belongs to
+        :param verbose: If set, print progress information
+        :return: unpartitioned index of the embeddings
+        """
+        normalized = numpy.empty(embeddings.shape, dtype=numpy.float16)
+        # block by block, so no float32 copy of all embeddings is needed
+        for start in range(0, len(embeddings), BLOCK_SIZE):
+            block = numpy.asarray(embeddings[start:start + BLOCK_SIZE], dtype=numpy.float32)
+            normalized[start:start + BLOCK_SIZE] = _normalized(block)
+        return cls(normalized, numpy.asarray(item_ids, dtype=numpy.int64), verbose=verbose)
+
+    @classmethod
+    def build(
+            cls, items: Iterable[Item], predict: Callable[[numpy.ndarray], numpy.ndarray],
+            decode: Callable[[str], numpy.ndarray], batch_size: int=64, decode_workers: Optional[int]=None,
+            verbose: bool=False
+    ) -> 'EmbeddingIndex':
+        """
+        :param items: the items the pictures of which are indexed
+        :param predict: function computing the embeddings for a batch of images, see embedding_model()
+        :param decode: function reading an image file into the model input
+        :param batch_size: number of images predicted at once
+        :param decode_workers: number of threads decoding images (default: number of CPUs)
+        :param verbose: If set, print progress information
+        :return: index of all readable pictures
+        """
+        items = list(items)
+        scorer = BulkScorer(predict, decode, batch_size, decode_workers, verbose=verbose)
+        # filled batch by batch, so neither a list of all embeddings nor a float32 copy of them is made
+        item_ids = numpy.empty(sum(len(item.picture_files) for item in items), dtype=numpy.int64)
+        embeddings = None  # type: Optional[numpy.ndarray]
+        count = 0
+        for predictions in scorer.picture_predictions(items):
+            readable = [prediction for prediction in predictions if prediction[1] is not None]
+            if not readable:
+                continue
+            block = numpy.asarray([embedding for _, embedding in readable], dtype=numpy.float32)
+            if embeddings is None:
+                embeddings = numpy.empty((len(item_ids), *block.shape[1:]), dtype=numpy.float16)
+            embeddings[count:count + len(block)] = _normalized(block)
+            item_ids[count:count + len(block)] = [items[item_index].id for item_index, _ in readable]
+            count += len(block)
+        if embeddings is None:
+            raise ValueError('No readable pictures')
+        index = cls(embeddings[:count], item_ids[:count], verbose=verbose)
+        index._print_status('Indexed {} pictures of {} items'.format(len(index), len(set(index.item_ids))))
+        return index
+
+    def __len__(self) -> int:
+        return len(self.embeddings)
+
+    @property
+    def partitioned(self) -> bool:
+        return self.centroids is not None
+
+    def partition(self, num_partitions: Optional[int]=None, random_seed: Optional[int]=0) -> None:
+        """
+        Group the rows around k-means centroids, enabling approximate search.
+        :param num_partitions: number of partitions (default: square root of the number of rows)
+        :param random_seed: seed for choosing the initial centroids and the training sample
+        :return: None
+        """
+        num_partitions = min(num_partitions or int(numpy.sqrt(len(self))) or 1, len(self))
+        random = numpy.random.RandomState(random_seed)
+        sample_size = min(len(self), KMEANS_SAMPLES_PER_PARTITION * num_partitions)
+        sample = self.embeddings[random.choice(len(self), sample_size, replace=False)].astype(numpy.float32)
+        centroids = sample[random.choice(sample_size, num_partitions, replace=False)]
+        for iteration in range(KMEANS_ITERATIONS):
+            self._print_status('k-means iteration {}'.format(iteration + 1), end='\r')
+            assignment = (sample @ centroids.T).argmax(axis=1)
+            sums = numpy.zeros_like(centroids)
+            numpy.add.at(sums, assignment, sample)
+            empty = numpy.bincount(assignment, minlength=num_partitions) == 0
+            # partitions which lost all their rows keep their centroid
+            sums[empty] = centroids[empty]
+            centroids = _normalized(sums)
+        assignment = numpy.concatenate([
+            (self._block(start) @ centroids.T).argmax(axis=1) for start in range(0, len(self), BLOCK_SIZE)
+        ])
+        order = numpy.argsort(assignment, kind='stable')
+        self.embeddings = self.embeddings[order]
+        self.item_ids = self.item_ids[order]
+        self.centroids = centroids.astype(numpy.float16)
+        self.offsets = numpy.concatenate(
+            ([0], numpy.cumsum(numpy.bincount(assignment, minlength=num_partitions)))
+        )
+        self._print_status('{} rows in {} partitions'.format(len(self), num_partitions))
+
+    def search(
+            self, queries: numpy.ndarray, k: int=10, probes: Optional[int]=None
+    ) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        :param queries: query embeddings, one per row
+        :param k: number of results per query
+        :param probes: if set, search only this many partitions closest to each query; needs partition()
+        :return: rows and cosine similarities of the k most similar pictures for each query, most similar
+                 first, both of shape (len(queries), k); rows beyond the number of pictures found are -1
+        """
+        queries = _normalized(numpy.atleast_2d(numpy.asarray(queries, dtype=numpy.float32)))
+        if probes is None:
+            return self._exact_search(queries, k)
+        if self.centroids is None or self.offsets is None:
+            raise ValueError('Approximate search needs a partitioned index, call partition() first')
+        return self._approximate_search(queries, k, probes, self.centroids, self.offsets)
+
+    def similar_items(
+            self, item_ids: Iterable[int], k: int=10, probes: Optional[int]=None
+    ) -> List[Tuple[int, float]]:
+        """
+        :param item_ids: items which the results should look like
+        :param k: number of items returned
+        :param probes: if set, search approximately in this many partitions
+        :return: ids of the k other items with the picture most similar to the mean of the pictures of
+                 the given items, and the similarity of that picture, most similar first
+        """
+        wanted = numpy.asarray(list(item_ids), dtype=numpy.int64)
+        query_rows = numpy.isin(self.item_ids, wanted)
+        if not query_rows.any():
+            raise ValueError('None of the items is in the index')
+        query = self.embeddings[query_rows].astype(numpy.float32).mean(axis=0)
+        # other pictures of the query items and of the same items are found too, so ask for more rows, and
+        # for even more while too few different items are found
+        num_rows = k * 4 + int(query_rows.sum())
+        while True:
+            rows, similarities = self.search(query, num_rows, probes)
+            found = {}  # type: Dict[int, float]
+            for row, similarity in zip(rows[0], similarities[0]):
+                if row < 0 or len(found) == k:
+                    break
+                item_id = int(self.item_ids[row])
+                if item_id not in wanted and item_id not in found:
+                    found[item_id] = float(similarity)
+            if len(found) == k or num_rows >= len(self):
+                return list(found.items())
+            num_rows = min(2 * num_rows, len(self))
+
+    def save(self, index_file: str) -> None:
+        arrays = {'embeddings': self.embeddings, 'item_ids': self.item_ids}
+        if self.centroids is not None and self.offsets is not None:
+            arrays.update(centroids=self.centroids, offsets=self.offsets)
+        with open(index_file, 'wb') as file:
+            numpy.savez(file, **arrays)
+
+    @classmethod
+    def load(cls, index_file: str, verbose: bool=False) -> 'EmbeddingIndex':
+        with numpy.load(index_file) as arrays:
+            return cls(
+                arrays['embeddings'], arrays['item_ids'], arrays.get('centroids'), arrays.get('offsets'),
+                verbose
+            )
+
+    def _block(self, start: int) -> numpy.ndarray:
+        return self.embeddings[start:start + BLOCK_SIZE].astype(numpy.float32)
+
+    def _exact_search(self, queries: numpy.ndarray, k: int) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        rows = numpy.full((len(queries), 0), -1, dtype=numpy.int64)
+        similarities = numpy.zeros((len(queries), 0), dtype=numpy.float32)
+        for start in range(0, len(self), BLOCK_SIZE):
+            block_similarities = queries @ self._block(start).T
+            block_rows = numpy.broadcast_to(
+                numpy.arange(start, start + block_similarities.shape[1]), block_similarities.shape
+            )
+            rows, similarities = _top_k(
+                numpy.concatenate((rows, block_rows), axis=1),
+                numpy.concatenate((similarities, block_similarities), axis=1), k
+            )
+        return _padded(rows, similarities, k)
+
+    def _approximate_search(
+            self, queries: numpy.ndarray, k: int, probes: int, centroids: numpy.ndarray,
+            offsets: numpy.ndarray
+    ) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        centroid_rows, _ = _top_k(
+            numpy.broadcast_to(numpy.arange(len(centroids)), (len(queries), len(centroids))),
+            queries @ centroids.astype(numpy.float32).T, probes
+        )
+        rows = numpy.full((len(queries), k), -1, dtype=numpy.int64)
+        similarities = numpy.zeros((len(queries), k), dtype=numpy.float32)
+        for i, (query, partitions) in enumerate(zip(queries, centroid_rows)):
+            candidates = numpy.concatenate([
+                numpy.arange(offsets[partition], offsets[partition + 1]) for partition in partitions
+            ])
+            candidate_similarities = self.embeddings[candidates].astype(numpy.float32) @ query
+            found_rows, found_similarities = _top_k(
+                candidates[numpy.newaxis], candidate_similarities[numpy.newaxis], k
+            )
+            rows[i, :found_rows.shape[1]] = found_rows[0]
+            similarities[i, :found_rows.shape[1]] = found_similarities[0]
+        return rows, similarities
+
+
+def _normalized(vectors: numpy.ndarray) -> numpy.ndarray:
+    norms = numpy.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / numpy.maximum(norms, numpy.finfo(numpy.float32).tiny)
+
+
+def _top_k(
+        rows: numpy.ndarray, similarities: numpy.ndarray, k: int
+) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    :param rows: row numbers, shape (num_queries, n)
+    :param similarities: similarity of each row, same shape
+    :return: the at most k rows with the highest similarity per query and their similarity, sorted
+    """
+    if similarities.shape[1] > k:
+        # argpartition finds the k best in linear time, only those are sorted
+        best = numpy.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        rows = numpy.take_along_axis(rows, best, axis=1)
+        similarities = numpy.take_along_axis(similarities, best, axis=1)
+    order = numpy.argsort(-similarities, axis=1, kind='stable')
+    return numpy.take_along_axis(rows, order, axis=1), numpy.take_along_axis(similarities, order, axis=1)
+
+
+def _padded(rows: numpy.ndarray, similarities: numpy.ndarray, k: int) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    missing = k - rows.shape[1]
+    if missing <= 0:
+        return rows, similarities
+    return (
+        numpy.pad(rows, ((0, 0), (0, missing)), constant_values=-1),
+        numpy.pad(similarities, ((0, 0), (0, missing)))
+    )
@@ -0,0 +1,158 @@
+"""
+Export of trained models to TensorFlow Lite for fast CPU inference, optionally quantized to 8 bit
+integers, and a runtime for the exported models.
+"""
+
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy
+
+QUANTIZATIONS = ('none', 'dynamic', 'int8')
+
+Predict = Callable[[numpy.ndarray], numpy.ndarray]
+
+
+def export_tflite(
+        model: Any, output_file: str, quantization: str='none',
+        calibration_images: Optional[numpy.ndarray]=None
+) -> int:
+    """
+    Convert a Keras model to TensorFlow Lite.
+    :param model: the Keras model with its trained weights
+    :param output_file: file the TFLite model is written to
+    :param quantization: 'none' keeps float32 weights, 'dynamic' stores the weights as 8 bit integers,
+                         'int8' also computes the activations with 8 bit integers
+    :param calibration_images: images from the data set, used by 'int8' quantization to determine the
+                               range of the activations
+    :return: size of the exported model in bytes
+    """
+    import tensorflow as tf
+    if quantization not in QUANTIZATIONS:
+        raise ValueError('Quantization must be one of {}, not {}'.format(QUANTIZATIONS, quantization))
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if quantization != 'none':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == 'int8':
+        if calibration_images is None or not len(calibration_images):
+            raise ValueError('int8 quantization needs calibration images')
+        images = calibration_images.astype(model.input.dtype.as_numpy_dtype)
+
+        def representative_dataset() -> Iterator[List[numpy.ndarray]]:
+            for image in images:
+                yield [image[numpy.newaxis]]
+
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    exported = converter.convert()
+    with open(output_file, 'wb') as file:
+        file.write(exported)
+    return len(exported)
+
+
+class TFLiteModel:
+    """
+    Runs an exported TensorFlow Lite model with the prediction methods of a Keras model, so it can
+    replace the Keras model in the predictors.
+    """
+
+    def __init__(self, model_file: str, num_threads: Optional[int]=None) -> None:
+        """
+        :param model_file: the exported model
+        :param num_threads: number of threads the interpreter uses (default: TensorFlow decides)
+        """
+        import tensorflow as tf
+        self.model_file = model_file
+        self.interpreter = tf.lite.Interpreter(model_path=model_file, num_threads=num_threads)
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = 0
+
+    @property
+    def image_size(self) -> Tuple[int, int]:
+        return int(self._input['shape'][1]), int(self._input['shape'][2])
+
+    def predict_on_batch(self, images: numpy.ndarray) -> numpy.ndarray:
+        if len(images) != self._batch_size:
+            self.interpreter.resize_tensor_input(
+                self._input['index'], (len(images), *self._input['shape'][1:])
+            )
+            self.interpreter.allocate_tensors()
+            self._batch_size = len(images)
+        self.interpreter.set_tensor(self._input['index'], _quantized(images, self._input))
+        self.interpreter.invoke()
+        return _dequantized(self.interpreter.get_tensor(self._output['index']), self._output)
+
+    def predict(
+            self, images: numpy.ndarray, batch_size: Optional[int]=None, verbose: int=0
+    ) -> numpy.ndarray:
+        batch_size = batch_size or len(images)
+        return numpy.concatenate([
+            self.predict_on_batch(images[start:start + batch_size])
+            for start in range(0, len(images), batch_size)
+        ])
+
+
+def compare_models(
+        reference: Predict, candidate: Predict, images: numpy.ndarray, batch_size: int=32,
+        labels: Optional[numpy.ndarray]=None
+) -> Dict[str, Optional[float]]:
+    """
+    Predict the same images with two models.
+    :param reference: batch prediction function of the original model
+    :param candidate: batch prediction function of the exported model
+    :param images: images to predict
+    :param batch_size: number of images predicted at once
+    :param labels: if given, index of the correct class of every image, -1 for images of unknown class
+    :return: share of images for which both models predict the same class, largest difference of the
+             predicted probabilities, accuracy of both models on the images of known class if labels are
+             given, and the time both models took with the speedup of the candidate
+    """
+    reference_predictions, reference_time = _timed_predictions(reference, images, batch_size)
+    candidate_predictions, candidate_time = _timed_predictions(candidate, images, batch_size)
+    reference_classes = reference_predictions.argmax(axis=1)
+    candidate_classes = candidate_predictions.argmax(axis=1)
+    return {
+        'agreement': float(numpy.mean(reference_classes == candidate_classes)),
+        'max_difference': float(numpy.abs(reference_predictions - candidate_predictions).max()),
+        'reference_accuracy': _accuracy(reference_classes, labels),
+        'candidate_accuracy': _accuracy(candidate_classes, labels),
+        'reference_seconds': reference_time,
+        'candidate_seconds': candidate_time,
+        'speedup': reference_time / candidate_time if candidate_time else None,
+    }
+
+
+def _timed_predictions(
+        predict: Predict, images: numpy.ndarray, batch_size: int
+) -> Tuple[numpy.ndarray, float]:
+    batches = [images[start:start + batch_size] for start in range(0, len(images), batch_size)]
+    predict(batches[0])  # warm up, so one time initialization is not measured
+    start = perf_counter()
+    predictions = numpy.concatenate([numpy.asarray(predict(batch)) for batch in batches])
+    return predictions, perf_counter() - start
+
+
+def _accuracy(classes: numpy.ndarray, labels: Optional[numpy.ndarray]) -> Optional[float]:
+    if labels is None:
+        return None
+    known = labels >= 0
+    return float(numpy.mean(classes[known] == labels[known])) if known.any() else None
+
+
+def _quantized(images: numpy.ndarray, details: Dict[str, Any]) -> numpy.ndarray:
+    if details['dtype'] == numpy.float32:
+        return images.astype(numpy.float32)
+    scale, zero_point = details['quantization']
+    if not scale:
+        # integer input which is not quantized, e.g. a model normalizing uint8 images itself
+        return images.astype(details['dtype'])
+    info = numpy.iinfo(details['dtype'])
+    return numpy.clip(numpy.round(images / scale + zero_point), info.min, info.max).astype(details['dtype'])
+
+
+def _dequantized(output: numpy.ndarray, details: Dict[str, Any]) -> numpy.ndarray:
+    if details['dtype'] == numpy.float32:
+        return output.copy()
+    scale, zero_point = details['quantization']
+    return (output.astype(numpy.float32) - zero_point) * scale
@@ -0,0 +1,98 @@
+import re
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy
+
+from acquisition.item import Item
+from acquisition.shopping_api import ShoppingApi
+from category import Category
+from inference.bulk_scorer import BulkScorer
+from utils.with_verbose import WithVerbose
+
+ITEM_URL_PATTERN = re.compile(r'(?:^|/itm/(?:[^/?#]+/)?)(\d+)(?:[/?#]|$)')
+
+
+class ItemPrediction(NamedTuple):
+    url: str
+    item: Optional[Item]
+    prediction: Optional[numpy.ndarray]
+    error: Optional[str]
+
+
+def item_id_from_url(url: str) -> int:
+    """
+    :param url: URL of an eBay item, like https://www.ebay.de/itm/<title>/<item id>, or just the item id
+    :return: the item id
+    """
+    match = ITEM_URL_PATTERN.search(url)
+    if match is None:
+        raise ValueError('Not an eBay item URL: {}'.format(url))
+    return int(match.group(1))
+
+
+class ItemPredictionPipeline(WithVerbose):
+    """
+    Predicts eBay items given by their URL. The items are looked up and their pictures downloaded by a
+    pool of threads while the pictures of the items fetched before are predicted, so network access and
+    inference overlap.
+    """
+
+    def __init__(
+            self, api: ShoppingApi, scorer: BulkScorer, fetch_workers: int=8, verbose: bool=False
+    ) -> None:
+        """
+        :param api: API the items are looked up with
+        :param scorer: BulkScorer predicting the pictures and aggregating the predictions per item
+        :param fetch_workers: number of items looked up and downloaded at the same time
+        :param verbose: If set, print progress information
+        """
+        WithVerbose.__init__(self, verbose)
+        self.api = api
+        self.scorer = scorer
+        self.fetch_workers = fetch_workers
+        self.category = Category({'CategoryID': 'unknown', 'CategoryName': 'unknown', 'LeafCategory': 'true'})
+
+    def predict(self, item_urls: Iterable[str]) -> Iterator[ItemPrediction]:
+        """
+        Pictures are downloaded to Item.download_root, which serves as cache for repeated predictions.
+        :param item_urls: URLs of the items to predict
+        :return: the mean prediction of the pictures of every item, in the order of item_urls
+        """
+        with ThreadPoolExecutor(self.fetch_workers) as executor:
+            fetches = [(url, executor.submit(self._fetch, url)) for url in item_urls]
+            fetched = []  # type: List[Tuple[str, Future]]
+            num_pictures = 0
+            for url, fetch in fetches:
+                fetched.append((url, fetch))
+                if fetch.exception() is None:
+                    num_pictures += len(fetch.result().picture_files)
+                if num_pictures >= self.scorer.batch_size:
+                    yield from self._predict(fetched)
+                    fetched, num_pictures = [], 0
+            yield from self._predict(fetched)
+
+    def _fetch(self, url: str) -> Item:
+        item = Item(self.api, self.category, item_id_from_url(url))
+        if not item.valid:
+            raise ValueError('Item {} not found'.format(item_id_from_url(url)))
+        self._print_status('Downloading', url)
+        item.download_images()
+        return item
+
+    def _predict(self, fetched: List[Tuple[str, Future]]) -> Iterator[ItemPrediction]:
+        items = [fetch.result() for _, fetch in fetched if fetch.exception() is None]
+        scores = {
+            id(item): item_scores
+            for finished in self.scorer.item_scores(items) for item, item_scores in finished
+        }
+        for url, fetch in fetched:
+            error = fetch.exception()
+            if error is not None:
+                yield ItemPrediction(url, None, None, str(error))
+                continue
+            item = fetch.result()
+            if not scores[id(item)].num_pictures:
+                yield ItemPrediction(url, item, None, 'No readable picture')
+                continue
+            yield ItemPrediction(url, item, scores[id(item)].mean(), None)
@@ -0,0 +1,128 @@
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future
+from time import perf_counter
+from typing import Any, Callable, Deque, Dict, List, NamedTuple, Optional, Sequence
+
+import numpy
+
+
+class LatencyStats:
+    """Latency of the requests and size of the batches a MicroBatcher processed."""
+
+    def __init__(self, window: int=10000) -> None:
+        """
+        :param window: number of most recent requests the latency percentiles are computed from
+        """
+        self.requests = 0
+        self.batches = 0
+        self._latencies = deque(maxlen=window)  # type: Deque[float]
+        self._start = perf_counter()
+        self._lock = threading.Lock()
+
+    def record_batch(self, latencies: Sequence[float]) -> None:
+        with self._lock:
+            self.requests += len(latencies)
+            self.batches += 1
+            self._latencies.extend(latencies)
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        :return: number of requests and batches, mean batch size, median and 99th percentile of the
+                 latency in seconds and requests per second since the stats were started
+        """
+        with self._lock:
+            latencies = numpy.array(self._latencies)
+            requests, batches = self.requests, self.batches
+        return {
+            'requests': requests,
+            'batches': batches,
+            'mean_batch_size': requests / batches if batches else 0.,
+            'p50': float(numpy.percentile(latencies, 50)) if len(latencies) else None,
+            'p99': float(numpy.percentile(latencies, 99)) if len(latencies) else None,
+            'throughput': requests / (perf_counter() - self._start),
+        }
+
+
+class _Request(NamedTuple):
+    image: numpy.ndarray
+    result: Future
+    submitted: float
+
+
+class MicroBatcher:
+    """
+    Collects images submitted from many threads into batches, so the model is run on as large batches
+    as possible while no request waits longer than a small latency window for its batch to be filled.
+    """
+
+    def __init__(
+            self, predict: Callable[[numpy.ndarray], numpy.ndarray], max_batch_size: int=32,
+            max_latency: float=0.01
+    ) -> None:
+        """
+        :param predict: function computing the predictions for a batch of images
+        :param max_batch_size: largest number of images predicted at once
+        :param max_latency: longest time in seconds the first request of a batch waits for more requests
+        """
+        self.predict_batch = predict
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.stats = LatencyStats()
+        self._queue = queue.Queue()  # type: queue.Queue
+        self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, image: numpy.ndarray) -> Future:
+        """
+        :param image: the image to predict
+        :return: Future of the prediction for the image
+        """
+        result = Future()  # type: Future
+        self._queue.put(_Request(image, result, perf_counter()))
+        return result
+
+    def predict(self, images: Sequence[numpy.ndarray], timeout: Optional[float]=None) -> List[numpy.ndarray]:
+        """
+        :param images: images to predict; they may end up in different batches
+        :param timeout: longest time in seconds to wait for the predictions
+        :return: the prediction for every image
+        """
+        return [future.result(timeout) for future in [self.submit(image) for image in images]]
+
+    def close(self) -> None:
+        """Predict the images submitted so far and stop."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            request = self._queue.get()
+            if request is None:
+                return
+            batch = [request]
+            deadline = request.submitted + self.max_latency
+            while len(batch) < self.max_batch_size:
+                try:
+                    request = self._queue.get(timeout=max(deadline - perf_counter(), 0.))
+                except queue.Empty:
+                    break
+                if request is None:
+                    stop = True
+                    break
+                batch.append(request)
+            self._predict(batch)
+
+    def _predict(self, batch: List[_Request]) -> None:
+        try:
+            predictions = self.predict_batch(numpy.stack([request.image for request in batch]))
+        except Exception as error:
+            for request in batch:
+                request.result.set_exception(error)
+            return
+        end = perf_counter()
+        for request, prediction in zip(batch, predictions):
+            request.result.set_result(prediction)
+        self.stats.record_batch([end - request.submitted for request in batch])
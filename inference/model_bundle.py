@@ -0,0 +1,124 @@
+"""
+Self-describing model bundle: everything needed to predict with a trained network, so a predictor
+neither has to rebuild the network from its type nor be told the image size and labels by hand.
+
+A bundle is a folder containing
+* architecture.json - the serialized architecture of the network, as written by Model.to_json()
+* weights.hdf5      - the trained weights
+* bundle.json       - label vocabulary, image size, preprocessing and the network type it was built from
+"""
+
+import json
+from os import makedirs, replace
+from os.path import abspath, basename, dirname, isdir, isfile, join, splitext
+from shutil import rmtree
+from tempfile import mkdtemp
+from typing import Any, Dict, List, Optional, Tuple
+
+from keras import Model
+from keras.models import model_from_json
+
+BUNDLE_VERSION = 1
+
+ARCHITECTURE_FILE = 'architecture.json'
+WEIGHTS_FILE = 'weights.hdf5'
+METADATA_FILE = 'bundle.json'
+
+# how images are turned into the model input: scaled with add_border(), pixel values unchanged
+DEFAULT_PREPROCESSING = {'resize': 'add_border', 'normalization': None}  # type: Dict[str, Any]
+
+
+def bundle_dir(weights_file: str) -> str:
+    """
+    :param weights_file: weights file written during training
+    :return: folder of the bundle saved alongside the weights file
+    """
+    return splitext(weights_file)[0] + '.bundle'
+
+
+class ModelBundle:
+
+    def __init__(
+            self, model: Model, labels_to_numbers: Dict[str, int], image_size: Tuple[int, int],
+            preprocessing: Optional[Dict[str, Any]]=None, network_type: Optional[str]=None
+    ) -> None:
+        """
+        :param model: the trained network
+        :param labels_to_numbers: index of the output of the network for every label
+        :param image_size: (width, height) of the images the network predicts
+        :param preprocessing: how images are converted to the input of the network
+        :param network_type: name of the network type the model was built from, for information only
+        """
+        self.model = model
+        self.labels_to_numbers = labels_to_numbers
+        self.image_size = image_size
+        self.preprocessing = dict(DEFAULT_PREPROCESSING if preprocessing is None else preprocessing)
+        self.network_type = network_type
+
+    @property
+    def labels(self) -> List[str]:
+        """:return: the labels in the order of the outputs of the network"""
+        return sorted(self.labels_to_numbers, key=self.labels_to_numbers.__getitem__)
+
+    def save(self, directory: str) -> None:
+        """
+        Write the bundle. It is written to a temporary folder next to the target first and then moved in
+        place, so an interrupted save leaves the previous bundle intact and never a mix of old and new
+        files.
+        :param directory: folder the bundle is written to
+        :return: None
+        """
+        parent = dirname(abspath(directory))
+        makedirs(parent, exist_ok=True)
+        temp_dir = mkdtemp(prefix=basename(directory) + '.', dir=parent)
+        try:
+            self._write(temp_dir)
+            if isdir(directory):
+                replace(directory, temp_dir + '.old')
+            replace(temp_dir, directory)
+        finally:
+            rmtree(temp_dir, ignore_errors=True)
+            rmtree(temp_dir + '.old', ignore_errors=True)
+
+    def _write(self, directory: str) -> None:
+        with open(join(directory, ARCHITECTURE_FILE), 'w') as file:
+            file.write(self.model.to_json())
+        self.model.save_weights(join(directory, WEIGHTS_FILE))
+        with open(join(directory, METADATA_FILE), 'w') as file:
+            json.dump(
+                {
+                    'version': BUNDLE_VERSION, 'labels_to_numbers': self.labels_to_numbers,
+                    'image_size': list(self.image_size), 'preprocessing': self.preprocessing,
+                    'network_type': self.network_type,
+                },
+                file, indent=2, sort_keys=True
+            )
+
+    @classmethod
+    def load(cls, directory: str, custom_objects: Optional[Dict[str, Any]]=None) -> 'ModelBundle':
+        """
+        :param directory: folder the bundle was saved to
+        :param custom_objects: layers not part of Keras used in the architecture, by name
+        :return: the bundle with its model ready to predict
+        """
+        if not cls.exists(directory):
+            raise FileNotFoundError('No model bundle in {}'.format(directory))
+        with open(join(directory, METADATA_FILE)) as file:
+            metadata = json.load(file)
+        if metadata['version'] != BUNDLE_VERSION:
+            raise ValueError('Unsupported model bundle version {}'.format(metadata['version']))
+        with open(join(directory, ARCHITECTURE_FILE)) as file:
+            model = model_from_json(file.read(), custom_objects=custom_objects)
+        model.load_weights(join(directory, WEIGHTS_FILE))
+        return cls(
+            model, metadata['labels_to_numbers'], tuple(metadata['image_size']), metadata['preprocessing'],
+            metadata['network_type']
+        )
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        return isfile(join(directory, METADATA_FILE))
+
+    @staticmethod
+    def weights_file(directory: str) -> str:
+        return join(directory, WEIGHTS_FILE)
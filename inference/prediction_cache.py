@@ -0,0 +1,109 @@
+"""
+Persistent cache of predictions, so pictures scored before by the same model are not decoded and
+predicted again.
+
+Predictions are keyed by the SHA-256 hash of the image file contents and a fingerprint of the model,
+which covers its architecture, its weights and the image size. Retraining the model or changing the
+image size therefore never returns stale predictions.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+from os.path import isfile
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def image_hash(image: bytes) -> str:
+    return hashlib.sha256(image).hexdigest()
+
+
+def file_hash(file_name: str) -> str:
+    hash = hashlib.sha256()
+    with open(file_name, 'rb') as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            hash.update(chunk)
+    return hash.hexdigest()
+
+
+def model_fingerprint(architecture: str, weights_file: Optional[str], image_size: Tuple[int, int]) -> str:
+    """
+    :param architecture: serialized architecture of the model, e.g. Model.to_json()
+    :param weights_file: file the weights of the model were loaded from, None for initial weights
+    :param image_size: size of the images the model predicts
+    :return: a string identifying the model
+    """
+    weights = file_hash(weights_file) if weights_file and isfile(weights_file) else None
+    description = json.dumps(
+        {'architecture': architecture, 'weights': weights, 'image_size': list(image_size)}, sort_keys=True
+    )
+    return hashlib.sha256(description.encode('utf-8')).hexdigest()
+
+
+class PredictionCache:
+    """Predictions of one model, stored in an SQLite database shared by all models."""
+
+    def __init__(self, cache_file: str, fingerprint: str) -> None:
+        """
+        :param cache_file: SQLite database the predictions are stored in
+        :param fingerprint: fingerprint of the model, see model_fingerprint()
+        """
+        self.fingerprint = fingerprint
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(cache_file, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS predictions ('
+                'model TEXT NOT NULL, image TEXT NOT NULL, prediction BLOB NOT NULL, '
+                'PRIMARY KEY (model, image))'
+            )
+
+    def get(self, image_hashes: Iterable[str]) -> Dict[str, numpy.ndarray]:
+        """
+        :param image_hashes: hashes of the images to look up
+        :return: the cached predictions for those of the images which were predicted before
+        """
+        hashes = list(image_hashes)
+        found = {}  # type: Dict[str, numpy.ndarray]
+        with self._lock:
+            # stay below SQLite's limit on the number of parameters in a statement
+            for start in range(0, len(hashes), 500):
+                chunk = hashes[start:start + 500]
+                rows = self._connection.execute(
+                    'SELECT image, prediction FROM predictions WHERE model = ? AND image IN ({})'.format(
+                        ', '.join('?' * len(chunk))
+                    ),
+                    [self.fingerprint] + chunk
+                )
+                found.update(
+                    (image, numpy.frombuffer(prediction, dtype=numpy.float32)) for image, prediction in rows
+                )
+        return found
+
+    def put(self, predictions: Dict[str, numpy.ndarray]) -> None:
+        """
+        :param predictions: predictions for the images with the given hashes
+        :return: None
+        """
+        with self._lock, self._connection:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO predictions VALUES (?, ?, ?)',
+                [
+                    (self.fingerprint, image, numpy.asarray(prediction, dtype=numpy.float32).tobytes())
+                    for image, prediction in predictions.items()
+                ]
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute(
+                'SELECT COUNT(*) FROM predictions WHERE model = ?', (self.fingerprint,)
+            ).fetchone()[0]
+
+    def close(self) -> None:
+        self._connection.close()
@@ -0,0 +1,147 @@
+"""
+HTTP interface to a MicroBatcher.
+
+POST /predict takes either a JSON object {"images": [<image file>, ...]} or the bytes of a single image
+and answers {"predictions": [[<probability per class>, ...], ...]}. GET /stats answers the latency and
+throughput statistics of the batcher. The server listens on a TCP port or on a Unix socket.
+"""
+
+import json
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from io import BytesIO
+from os import remove
+from os.path import exists
+from socketserver import ThreadingMixIn, UnixStreamServer
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Union
+
+import numpy
+
+from inference.micro_batcher import MicroBatcher
+from inference.prediction_cache import PredictionCache, image_hash
+
+Decoder = Callable[[Union[str, BinaryIO]], numpy.ndarray]
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self) -> None:
+        socket_path = str(self.server_address)
+        if exists(socket_path):
+            remove(socket_path)
+        UnixStreamServer.server_bind(self)
+
+
+def make_server(
+        batcher: MicroBatcher, decode: Decoder, host: str='localhost', port: int=8080,
+        socket_path: Optional[str]=None, labels: Optional[List[str]]=None,
+        cache: Optional[PredictionCache]=None
+) -> Union[ThreadingHTTPServer, ThreadingUnixHTTPServer]:
+    """
+    :param batcher: MicroBatcher running the model
+    :param decode: function turning an image file or a file-like object into the model input
+    :param host: host name or address to listen on
+    :param port: TCP port to listen on, 0 to choose a free port
+    :param socket_path: if set, listen on this Unix socket instead of a TCP port
+    :param labels: if set, name of the class of each output of the model, returned with the predictions
+    :param cache: if set, images predicted before are answered from this cache instead of the model
+    :return: the server, to be run with serve_forever()
+    """
+    handler = type(
+        'Handler', (PredictionRequestHandler,),
+        {'batcher': batcher, 'decode': decode, 'labels': labels, 'cache': cache}
+    )
+    if socket_path:
+        return ThreadingUnixHTTPServer(socket_path, handler)
+    return ThreadingHTTPServer((host, port), handler)
+
+
+class PredictionError(Exception):
+    """The model failed on valid input; reported as server error instead of a bad request."""
+
+
+class PredictionRequestHandler(BaseHTTPRequestHandler):
+
+    # set by make_server()
+    batcher: MicroBatcher
+    decode: Decoder
+    labels: Optional[List[str]]
+    cache: Optional[PredictionCache]
+
+    def do_GET(self) -> None:
+        if self.path == '/stats':
+            self._send(200, self.batcher.stats.summary())
+        else:
+            self._send(404, {'error': 'Unknown path {}'.format(self.path)})
+
+    def do_POST(self) -> None:
+        if self.path != '/predict':
+            self._send(404, {'error': 'Unknown path {}'.format(self.path)})
+            return
+        try:
+            predictions = self._predict(self._image_sources())
+        except PredictionError as error:
+            self._send(500, {'error': str(error)})
+            return
+        except (OSError, ValueError, KeyError) as error:
+            self._send(400, {'error': str(error)})
+            return
+        response = {
+            'predictions': [prediction.tolist() for prediction in predictions]
+        }  # type: Dict[str, Any]
+        if self.labels:
+            response['labels'] = self.labels
+        self._send(200, response)
+
+    def address_string(self) -> str:
+        # Unix sockets have no client address
+        return str(self.client_address[0]) if self.client_address else 'unix socket'
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _predict(self, sources: List[Union[str, BinaryIO]]) -> List[numpy.ndarray]:
+        decode = type(self).decode
+        if self.cache is None:
+            return self._run_model([decode(source) for source in sources])
+        images = [_read(source) for source in sources]
+        hashes = [image_hash(image) for image in images]
+        cached = self.cache.get(hashes)
+        missing = {hash: image for hash, image in zip(hashes, images) if hash not in cached}
+        predicted = dict(
+            zip(missing, self._run_model([decode(BytesIO(image)) for image in missing.values()]))
+        )
+        if predicted:
+            self.cache.put(predicted)
+        return [cached[hash] if hash in cached else predicted[hash] for hash in hashes]
+
+    def _run_model(self, images: List[numpy.ndarray]) -> List[numpy.ndarray]:
+        try:
+            return self.batcher.predict(images)
+        except Exception as error:
+            raise PredictionError('Prediction failed: {}: {}'.format(type(error).__name__, error)) from error
+
+    def _image_sources(self) -> List[Union[str, BinaryIO]]:
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.headers.get('Content-Type', '').startswith('application/json'):
+            return list(json.loads(body.decode('utf-8'))['images'])
+        return [BytesIO(body)]
+
+    def _send(self, status: int, content: Dict[str, Any]) -> None:
+        body = json.dumps(content).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _read(source: Union[str, BinaryIO]) -> bytes:
+    if isinstance(source, str):
+        with open(source, 'rb') as file:
+            return file.read()
+    return source.read()
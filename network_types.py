@@ -1,75 +1,292 @@
-from typing import Tuple
+from typing import Any, Dict, Optional, Tuple
 
+from keras import backend as K
 from keras.applications import (
     InceptionV3, Xception, VGG16, VGG19, ResNet50, InceptionResNetV2, DenseNet121, DenseNet169, DenseNet201,
     NASNetLarge
 )
-from keras.layers import GlobalAveragePooling2D, Dense
+from keras.layers import GlobalAveragePooling2D, Dense, Input, Layer
 from keras.models import Model
 
+BACKBONES = {
+    'inception': InceptionV3,
+    'xception': Xception,
+    'vgg16': VGG16,
+    'vgg19': VGG19,
+    'resnet50': ResNet50,
+    'inception_resnet': InceptionResNetV2,
+    'densenet121': DenseNet121,
+    'densenet169': DenseNet169,
+    'densenet201': DenseNet201,
+    'nasnet': NASNetLarge,
+}
+
+# how the pixel values are normalized for each backbone, as in keras.applications.<network>.preprocess_input
+NORMALIZATIONS = {
+    InceptionV3: 'tf',
+    Xception: 'tf',
+    VGG16: 'caffe',
+    VGG19: 'caffe',
+    ResNet50: 'caffe',
+    InceptionResNetV2: 'tf',
+    DenseNet121: 'torch',
+    DenseNet169: 'torch',
+    DenseNet201: 'torch',
+    NASNetLarge: 'tf',
+}  # type: Dict[Any, str]
+
+CAFFE_MEAN = (103.939, 116.779, 123.68)
+TORCH_MEAN = (0.485, 0.456, 0.406)
+TORCH_STD = (0.229, 0.224, 0.225)
+
+
+class InputNormalization(Layer):  # type: ignore
+    """
+    First layer of a network taking uint8 images: converts the pixel values to float and normalizes
+    them inside the graph, so the images are kept as uint8 on the host.
+    Modes, as in keras.applications:
+    * 'tf': scaled to -1..1
+    * 'caffe': converted from RGB to BGR and centered on the ImageNet mean of every channel
+    * 'torch': scaled to 0..1 and standardized with the ImageNet mean and deviation of every channel
+    """
+
+    MODES = ('tf', 'caffe', 'torch')
+
+    def __init__(self, mode: str='tf', **kwargs: Any) -> None:
+        if mode not in self.MODES:
+            raise ValueError('Normalization mode must be one of {}, not {}'.format(self.MODES, mode))
+        super().__init__(**kwargs)
+        self.mode = mode
+
+    def call(self, inputs: Any) -> Any:
+        x = K.cast(inputs, 'float32')
+        if self.mode == 'tf':
+            return x / 127.5 - 1.
+        if self.mode == 'torch':
+            return (x / 255. - K.constant(TORCH_MEAN)) / K.constant(TORCH_STD)
+        return x[..., ::-1] - K.constant(CAFFE_MEAN)
+
+    def compute_output_shape(self, input_shape: Tuple[int, ...]) -> Tuple[int, ...]:
+        return input_shape
+
+    def get_config(self) -> Dict[str, Any]:
+        config = super().get_config()
+        config['mode'] = self.mode
+        return config
+
+
+# layers not part of Keras, needed to load a serialized model, e.g. with keras.models.model_from_json()
+CUSTOM_OBJECTS = {'InputNormalization': InputNormalization}
+
 
 def model(
-        network_type: Model, input_shape: Tuple[int, ...], classes: int, connected_layers: Tuple[int, ...]
+        network_type: Model, input_shape: Tuple[int, ...], classes: int, connected_layers: Tuple[int, ...],
+        weights: Optional[str]=None, uint8_input: bool=False
 ) -> Model:
-    base_model = network_type(include_top=False, weights=None, input_shape=input_shape, classes=classes)
+    """
+    :param network_type: Keras application, e.g. InceptionV3
+    :param input_shape: shape of the input images, e.g. (299, 299, 3)
+    :param classes: number of output classes
+    :param connected_layers: sizes of the additional fully connected layers
+    :param weights: weights for the network without the fully connected layers: None (random
+                    initialization), 'imagenet' or path to a weights file, e.g. a local copy of the
+                    ImageNet weights without top
+    :param uint8_input: If set, the model takes uint8 images and normalizes them as its first layer
+    :return: Model
+    """
+    inputs, base_model = _base_model(network_type, input_shape, weights, uint8_input)
 
     x = base_model.output
     # add a global spatial average pooling layer
     x = GlobalAveragePooling2D()(x)
+    predictions = _fully_connected_layers(x, classes, connected_layers)
+
+    return Model(inputs=inputs, outputs=predictions)
+
+
+def backbone(
+        network_type: Model, input_shape: Tuple[int, ...], weights: Optional[str]=None,
+        uint8_input: bool=False
+) -> Model:
+    """
+    The convolutional part of a network, without the fully connected layers, followed by global
+    average pooling. Its output are the bottleneck features the fully connected layers are trained on.
+    :param network_type: Keras application, e.g. InceptionV3
+    :param input_shape: shape of the input images, e.g. (299, 299, 3)
+    :param weights: None (random initialization), 'imagenet' or path to a weights file
+    :param uint8_input: If set, the model takes uint8 images and normalizes them as its first layer
+    :return: Model with one feature vector per image as output
+    """
+    inputs, base_model = _base_model(network_type, input_shape, weights, uint8_input)
+    return Model(inputs=inputs, outputs=GlobalAveragePooling2D()(base_model.output))
+
+
+def _base_model(
+        network_type: Model, input_shape: Tuple[int, ...], weights: Optional[str], uint8_input: bool
+) -> Tuple[Any, Model]:
+    """
+    Pretrained weights only work on images normalized like the images they were trained on, so the
+    network normalizes its input if it gets pretrained weights or uint8 images.
+    :return: the input of the network and the network without its top layers
+    """
+    if not uint8_input and weights is None:
+        base_model = network_type(include_top=False, weights=weights, input_shape=input_shape)
+        return base_model.input, base_model
+    inputs = Input(shape=input_shape, dtype='uint8' if uint8_input else 'float32')
+    normalized = InputNormalization(NORMALIZATIONS[network_type])(inputs)
+    return inputs, network_type(include_top=False, weights=weights, input_tensor=normalized)
+
+
+def normalizes_input(uint8_input: bool, weights: Optional[str]) -> bool:
+    """:return: whether a network built with these arguments normalizes its input itself"""
+    return uint8_input or weights is not None
+
+
+def head(num_features: int, classes: int, connected_layers: Tuple[int, ...]=(1024,)) -> Model:
+    """
+    The fully connected layers of a network on their own, trained on precomputed bottleneck features.
+    :param num_features: length of the bottleneck feature vectors
+    :param classes: number of output classes
+    :param connected_layers: sizes of the additional fully connected layers
+    :return: Model
+    """
+    features = Input(shape=(num_features,))
+    return Model(inputs=features, outputs=_fully_connected_layers(features, classes, connected_layers))
+
+
+def _fully_connected_layers(x: Any, classes: int, connected_layers: Tuple[int, ...]) -> Any:
     # add some fully-connected layers
     for layer_size in connected_layers:
         x = Dense(layer_size, activation='relu')(x)
     # and a logistic layer
-    predictions = Dense(classes, activation='softmax')(x)
+    return Dense(classes, activation='softmax')(x)
 
-    return Model(inputs=base_model.input, outputs=predictions)
 
-
-def inception(input_shape: Tuple[int, ...], classes: int, connected_layers: Tuple[int, ...]=(1024,)) -> Model:
-    return model(InceptionV3, input_shape, classes, connected_layers)
+def inception(
+        input_shape: Tuple[int, ...], classes: int, connected_layers: Tuple[int, ...]=(1024,),
+        weights: Optional[str]=None, uint8_input: bool=False
+) -> Model:
+    return model(InceptionV3, input_shape, classes, connected_layers, weights, uint8_input)
 
 
-def xception(input_shape: Tuple[int, ...], classes: int, connected_layers: Tuple[int, ...]=(1024,)) -> Model:
-    return model(Xception, input_shape, classes, connected_layers)
+def xception(
+        input_shape: Tuple[int, ...], classes: int, connected_layers: Tuple[int, ...]=(1024,),
+        weights: Optional[str]=None, uint8_input: bool=False
+) -> Model:
+    return model(Xception, input_shape, classes, connected_layers, weights, uint8_input)
 
 
-def vgg16(input_shape: Tuple[int, ...], classes: int, connected_layers: Tuple[int, ...]=(1024,)) -> Model:
-    return model(VGG16, input_shape, classes, connected_layers)
+def vgg16(
+        input_shape: Tuple[int, ...], classes: int, connected_layers: Tuple[int, ...]=(1024,),
+        weights: Optional[str]=None, uint8_input: bool=False
+) -> Model:
+    return model(VGG16, input_shape, classes, connected_layers, weights, uint8_input)
 
 
-def vgg19(input_shape: Tuple[int, ...], classes: int, connected_layers: Tuple[int, ...]=(1024,)) -> Model:
-    return model(VGG19, input_shape, classes, connected_layers)
+def vgg19(
+        input_shape: Tuple[int, ...], classes: int, connected_layers: Tuple[int, ...]=(1024,),
+        weights: Optional[str]=None, uint8_input: bool=False
+) -> Model:
+    return model(VGG19, input_shape, classes, connected_layers, weights, uint8_input)
 
 
-def resnet50(input_shape: Tuple[int, ...], classes: int, connected_layers: Tuple[int, ...]=(1024,)) -> Model:
-    return model(ResNet50, input_shape, classes, connected_layers)
+def resnet50(
+        input_shape: Tuple[int, ...], classes: int, connected_layers: Tuple[int, ...]=(1024,),
+        weights: Optional[str]=None, uint8_input: bool=False
+) -> Model:
+    return model(ResNet50, input_shape, classes, connected_layers, weights, uint8_input)
 
 
 def inception_resnet_v2(
-        input_shape: Tuple[int, ...], classes: int, connected_layers: Tuple[int, ...]=(1024,)
+        input_shape: Tuple[int, ...], classes: int, connected_layers: Tuple[int, ...]=(1024,),
+        weights: Optional[str]=None, uint8_input: bool=False
 ) -> Model:
-    return model(InceptionResNetV2, input_shape, classes, connected_layers)
+    return model(InceptionResNetV2, input_shape, classes, connected_layers, weights, uint8_input)
 
 
 def densenet121(
-        input_shape: Tuple[int, ...], classes: int, connected_layers: Tuple[int, ...]=(1024,)
+        input_shape: Tuple[int, ...], classes: int, connected_layers: Tuple[int, ...]=(1024,),
+        weights: Optional[str]=None, uint8_input: bool=False
 ) -> Model:
-    return model(DenseNet121, input_shape, classes, connected_layers)
+    return model(DenseNet121, input_shape, classes, connected_layers, weights, uint8_input)
 
 
 def densenet169(
-        input_shape: Tuple[int, ...], classes: int, connected_layers: Tuple[int, ...]=(1024,)
+        input_shape: Tuple[int, ...], classes: int, connected_layers: Tuple[int, ...]=(1024,),
+        weights: Optional[str]=None, uint8_input: bool=False
 ) -> Model:
-    return model(DenseNet169, input_shape, classes, connected_layers)
+    return model(DenseNet169, input_shape, classes, connected_layers, weights, uint8_input)
 
 
 def densenet201(
-        input_shape: Tuple[int, ...], classes: int, connected_layers: Tuple[int, ...]=(1024,)
+        input_shape: Tuple[int, ...], classes: int, connected_layers: Tuple[int, ...]=(1024,),
+        weights: Optional[str]=None, uint8_input: bool=False
 ) -> Model:
-    return model(DenseNet201, input_shape, classes, connected_layers)
+    return model(DenseNet201, input_shape, classes, connected_layers, weights, uint8_input)
 
 
 def nasnet(
-        input_shape: Tuple[int, ...], classes: int, connected_layers: Tuple[int, ...]=(1024,)
+        input_shape: Tuple[int, ...], classes: int, connected_layers: Tuple[int, ...]=(1024,),
+        weights: Optional[str]=None, uint8_input: bool=False
 ) -> Model:
-    return model(NASNetLarge, input_shape, classes, connected_layers)
+    return model(NASNetLarge, input_shape, classes, connected_layers, weights, uint8_input)
+
+
+def freeze_layers(model: Model, num_layers: Optional[int]=None, up_to: Optional[str]=None) -> int:
+    """
+    Exclude the first layers of a model from training. No gradients are computed for frozen layers,
+    which makes training considerably cheaper while the pretrained features stay intact.
+    :param model: Model whose layers are frozen
+    :param num_layers: number of layers to freeze, counted from the input
+    :param up_to: name of the last layer to freeze, or of a block of layers like "block3" in VGG16 or
+                  "mixed5" in InceptionV3, in which case all layers up to the end of the block are frozen
+    :return: number of frozen layers
+    :raises ValueError: if layers after the convolutional part of the network would be frozen
+    """
+    if up_to is not None:
+        num_layers = _last_layer_index(model, up_to) + 1
+    if not num_layers:
+        return 0
+    num_backbone_layers = _num_backbone_layers(model)
+    if num_layers > num_backbone_layers:
+        raise ValueError(
+            'Only the {} layers before the fully connected layers can be frozen, not {}'.format(
+                num_backbone_layers, num_layers
+            )
+        )
+    for layer in model.layers[:num_layers]:
+        layer.trainable = False
+    for layer in model.layers[num_layers:]:
+        layer.trainable = True
+    return num_layers
+
+
+def unfreeze_layers(model: Model) -> None:
+    """
+    Make all layers of a model trainable again, for fine tuning after the unfrozen layers are trained.
+    The model must be compiled again for the change to take effect.
+    """
+    for layer in model.layers:
+        layer.trainable = True
+
+
+def _num_backbone_layers(model: Model) -> int:
+    """:return: number of layers before the global average pooling the fully connected layers start with"""
+    pooling = [i for i, layer in enumerate(model.layers) if isinstance(layer, GlobalAveragePooling2D)]
+    if not pooling:
+        raise ValueError('{} has no convolutional layers which could be frozen'.format(model.name))
+    return pooling[-1]
+
+
+def _last_layer_index(model: Model, name: str) -> int:
+    """
+    :return: index of the layer called name, or else of the last layer of the block called name. In
+             InceptionV3 the layer "mixed9" ends its block, while "mixed9_1" belongs to block "mixed10".
+    """
+    names = [layer.name for layer in model.layers]
+    if name in names:
+        return names.index(name)
+    indices = [i for i, layer_name in enumerate(names) if layer_name.startswith(name + '_')]
+    if not indices:
+        raise ValueError('No layer or block named "{}" in {}'.format(name, model.name))
+    return indices[-1]
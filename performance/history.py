@@ -0,0 +1,298 @@
+"""
+Append-only history of benchmark results.
+
+Each line of the history file is one JSON object holding the result of one configuration in one sweep:
+the sweep it belongs to, the commit and host it ran on, library versions, the configuration, the test
+set accuracies and the run times.
+"""
+
+import json
+import platform
+import subprocess
+from datetime import datetime
+from os import cpu_count
+from os.path import abspath, dirname, isfile
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+Entry = Dict[str, Any]
+
+# what the run times measure; run times of entries with different versions are not compared
+#   1: fitting and saving the model
+#   2: fitting the model only
+TIMING_VERSION = 2
+
+
+class BenchmarkHistory:
+    """The benchmark history stored in a JSON lines file."""
+
+    def __init__(self, history_file: str) -> None:
+        self.history_file = history_file
+
+    def append(self, entries: Iterable[Entry]) -> None:
+        """
+        Add entries to the history. Existing entries are never changed.
+        :param entries: the new entries
+        :return: None
+        """
+        lines = ''.join(json.dumps(entry, sort_keys=True) + '\n' for entry in entries)
+        with open(self.history_file, 'a') as file:
+            file.write(lines)
+
+    def entries(self) -> List[Entry]:
+        if not isfile(self.history_file):
+            return []
+        with open(self.history_file) as file:
+            return [json.loads(line) for line in file if line.strip()]
+
+    def runs(self) -> List[str]:
+        """
+        :return: ids of all sweeps in the history, oldest first
+        """
+        return list(dict.fromkeys(entry['run'] for entry in self.entries()))
+
+    def run(self, run_id: str) -> List[Entry]:
+        return [entry for entry in self.entries() if entry['run'] == run_id]
+
+    def previous_run(self, run_id: str) -> Optional[str]:
+        """
+        :param run_id: id of a sweep in the history
+        :return: id of the latest sweep before it on the same host, None if there is none
+        """
+        entries = self.entries()
+        hosts = {entry['run']: entry['host'] for entry in entries}
+        runs = list(dict.fromkeys(entry['run'] for entry in entries))
+        earlier = runs[:runs.index(run_id)] if run_id in runs else []
+        same_host = [run for run in earlier if hosts[run] == hosts[run_id]]
+        return same_host[-1] if same_host else None
+
+
+def sweep_entries(sweep_results: Dict[str, Any], run_id: Optional[str]=None) -> List[Entry]:
+    """
+    Convert the JSON output of run_performance_analysis.py into history entries.
+    :param sweep_results: contents of the JSON output file
+    :param run_id: id of the sweep; generated from the current time and host if not set
+    :return: one entry per configuration
+    """
+    environment = current_environment()
+    run_id = run_id or '{:%Y%m%d-%H%M%S}-{}'.format(datetime.now(), environment['host'])
+    sweep = sweep_results['sweep']
+    return [
+        {
+            'run': run_id,
+            **environment,
+            'config': {
+                'algo': result['algo'], 'optimizer': result['optimizer'], 'size': result['size'],
+                'layers': result['layers'], 'batch_size': sweep['batch_size'], 'epochs': sweep['epochs'],
+                'likes_only': sweep['likes_only'], 'bottleneck': sweep['bottleneck'],
+                'backbone_weights': sweep['backbone_weights'],
+            },
+            'accuracies': result['accuracies'],
+            'wall_time': result['wall_time'],
+            'cpu_time': result['cpu_time'],
+            'images_per_second': _images_per_second(result),
+            'timing': TIMING_VERSION,
+        }
+        for result in sweep_results['results']
+    ]
+
+
+def current_environment() -> Dict[str, Any]:
+    """Commit, host and library versions the benchmarks run with."""
+    return {
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'host': platform.node(),
+        'cpu_count': cpu_count(),
+        'versions': {
+            'python': platform.python_version(),
+            **{module: _version(module) for module in ('tensorflow', 'keras', 'numpy')}
+        },
+    }
+
+
+def config_key(entry: Entry) -> str:
+    return json.dumps(entry['config'], sort_keys=True)
+
+
+class Regression(NamedTuple):
+    config: Dict[str, Any]
+    metric: str
+    baseline: float
+    current: float
+
+    def __str__(self) -> str:
+        config = self.config
+        return '{algo} {optimizer} {size} {layers}: {metric} {baseline:.4f} -> {current:.4f}'.format(
+            metric=self.metric, baseline=self.baseline, current=self.current, **config
+        )
+
+
+class Incomplete(NamedTuple):
+    config: Dict[str, Any]
+    reason: str
+
+    def __str__(self) -> str:
+        return '{algo} {optimizer} {size} {layers}: {reason}'.format(reason=self.reason, **self.config)
+
+
+def compare(
+        baseline: List[Entry], current: List[Entry], time_threshold: float=0.1,
+        accuracy_threshold: float=0.02
+) -> List[Regression]:
+    """
+    Find configurations which became slower or less accurate. Accuracies are compared after the same
+    number of epochs. Failed runs are not compared, see incomplete(), and run times only if they were
+    measured the same way.
+    :param baseline: entries of the sweep compared against
+    :param current: entries of the new sweep
+    :param time_threshold: relative increase of the run time per epoch above which a configuration is
+                           flagged, e.g. 0.1 for 10%
+    :param accuracy_threshold: absolute decrease of the test set accuracy above which a configuration
+                               is flagged
+    :return: the regressions found, for configurations which ran successfully in both sweeps
+    """
+    regressions = []  # type: List[Regression]
+    for previous, entry in _matching(baseline, current):
+        if failed(previous) or failed(entry):
+            continue
+        old_time, new_time = seconds_per_epoch(previous), seconds_per_epoch(entry)
+        comparable = _timing(previous) == _timing(entry)
+        if comparable and old_time and new_time and new_time > old_time * (1 + time_threshold):
+            regressions.append(Regression(entry['config'], 'seconds/epoch', old_time, new_time))
+        for epochs, old_accuracy, new_accuracy in zip(
+                entry['config']['epochs'], previous['accuracies'], entry['accuracies']
+        ):
+            if old_accuracy is None or new_accuracy is None:
+                continue
+            if new_accuracy < old_accuracy - accuracy_threshold:
+                regressions.append(
+                    Regression(entry['config'], f'accuracy ({epochs} epochs)', old_accuracy, new_accuracy)
+                )
+    return regressions
+
+
+def incomplete(baseline: List[Entry], current: List[Entry]) -> List[Incomplete]:
+    """
+    Find configurations of the baseline for which the new sweep has no results to compare.
+    :param baseline: entries of the sweep compared against
+    :param current: entries of the new sweep
+    :return: configurations missing from the new sweep, failed in it, or lacking accuracies the
+             baseline has
+    """
+    current_by_config = {config_key(entry): entry for entry in current}
+    result = []  # type: List[Incomplete]
+    for previous in baseline:
+        entry = current_by_config.get(config_key(previous))
+        if entry is None:
+            result.append(Incomplete(previous['config'], 'missing'))
+        elif failed(entry):
+            result.append(Incomplete(entry['config'], 'failed' if not failed(previous) else 'failed again'))
+        elif not failed(previous):
+            missing = [
+                epochs for epochs, old_accuracy, new_accuracy in zip(
+                    entry['config']['epochs'], previous['accuracies'], entry['accuracies']
+                ) if old_accuracy is not None and new_accuracy is None
+            ]
+            if missing:
+                result.append(
+                    Incomplete(entry['config'], 'no accuracy after {} epochs'.format(
+                        ', '.join(str(epochs) for epochs in missing)
+                    ))
+                )
+    return result
+
+
+def failed(entry: Entry) -> bool:
+    """Failed runs are stored with a wall time of 0 and accuracies of 0."""
+    return not entry['wall_time']
+
+
+def seconds_per_epoch(entry: Entry) -> Optional[float]:
+    """Wall clock time of the first step of the epoch schedule, per epoch; None for failed runs."""
+    if failed(entry):
+        return None
+    return entry['wall_time'] / entry['config']['epochs'][0]
+
+
+def render_markdown(history: BenchmarkHistory) -> str:
+    """
+    :return: Markdown document with the results of the latest sweep on every host
+    """
+    latest = {}  # type: Dict[str, str]
+    for run_id in history.runs():
+        latest[history.run(run_id)[0]['host']] = run_id
+    lines = ['Performance', '===========', '']
+    for host, run_id in sorted(latest.items()):
+        lines.extend(_run_table(host, history.run(run_id)))
+    return '\n'.join(lines)
+
+
+def _run_table(host: str, entries: List[Entry]) -> List[str]:
+    first = entries[0]
+    epochs = max((entry['config']['epochs'] for entry in entries), key=len)
+    versions = ', '.join('{} {}'.format(module, version) for module, version in first['versions'].items())
+    return [
+        '## {}'.format(host),
+        '',
+        'Commit {}, {}, {} CPUs, {}'.format(
+            (first['commit'] or 'unknown')[:10], first['time'], first['cpu_count'], versions
+        ),
+        '',
+        'Batch size {}{}'.format(
+            first['config']['batch_size'], ', likes only' if first['config']['likes_only'] else ''
+        ),
+        '',
+        '|Algorithm|Optimizer|Size|Extra layers|Run time/epoch|Images/s|{}|'.format(
+            '|'.join('Test set acc. ({} epochs)'.format(e) for e in epochs)
+        ),
+        '|:--------|:--------|---:|-----------:|-------------:|-------:|' + ':---|' * len(epochs),
+    ] + [_table_row(entry) for entry in entries] + ['']
+
+
+def _table_row(entry: Entry) -> str:
+    config = entry['config']
+    time_per_epoch = seconds_per_epoch(entry)
+    images_per_second = entry.get('images_per_second')
+    return '|{}|{}|{}|{}|{}|{}|{}|'.format(
+        config['algo'], config['optimizer'], config['size'], tuple(config['layers']),
+        '{:.2f}s'.format(time_per_epoch) if time_per_epoch else '---',
+        '{:.1f}'.format(images_per_second) if images_per_second else '---',
+        '|'.join(
+            '{:.4f}'.format(accuracy) if accuracy is not None else '-' for accuracy in entry['accuracies']
+        )
+    )
+
+
+def _matching(baseline: List[Entry], current: List[Entry]) -> List[Tuple[Entry, Entry]]:
+    baseline_by_config = {config_key(entry): entry for entry in baseline}
+    return [
+        (baseline_by_config[config_key(entry)], entry) for entry in current
+        if config_key(entry) in baseline_by_config
+    ]
+
+
+def _timing(entry: Entry) -> int:
+    """:return: TIMING_VERSION the run times of the entry were measured with"""
+    return entry.get('timing', 1)
+
+
+def _images_per_second(result: Dict[str, Any]) -> Optional[float]:
+    runs = [record for record in result.get('runs') or [] if record and record.get('images_per_second')]
+    return runs[0]['images_per_second'] if runs else None
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True,
+            cwd=dirname(abspath(__file__))
+        ).stdout.decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _version(module: str) -> Optional[str]:
+    try:
+        return __import__(module).__version__
+    except ImportError:
+        return None
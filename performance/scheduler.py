@@ -0,0 +1,357 @@
+"""
+Parallel execution of a hyperparameter sweep.
+
+The configuration grid is expanded into jobs which are stored in a queue folder:
+
+    <queue folder>/jobs/<job id>.json       job description
+    <queue folder>/claims/<job id>.json     host, process and start time of the worker running the job
+    <queue folder>/results/<job id>.json    result of the job
+    <queue folder>/failures/<job id>.json   errors of the failed attempts to run the job
+
+Workers claim a job by creating its claim file exclusively, so any number of workers on any number of
+hosts can share a queue folder on a shared filesystem. While a job runs, its worker touches the claim
+file regularly; claims which have not been touched for a while, or whose worker process on this host is
+gone, are taken over by other workers. Jobs which have a result are never run again, so an interrupted
+sweep is resumed by running it again with the same queue folder. Failed jobs are retried up to
+MAX_ATTEMPTS times; taking over a stale claim counts as an attempt as well, so a job which kills its
+worker, e.g. by running out of memory, is not tried forever. Jobs which failed MAX_ATTEMPTS times are
+only tried again if they are submitted with retry_failed.
+
+The job id contains a hash of the numbers of epochs and of the settings the network is trained with
+(see settings_key()), so a sweep with different epochs or different data does not reuse the results
+of an earlier sweep in the same queue folder, and workers only run jobs with their own settings.
+"""
+
+import hashlib
+import json
+import os
+import socket
+from datetime import datetime
+from multiprocessing import get_context
+from os import makedirs, remove, replace, scandir, utime
+from os.path import isfile, join, getmtime
+from threading import Event, Thread
+from time import time
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from utils.with_verbose import WithVerbose
+
+HEARTBEAT_SECONDS = 60
+STALE_SECONDS = 10 * HEARTBEAT_SECONDS
+THREAD_VARIABLES = ('OMP_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS', 'MKL_NUM_THREADS')
+MAX_ATTEMPTS = 3
+
+
+class Job(NamedTuple):
+    """One network configuration of a sweep, trained and evaluated after each of the numbers of epochs."""
+    size: int
+    layers: Tuple[int, ...]
+    algo: str
+    optimizer: str
+    epochs: Tuple[int, ...]
+    settings: str = ''
+
+    @property
+    def id(self) -> str:
+        return '{}_{}_{}_{}_{}'.format(
+            self.algo, self.optimizer, self.size, '-'.join(str(layer) for layer in self.layers),
+            _digest([list(self.epochs), self.settings])
+        )
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Job':
+        return cls(
+            data['size'], tuple(data['layers']), data['algo'], data['optimizer'], tuple(data['epochs']),
+            data.get('settings', '')
+        )
+
+
+def settings_key(engine_args: Dict[str, Any]) -> str:
+    """
+    :param engine_args: keyword arguments for the SweepEngine the jobs are run on
+    :return: short string identifying the settings
+    """
+    return _digest(engine_args)
+
+
+def grid_jobs(
+        sizes: Iterable[int], layers: Iterable[Tuple[int, ...]], algos: Iterable[str],
+        optimizers: Iterable[str], epochs: Tuple[int, ...], settings: str=''
+) -> List[Job]:
+    """
+    Expand a configuration grid into jobs, in the order run_performance_analysis reports them.
+    :param settings: settings the jobs are run with, see settings_key()
+    """
+    return [
+        Job(size, tuple(layer_sizes), algo, optimizer, tuple(epochs), settings)
+        for size in sizes for layer_sizes in layers for algo in algos for optimizer in optimizers
+    ]
+
+
+class JobQueue:
+    """Jobs, claims and results of a sweep, stored in a folder which may be shared between hosts."""
+
+    def __init__(self, folder: str) -> None:
+        """
+        :param folder: queue folder; created if not present
+        """
+        self.folder = folder
+        for subfolder in ('jobs', 'claims', 'results', 'failures'):
+            makedirs(join(folder, subfolder), exist_ok=True)
+
+    def submit(self, jobs: Iterable[Job], retry_failed: bool=False) -> None:
+        """
+        Add jobs to the queue. Jobs already in the queue, finished or not, are left as they are.
+        :param jobs: the jobs
+        :param retry_failed: If set, the failed attempts of the jobs are forgotten, so they get
+                             MAX_ATTEMPTS new attempts
+        :return: None
+        """
+        for job in jobs:
+            if not isfile(self._file('jobs', job)):
+                _write_json(self._file('jobs', job), job._asdict())
+            if retry_failed:
+                _remove(self._file('failures', job))
+
+    def jobs(self) -> List[Job]:
+        return sorted(
+            Job.from_dict(_read_json(entry.path)) for entry in scandir(join(self.folder, 'jobs'))
+            if entry.name.endswith('.json')
+        )
+
+    def claim(self, preferred_size: Optional[int]=None, settings: Optional[str]=None) -> Optional[Job]:
+        """
+        Claim a job which is neither finished nor run by another worker, and has not failed MAX_ATTEMPTS
+        times.
+        :param preferred_size: If set, jobs with this image size are claimed first, so the worker can
+                               keep using the images it decoded already
+        :param settings: If set, only jobs with these settings are claimed, see settings_key()
+        :return: the claimed job, or None if there is nothing left to do
+        """
+        pending = [
+            job for job in self.jobs() if settings in (None, job.settings) and self._is_pending(job)
+        ]
+        for job in sorted(pending, key=lambda job: job.size != preferred_size):
+            if self._try_claim(job):
+                return job
+        return None
+
+    def heartbeat(self, job: Job) -> None:
+        """Mark the claim on a job as alive."""
+        try:
+            utime(self._file('claims', job))
+        except FileNotFoundError:
+            pass
+
+    def complete(self, job: Job, result: Dict[str, Any]) -> None:
+        """
+        Store the result of a job and release its claim.
+        :param job: the finished job
+        :param result: JSON serializable result
+        :return: None
+        """
+        _write_json(self._file('results', job), result)
+        self.release(job)
+
+    def fail(self, job: Job, error: str) -> None:
+        """
+        Record a failed attempt to run a job and release its claim, so the job can be tried again.
+        :param job: the failed job
+        :param error: description of the error
+        :return: None
+        """
+        self._record_failure(job, error)
+        self.release(job)
+
+    def errors(self, job: Job) -> List[str]:
+        """:return: the errors of all failed attempts to run the job since it was last retried"""
+        failures_file = self._file('failures', job)
+        return _read_json(failures_file) if isfile(failures_file) else []
+
+    def release(self, job: Job) -> None:
+        _remove(self._file('claims', job))
+
+    def is_done(self, job: Job) -> bool:
+        return isfile(self._file('results', job))
+
+    def result(self, job: Job) -> Optional[Dict[str, Any]]:
+        return _read_json(self._file('results', job)) if self.is_done(job) else None
+
+    def _is_pending(self, job: Job) -> bool:
+        return not self.is_done(job) and len(self.errors(job)) < MAX_ATTEMPTS
+
+    def _try_claim(self, job: Job) -> bool:
+        claim_file = self._file('claims', job)
+        if isfile(claim_file) and self._is_stale(claim_file):
+            # the worker died while running the job, possibly because of the job. Two workers taking over
+            # the same stale claim at once may both record the attempt and run the job, which only costs
+            # time and an attempt: the result is the same
+            self._record_failure(job, 'Worker stopped: {}'.format(_describe_claim(claim_file)))
+            self.release(job)
+            if not self._is_pending(job):
+                return False
+        try:
+            descriptor = os.open(claim_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(descriptor, 'w') as file:
+            json.dump({'host': socket.gethostname(), 'pid': os.getpid(), 'started': time()}, file)
+        if self.is_done(job):
+            self.release(job)
+            return False
+        return True
+
+    @staticmethod
+    def _is_stale(claim_file: str) -> bool:
+        try:
+            if time() - getmtime(claim_file) > STALE_SECONDS:
+                return True
+            claim = _read_json(claim_file)
+        except (OSError, ValueError):
+            return False
+        return claim['host'] == socket.gethostname() and not _is_running(claim['pid'])
+
+    def _record_failure(self, job: Job, error: str) -> None:
+        _write_json(self._file('failures', job), self.errors(job) + [error])
+
+    def _file(self, subfolder: str, job: Job) -> str:
+        return join(self.folder, subfolder, job.id + '.json')
+
+
+class Scheduler(WithVerbose):
+    """Runs the jobs in a queue on a pool of local worker processes."""
+
+    def __init__(
+            self, queue: JobQueue, workers: int, threads_per_worker: Optional[int],
+            engine_args: Dict[str, Any], verbose: bool=False
+    ) -> None:
+        """
+        :param queue: the job queue
+        :param workers: number of worker processes
+        :param threads_per_worker: If set, number of threads each worker uses for computations
+        :param engine_args: keyword arguments for the SweepEngine the workers run the jobs on
+        :param verbose: If set, print status/progress information
+        """
+        WithVerbose.__init__(self, verbose)
+        self.queue = queue
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        self.engine_args = engine_args
+
+    def run(self, jobs: List[Job], retry_failed: bool=False) -> Dict[Job, Dict[str, Any]]:
+        """
+        Submit jobs and run workers until no job is left.
+        :param jobs: the jobs; they are run with the settings of this scheduler's engine_args
+        :param retry_failed: If set, jobs which failed MAX_ATTEMPTS times in earlier runs are tried again
+        :return: results of all finished jobs, failed jobs are left out
+        """
+        settings = settings_key(self.engine_args)
+        queued = {job: job._replace(settings=settings) for job in jobs}
+        self.queue.submit(queued.values(), retry_failed)
+        pending = len([job for job in queued.values() if not self.queue.is_done(job)])
+        self._print_status(f'{len(jobs)} jobs, {pending} pending, {self.workers} workers')
+        context = get_context('spawn')
+        processes = [
+            context.Process(
+                target=run_worker, args=(self.queue.folder, self.engine_args, self.verbose),
+                name='sweep-worker-{}'.format(i)
+            ) for i in range(self.workers)
+        ]
+        environment = dict(os.environ)
+        try:
+            # spawned processes inherit the environment at start, before they load TensorFlow
+            if self.threads_per_worker:
+                os.environ.update({name: str(self.threads_per_worker) for name in THREAD_VARIABLES})
+            for process in processes:
+                process.start()
+        finally:
+            os.environ.clear()
+            os.environ.update(environment)
+        for process in processes:
+            process.join()
+        for job in queued.values():
+            if not self.queue.is_done(job):
+                self._print_status(job.id, 'failed:', *self.queue.errors(job)[-1:])
+        return {
+            job: result for job, result in ((job, self.queue.result(queued[job])) for job in jobs) if result
+        }
+
+
+def run_worker(queue_folder: str, engine_args: Dict[str, Any], verbose: bool=False) -> int:
+    """
+    Run jobs from a queue until none is left.
+    :param queue_folder: folder of the job queue
+    :param engine_args: keyword arguments for the SweepEngine the jobs are run on
+    :param verbose: If set, print status/progress information
+    :return: number of jobs finished
+    """
+    from performance.sweep_engine import SweepEngine
+    queue = JobQueue(queue_folder)
+    settings = settings_key(engine_args)
+    engine = None  # type: Optional[SweepEngine]
+    done = 0
+    job = queue.claim(settings=settings)
+    while job is not None:
+        if engine is None:
+            engine = SweepEngine(**engine_args, verbose=verbose)
+        stop = Event()
+        Thread(target=_keep_alive, args=(queue, job, stop), daemon=True).start()
+        try:
+            result = engine.evaluate(job.size, job.layers, job.algo, job.optimizer, job.epochs)
+            queue.complete(job, {**result._asdict(), 'host': socket.gethostname()})
+            done += 1
+        except Exception as error:
+            WithVerbose.print_status(verbose, job.id, 'failed:', error)
+            queue.fail(job, '{}: {}'.format(type(error).__name__, error))
+        finally:
+            stop.set()
+        job = queue.claim(job.size, settings)
+    return done
+
+
+def _keep_alive(queue: JobQueue, job: Job, stop: Event) -> None:
+    while not stop.wait(HEARTBEAT_SECONDS):
+        queue.heartbeat(job)
+
+
+def _is_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _describe_claim(claim_file: str) -> str:
+    try:
+        claim = _read_json(claim_file)
+    except (OSError, ValueError):
+        return 'unknown worker'
+    return 'process {} on {}, started {}'.format(
+        claim['pid'], claim['host'], datetime.fromtimestamp(claim['started']).isoformat(timespec='seconds')
+    )
+
+
+def _digest(data: Any) -> str:
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+
+def _remove(file_name: str) -> None:
+    try:
+        remove(file_name)
+    except FileNotFoundError:
+        pass
+
+
+def _read_json(file_name: str) -> Any:
+    with open(file_name) as file:
+        return json.load(file)
+
+
+def _write_json(file_name: str, data: Any) -> None:
+    temp_file = '{}.{}-{}.tmp'.format(file_name, socket.gethostname(), os.getpid())
+    with open(temp_file, 'w') as file:
+        json.dump(data, file)
+    replace(temp_file, file_name)
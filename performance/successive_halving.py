@@ -0,0 +1,91 @@
+from os import remove
+from os.path import join
+from tempfile import TemporaryDirectory
+from typing import Dict, List
+
+from performance.scheduler import Job
+from performance.sweep_engine import SweepEngine, SweepResult, TrainingFailed
+from utils.with_verbose import WithVerbose
+
+DEFAULT_ETA = 3
+
+
+class SuccessiveHalving(WithVerbose):
+    """
+    Sweep strategy which spends most of the training time on the most promising configurations.
+    All configurations are trained for the first number of epochs of their schedule. After each step
+    of the schedule, only the best 1/eta of the configurations are trained on to the next number of
+    epochs. Configurations which can not be trained or whose training diverges drop out at once.
+    Models are kept between steps with the state of their optimizer, so a configuration is never
+    trained from scratch twice and trains as if it was trained in one go. The model of a configuration is
+    deleted as soon as the configuration drops out.
+    """
+
+    def __init__(self, engine: SweepEngine, eta: int=DEFAULT_ETA, verbose: bool=False) -> None:
+        """
+        :param engine: SweepEngine the configurations are trained on
+        :param eta: factor by which the number of configurations is reduced after every step
+        :param verbose: If set, print status/progress information
+        """
+        if eta < 2:
+            raise ValueError('eta must be at least 2, is {}'.format(eta))
+        WithVerbose.__init__(self, verbose)
+        self.engine = engine
+        self.eta = eta
+
+    def run(self, jobs: List[Job]) -> Dict[Job, SweepResult]:
+        """
+        :param jobs: configurations to compare, all with the same schedule of numbers of epochs
+        :return: results for all jobs; accuracies for steps a job did not reach are None, and failed
+                 jobs have accuracy 0 throughout
+        """
+        accuracies = {job: [None] * len(job.epochs) for job in jobs}  # type: Dict[Job, List]
+        times = {job: (0., 0.) for job in jobs}
+        remaining = list(jobs)
+        with TemporaryDirectory() as model_dir:
+            for step in range(len(jobs[0].epochs) if jobs else 0):
+                trained = []  # type: List[Job]
+                # jobs with the same image size in a row, so the decoded images are reused
+                for job in sorted(remaining, key=lambda job: job.size):
+                    try:
+                        result = self.engine.train(
+                            job.size, job.layers, job.algo, job.optimizer,
+                            job.epochs[step - 1] if step else 0, job.epochs[step], _model_file(model_dir, job)
+                        )
+                    except TrainingFailed as error:
+                        self._print_status(job.id, 'failed:', error)
+                        accuracies[job] = [0.] * len(job.epochs)
+                        continue
+                    accuracies[job][step] = result.accuracies[0]
+                    if not step:
+                        times[job] = (result.wall_time, result.cpu_time)
+                    trained.append(job)
+                remaining = self._best([job for job in jobs if job in trained], step, accuracies)
+                if step == len(jobs[0].epochs) - 1:
+                    remaining = []
+                for job in jobs:
+                    if job not in remaining:
+                        _remove(_model_file(model_dir, job))
+                self._print_status(
+                    f'{len(trained)} configurations trained for {jobs[0].epochs[step]} epochs, '
+                    f'{len(remaining)} continue'
+                )
+        return {job: SweepResult(accuracies[job], *times[job]) for job in jobs}
+
+    def _best(self, jobs: List[Job], step: int, accuracies: Dict[Job, List]) -> List[Job]:
+        if not jobs:
+            return []
+        # sorting is stable, so of equally good configurations the first ones in the grid continue
+        ranked = sorted(jobs, key=lambda job: -accuracies[job][step])
+        return ranked[:max(1, len(jobs) // self.eta)]
+
+
+def _model_file(model_dir: str, job: Job) -> str:
+    return join(model_dir, job.id + '.hdf5')
+
+
+def _remove(file_name: str) -> None:
+    try:
+        remove(file_name)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,218 @@
+from os.path import dirname
+from time import perf_counter
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy
+from keras import Model, backend
+from keras.callbacks import TerminateOnNaN
+from keras.models import load_model
+
+from acquisition.ebay_downloader_io import EbayDownloaderIO
+from data_sets.bottleneck_features import BottleneckFeatures
+from data_sets.ebay_data_generator import EbayDataGenerator, BatchGenerator
+from network_types import CUSTOM_OBJECTS, head
+from train import TrainingRunner, prepare_items, schedule_callbacks, MIN_TAG_NUM, DEFAULT_TEST_SET_SHARE
+from utils import phase_timer
+from utils.with_verbose import WithVerbose
+
+Size = Tuple[int, int]
+
+
+class SweepResult(NamedTuple):
+    """
+    Test set accuracies after each of the evaluated numbers of epochs, and the cost of the first step.
+    Accuracies for numbers of epochs a configuration was not trained for are None.
+    """
+    accuracies: List[Optional[float]]
+    wall_time: float
+    cpu_time: float
+
+
+class TrainingFailed(Exception):
+    """A network configuration can not be trained, or its training diverged."""
+
+
+class SweepEngine(WithVerbose):
+    """
+    Trains and evaluates many network configurations on the same item set in a single process. Items
+    are loaded and tagged once, the images are decoded once per image size and kept in memory as uint8
+    arrays, and every model is trained on through all evaluated numbers of epochs instead of being
+    restarted and reloaded for each of them.
+    """
+
+    def __init__(
+            self, item_file: str, batch_size: int, likes_only: bool=False,
+            min_valid_tag: int=MIN_TAG_NUM, test_share: float=DEFAULT_TEST_SET_SHARE,
+            random_seed: int=0, bottleneck: bool=False, backbone_weights: Optional[str]=None,
+            verbose: bool=False
+    ) -> None:
+        """
+        :param item_file: pickle file containing the downloaded items
+        :param batch_size: batch size used in fitting the models
+        :param likes_only: If set, only train against likes
+        :param min_valid_tag: minimum number of times a tag has to occur to be considered valid
+        :param test_share: share of the data used as test set
+        :param random_seed: random seed used in the train-test split
+        :param bottleneck: If set, only train the fully connected layers, on cached bottleneck features
+        :param backbone_weights: weights for the networks without the fully connected layers, needed
+                                 with bottleneck
+        :param verbose: If set, print status/progress information
+        """
+        if bottleneck and not backbone_weights:
+            raise ValueError('Bottleneck features need pretrained backbone weights')
+        WithVerbose.__init__(self, verbose)
+        self.io = EbayDownloaderIO(dirname(item_file) or '.', items_file=item_file, verbose=verbose)
+        self.batch_size = batch_size
+        self.test_share = test_share
+        self.random_seed = random_seed
+        self.bottleneck = bottleneck
+        self.backbone_weights = backbone_weights
+        self.items, self.valid_tags = prepare_items(
+            self.io.load_items(), min_valid_tag, likes_only, None, verbose
+        )
+        self._size = None  # type: Optional[Size]
+        self._image_data = None  # type: Optional[EbayDataGenerator]
+        self._decoded = {}  # type: Dict[str, Tuple[numpy.ndarray, numpy.ndarray]]
+
+    def evaluate(
+            self, size: int, layers: Tuple[int, ...], algo: str, optimizer: str, epochs: Tuple[int, ...]
+    ) -> SweepResult:
+        """
+        Train one network configuration, evaluating it on the test set whenever it has been trained for
+        one of the given numbers of epochs.
+        :param size: width and height the images are scaled to
+        :param layers: sizes of the fully connected layers
+        :param algo: network type, one of TrainingRunner.NETWORK_TYPES
+        :param optimizer: name of the optimizer used to fit the model
+        :param epochs: increasing numbers of epochs after which the model is evaluated
+        :return: SweepResult; all accuracies are 0 if the configuration could not be trained
+        """
+        self._use_size((size, size))
+        try:
+            (train_x, train_y), test_data = self._inputs(algo)
+            model = self._compiled_model(algo, train_x.shape[1:], layers, optimizer)
+            accuracies = []  # type: List[Optional[float]]
+            wall_time, cpu_time = 0., 0.
+            for i, num_epochs in enumerate(epochs):
+                start_wall, start_cpu = perf_counter(), phase_timer.cpu_time()
+                self._fit(model, train_x, train_y, epochs[i - 1] if i else 0, num_epochs)
+                if not i:
+                    wall_time, cpu_time = perf_counter() - start_wall, phase_timer.cpu_time() - start_cpu
+                accuracies.append(self._accuracy(model, *test_data))
+                self._print_status(f'{algo} {optimizer} {size} {layers}: {num_epochs} epochs', accuracies[-1])
+            return SweepResult(accuracies, wall_time, cpu_time)
+        except TrainingFailed as error:
+            self._print_status(f'{algo} {optimizer} {size} {layers} failed:', error)
+            return SweepResult([0.] * len(epochs), 0., 0.)
+        finally:
+            backend.clear_session()
+
+    def train(
+            self, size: int, layers: Tuple[int, ...], algo: str, optimizer: str, initial_epoch: int,
+            epochs: int, model_file: str
+    ) -> SweepResult:
+        """
+        Train one network configuration from initial_epoch to epochs, continuing from the model stored
+        in model_file by the previous call, and evaluate it on the test set. The model is stored with the
+        state of its optimizer, so training in several calls gives the same result as in one.
+        :param size: width and height the images are scaled to
+        :param layers: sizes of the fully connected layers
+        :param algo: network type, one of TrainingRunner.NETWORK_TYPES
+        :param optimizer: name of the optimizer used to fit the model
+        :param initial_epoch: number of epochs the model is already trained for; 0 to start anew
+        :param epochs: number of epochs the model is trained for after this call
+        :param model_file: HDF5 file the model is loaded from and saved to
+        :return: SweepResult with the test set accuracy and the time spent fitting the model
+        :raise TrainingFailed: if the configuration can not be trained or its training diverges
+        """
+        self._use_size((size, size))
+        try:
+            (train_x, train_y), test_data = self._inputs(algo)
+            if initial_epoch:
+                model = self._load_model(model_file)
+            else:
+                model = self._compiled_model(algo, train_x.shape[1:], layers, optimizer)
+            start_wall, start_cpu = perf_counter(), phase_timer.cpu_time()
+            self._fit(model, train_x, train_y, initial_epoch, epochs)
+            wall_time, cpu_time = perf_counter() - start_wall, phase_timer.cpu_time() - start_cpu
+            model.save(model_file)
+            return SweepResult([self._accuracy(model, *test_data)], wall_time, cpu_time)
+        finally:
+            backend.clear_session()
+
+    def _use_size(self, size: Size) -> None:
+        if size == self._size:
+            return
+        self._size = size
+        self._decoded = {}
+        self._image_data = EbayDataGenerator(
+            self.items, self.valid_tags, size, test_share=self.test_share, batch_size=self.batch_size,
+            random_seed=self.random_seed, verbose=self.verbose
+        )
+
+    def _inputs(self, algo: str) -> Tuple[Tuple[numpy.ndarray, numpy.ndarray], ...]:
+        assert self._image_data is not None
+        data_sets = (self._image_data.train, self._image_data.test)
+        if not self.bottleneck:
+            return tuple(self._decode(name, data_set) for name, data_set in zip(('train', 'test'), data_sets))
+        features = BottleneckFeatures(
+            self._image_data, algo, self.backbone_weights, self.io.base_dir, verbose=self.verbose
+        )
+        return tuple(
+            (
+                features.features([image_file for _, image_file in data_set.chunks]),
+                self._image_data.labels_for_batch([data_set.chunks], 0)
+            ) for data_set in data_sets
+        )
+
+    def _decode(self, name: str, data_set: BatchGenerator) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        if name not in self._decoded:
+            assert self._image_data is not None
+            self._print_status(f'Decoding {len(data_set.chunks)} {name} images, size {self._size}')
+            self._decoded[name] = (
+                self._image_data.images_for_batch([data_set.chunks], 0),
+                self._image_data.labels_for_batch([data_set.chunks], 0)
+            )
+        return self._decoded[name]
+
+    def _compiled_model(
+            self, algo: str, input_shape: Tuple[int, ...], layers: Tuple[int, ...], optimizer: str
+    ) -> Model:
+        try:
+            model = self._build_model(algo, input_shape, layers)
+            model.compile(loss=TrainingRunner.LOSS_FUNCTION, optimizer=optimizer, metrics=['accuracy'])
+        except (ValueError, MemoryError) as error:
+            raise TrainingFailed(str(error)) from error
+        return model
+
+    @staticmethod
+    def _load_model(model_file: str) -> Model:
+        try:
+            return load_model(model_file, custom_objects=CUSTOM_OBJECTS)
+        except (OSError, ValueError) as error:
+            raise TrainingFailed('Can not continue from {}: {}'.format(model_file, error)) from error
+
+    def _build_model(self, algo: str, input_shape: Tuple[int, ...], layers: Tuple[int, ...]) -> Model:
+        assert self._image_data is not None
+        if self.bottleneck:
+            return head(input_shape[0], self._image_data.num_classes, layers)
+        return TrainingRunner.decode_network_name(algo)(
+            input_shape=input_shape, classes=self._image_data.num_classes, connected_layers=layers,
+            weights=self.backbone_weights
+        )
+
+    def _fit(
+            self, model: Model, images: numpy.ndarray, labels: numpy.ndarray, initial_epoch: int, epochs: int
+    ) -> None:
+        try:
+            history = model.fit(
+                images, labels, batch_size=self.batch_size, initial_epoch=initial_epoch, epochs=epochs,
+                callbacks=[TerminateOnNaN(), *schedule_callbacks(self.verbose)], verbose=self.verbose
+            )
+        except (ValueError, MemoryError) as error:
+            raise TrainingFailed(str(error)) from error
+        if not numpy.all(numpy.isfinite(history.history.get('loss', []))):
+            raise TrainingFailed('Loss is not finite')
+
+    def _accuracy(self, model: Model, images: numpy.ndarray, labels: numpy.ndarray) -> float:
+        return float(model.evaluate(images, labels, batch_size=self.batch_size, verbose=self.verbose)[1])
@@ -1,5 +1,6 @@
+import json
 from argparse import ArgumentParser, Namespace
-from typing import List
+from typing import Any, BinaryIO, Iterator, List, Optional, Union
 
 import numpy
 from keras import Model
@@ -7,56 +8,126 @@ from PIL import Image
 from pprint import pprint
 
 from acquisition.ebay_downloader_io import EbayDownloaderIO
-from data_sets.contains_images import ContainsImages
+from acquisition.ebay_shopping_api import EbayShoppingAPI
+from acquisition.shopping_api import ShoppingApi
+from inference.bulk_scorer import BulkScorer
+from inference.export import TFLiteModel
+from inference.item_pipeline import ItemPrediction, ItemPredictionPipeline
+from inference.model_bundle import ModelBundle
+from inference.prediction_cache import PredictionCache, model_fingerprint
+from data_sets.contains_images import RESIZE_METHODS, ContainsImages, add_border
+from data_sets.labeled_items import top_labels
 from utils.with_verbose import WithVerbose
 from train import TrainingRunner
+from network_types import CUSTOM_OBJECTS
 
 SAVE_FOLDER = 'data'
 DEFAULT_SIZE = 139
+BATCH_SIZE = 32
 
 
 def parse_command_line() -> Namespace:
     parser = ArgumentParser(
         description="Train neural networks recognizing style from liked eBay items"
     )
+    add_model_arguments(parser)
     parser.add_argument(
-        '--verbose', '-v', action='store_true', help="Print info about extracted tags"
+        '--images-file', default=None, help='Pickle file from which to load precomputed image data set'
     )
     parser.add_argument(
-        '--save-folder', default=SAVE_FOLDER,
-        help='Folder under which to store items, images and weights'
+        '--demo', type=int, default=0, help='Number of images to try to predict as demo'
     )
     parser.add_argument(
-        '--weights-file', '-w', default=None, help='HDF5 file from which to load precomputed set of weights'
+        '--predict-image', action='append',
+        help='Image which is evaluated'
     )
     parser.add_argument(
-        '--images-file', default=None, help='Pickle file from which to load precomputed image data set'
+        '--predict-item-url', action='append',
+        help='URL of eBay item which is evaluated'
     )
     parser.add_argument(
-        '--image-size', '-s', type=int, default=DEFAULT_SIZE,
-        help='Size (both width and height) to which images are resized'
+        '--ebay-auth-file', default='ebay_auth.json',
+        help="JSON file containing the eBay authorization IDs, needed to look up items"
     )
     parser.add_argument(
-        '--demo', type=int, default=0, help='Number of images to try to predict as demo'
+        '--ebay-site_id', type=int, default=77, help="eBay site ID (77 for Germany)"
     )
     parser.add_argument(
-        '--predict-image', action='append',
-        help='Image which is evaluated'
+        '--batch-size', type=int, default=BATCH_SIZE, help='Number of pictures of items predicted at once'
     )
+    add_cache_argument(parser)
+
+    return parser.parse_args()
+
+
+def add_cache_argument(parser: ArgumentParser) -> None:
     parser.add_argument(
-        '--predict-item-url', action='append',
-        help='URL of eBay item which is evaluated'
+        '--prediction-cache', default=None,
+        help='SQLite file in which predictions are cached, so pictures predicted before by the same model '
+             'are not predicted again'
+    )
+
+
+def prediction_cache(predictor: 'Predictor', cache_file: Optional[str]) -> Optional[PredictionCache]:
+    return PredictionCache(cache_file, predictor.fingerprint()) if cache_file else None
+
+
+def add_model_arguments(parser: ArgumentParser) -> None:
+    """Add the command line options needed to set up a Predictor to parser."""
+    parser.add_argument(
+        '--verbose', '-v', action='store_true', help="Print info about extracted tags"
+    )
+    parser.add_argument(
+        '--save-folder', default=SAVE_FOLDER,
+        help='Folder under which to store items, images and weights'
+    )
+    parser.add_argument(
+        '--weights-file', '-w', default=None, help='HDF5 file from which to load precomputed set of weights'
+    )
+    parser.add_argument(
+        '--image-size', '-s', type=int, default=DEFAULT_SIZE,
+        help='Size (both width and height) to which images are resized'
     )
     parser.add_argument(
         '--type', default='inception', help='Type of neural network used',
         choices=list(TrainingRunner.NETWORK_TYPES.keys())
     )
+    parser.add_argument(
+        '--model-bundle', default=None,
+        help='Use the model bundle saved by train.py next to the weights file (<weights file>.bundle); '
+             'network type, image size and labels are taken from the bundle'
+    )
+    parser.add_argument(
+        '--tflite-model', default=None,
+        help='Use this model exported with export_model.py instead of the network given by --type and '
+             '--weights-file; the image size is taken from the model'
+    )
 
-    return parser.parse_args()
+
+def predict_items(
+        predictor: 'Predictor', api: ShoppingApi, item_urls: List[str], batch_size: int=BATCH_SIZE,
+        cache: Optional[PredictionCache]=None
+) -> Iterator[ItemPrediction]:
+    """
+    Look up eBay items, download their pictures and predict them.
+    :param predictor: Predictor running the model
+    :param api: API the items are looked up with
+    :param item_urls: URLs of the items
+    :param batch_size: number of pictures predicted at once
+    :param cache: if set, pictures predicted before are taken from this cache instead of the model
+    :return: the mean prediction of the pictures of every item, in the order of item_urls
+    """
+    scorer = BulkScorer(
+        predictor.model.predict_on_batch, predictor.decode_image, batch_size, labels=predictor.labels,
+        cache=cache, verbose=predictor.verbose
+    )
+    return ItemPredictionPipeline(api, scorer, verbose=predictor.verbose).predict(item_urls)
 
 
-def get_items(item_urls: List[str]) -> None:
-    pass
+def ebay_api(auth_file: str, site_id: int) -> ShoppingApi:
+    with open(auth_file) as file:
+        auth = json.load(file)
+    return EbayShoppingAPI(auth['production'], site_id, debug=False)
 
 
 class Predictor(WithVerbose, ContainsImages):
@@ -67,9 +138,24 @@ class Predictor(WithVerbose, ContainsImages):
         )
         self.verbose = args.verbose
         self.size = (args.image_size, args.image_size)
-        self.demo = args.demo
         self.neural_network_type = TrainingRunner.decode_network_name(args.type)
-        self.model = self.setup_model()
+        self.tflite_model = args.tflite_model
+        self.model_bundle = args.model_bundle
+        self.labels = None  # type: Optional[List[str]]
+        self.resize_method = add_border
+        if self.tflite_model:
+            self.model = TFLiteModel(self.tflite_model)  # type: Any
+            self.size = self.model.image_size
+            self._print_status('Loaded', self.tflite_model)
+        elif self.model_bundle:
+            bundle = ModelBundle.load(self.model_bundle, CUSTOM_OBJECTS)
+            self.model = bundle.model
+            self.size = bundle.image_size
+            self.labels = bundle.labels
+            self.resize_method = RESIZE_METHODS[bundle.preprocessing['resize']]
+            self._print_status('Loaded', self.model_bundle)
+        else:
+            self.model = self.setup_model()
 
     def setup_model(self, loss_function: str='mean_squared_error', optimizer: str='sgd') -> Model:
         model = self.neural_network_type(
@@ -81,23 +167,48 @@ class Predictor(WithVerbose, ContainsImages):
         self.io.load_weights(model)
         return model
 
+    def fingerprint(self) -> str:
+        """
+        :return: string identifying architecture, weights and image size of the model, see PredictionCache
+        """
+        if self.tflite_model:
+            return model_fingerprint('tflite', self.tflite_model, self.size)
+        if self.model_bundle:
+            weights_file = ModelBundle.weights_file(self.model_bundle)
+            return model_fingerprint(self.model.to_json(), weights_file, self.size)
+        return model_fingerprint(self.model.to_json(), self.io.weights_file(), self.size)
+
+    def decode_image(self, image: Union[str, BinaryIO]) -> numpy.ndarray:
+        """
+        :param image: image file or file-like object containing an image
+        :return: the image data as input for the model
+        """
+        with Image.open(image) as opened:
+            return self.downscale(opened.convert('RGB'), self.resize_method)
+
     def predict(self, image_files: List[str]) -> None:
-        images = numpy.asarray([self.downscale(Image.open(file).convert('RGB')) for file in image_files])
+        images = numpy.asarray([self.decode_image(file) for file in image_files])
         for image in images:
             self.show_image(image)
         predictions = self.model.predict(images, batch_size=len(images), verbose=1)
-        for prediction in predictions:
-            # pprint(
-            #     [
-            #         (label, prob)
-            #         for label, prob in image_data.labels_sorted_by_probability(prediction).items()
-            #         if prob > 0.01
-            #     ]
-            # )
-            pprint(prediction)
+        if self.labels:
+            for labels in top_labels(predictions, self.labels):
+                pprint(labels)
+        else:
+            for prediction in predictions:
+                pprint(prediction)
 
 
 if __name__ == '__main__':
     args = parse_command_line()
     predictor = Predictor(args)
-    predictor.predict(args.predict_image)
+    if args.predict_image:
+        predictor.predict(args.predict_image)
+    if args.predict_item_url:
+        api = ebay_api(args.ebay_auth_file, args.ebay_site_id)
+        cache = prediction_cache(predictor, args.prediction_cache)
+        for result in predict_items(predictor, api, args.predict_item_url, args.batch_size, cache):
+            if result.prediction is None:
+                print(result.url, 'failed:', result.error)
+            else:
+                print(result.url, result.item.title if result.item else '', result.prediction.tolist())
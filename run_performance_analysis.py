@@ -1,8 +1,10 @@
+import json
+import sys
 from argparse import ArgumentParser, Namespace
-from typing import Any, Callable, Tuple, List
+from typing import Any, Callable, Dict, Tuple, List, Optional, Sequence
 
-from os import makedirs, remove
-from os.path import isfile
+from os import makedirs, remove, replace
+from os.path import dirname, isfile
 from subprocess import run, PIPE
 
 makedirs('log', exist_ok=True)
@@ -27,6 +29,8 @@ LAYERS = (
 
 ITEM_FILE = 'data/items_liked_unliked_equal.pickle'
 OUTPUT_FILE = 'perf.md'
+JSON_OUTPUT_FILE = 'perf.json'
+QUEUE_DIR = 'log/sweep-queue'
 
 
 def read_tuple(
@@ -56,6 +60,15 @@ def parse_command_line() -> Namespace:
     )
     parser.add_argument('--item-file', type=str, default=ITEM_FILE)
     parser.add_argument('--output-file', type=str, default=OUTPUT_FILE)
+    parser.add_argument(
+        '--json-output-file', type=str, default=JSON_OUTPUT_FILE,
+        help=f"File to which the configurations and detailed results are written as JSON "
+             f"(default: {JSON_OUTPUT_FILE})"
+    )
+    parser.add_argument(
+        '--history-file', type=str, default=None,
+        help="If set, benchmark history (see benchmark_history.py) the results are added to"
+    )
     parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
     parser.add_argument('--likes-only', action='store_true')
     parser.add_argument(
@@ -78,23 +91,76 @@ def parse_command_line() -> Namespace:
         '--layers', type=read_tuple(read_tuple(int), delimiter='/'), default=LAYERS,
         help=f"List of evaluated fully connected layers (default: {layers_string(LAYERS)})"
     )
-    return parser.parse_args()
+    parser.add_argument(
+        '--bottleneck', action='store_true',
+        help="Only train the fully connected layers, on cached features of the fixed networks"
+    )
+    parser.add_argument(
+        '--backbone-weights', default=None,
+        help="Weights for the networks without the fully connected layers ('imagenet' or a weights file)"
+    )
+    parser.add_argument(
+        '--image-processes', type=int, default=None,
+        help="Number of processes used to precompute the scaled images (default: number of CPUs)"
+    )
+    parser.add_argument(
+        '--in-process', action='store_true',
+        help="Train all configurations in this process, loading items and images only once per size"
+    )
+    parser.add_argument(
+        '--strategy', choices=('grid', 'halving'), default='grid',
+        help="grid: train every configuration for all numbers of epochs; halving: after each number of "
+             "epochs, only train the best configurations on (successive halving, runs in this process)"
+    )
+    parser.add_argument(
+        '--eta', type=int, default=3,
+        help="With --strategy halving, the share 1/eta of the configurations continues after each step"
+    )
+    parser.add_argument(
+        '--workers', type=int, default=None,
+        help="Run the configurations in this many parallel worker processes, using a job queue which "
+             "workers on other hosts can share"
+    )
+    parser.add_argument(
+        '--threads-per-worker', type=int, default=None,
+        help="Maximum number of computation threads per worker process"
+    )
+    parser.add_argument(
+        '--queue-dir', default=QUEUE_DIR,
+        help=f"Job queue folder, on a shared filesystem to distribute a sweep over several hosts. "
+             f"Finished jobs are not run again. (default: {QUEUE_DIR})"
+    )
+    parser.add_argument(
+        '--retry-failed', action='store_true',
+        help="Try jobs in the queue again which failed too often in earlier runs"
+    )
+    args = parser.parse_args()
+    if args.strategy == 'halving' and args.workers:
+        parser.error('--strategy halving runs in this process and can not be combined with --workers')
+    if args.bottleneck and not args.backbone_weights:
+        parser.error('--bottleneck needs --backbone-weights')
+    return args
 
 
-def time_string(time_line):
-    string = time_line[0:time_line.find('elapsed') + len('elapsed')]
-    user = float(string[0:string.find('user')])
-    sys = float(string[string.find('user') + len('user '):string.find('system')])
-    wall = string[string.find('system') + len('system '):string.find('elapsed')]
-    return f'{wall} wall, {user + sys:7.2f}s CPU'
+def run_time_string(wall_time: float, cpu_time: float) -> str:
+    minutes, seconds = divmod(wall_time, 60)
+    return f'{int(minutes)}:{seconds:05.2f} wall, {cpu_time:7.2f}s CPU'
 
 
 def training_run(
         epochs: int, weights_file: str, size: int, layers: Tuple[int, ...], algo: str,
-        optimizer: str, item_file: str, batch_size: int, likes_only: bool
-) -> Tuple[float, str]:
+        optimizer: str, item_file: str, batch_size: int, likes_only: bool, bottleneck: bool=False,
+        backbone_weights: Optional[str]=None
+) -> Optional[Dict[str, Any]]:
+    """
+    Run train.py for one configuration.
+    :return: the results record train.py writes, or None if the run failed
+    """
+    results_file = weights_file + '.json'
+    if isfile(results_file):
+        remove(results_file)
     command = [
-        'nice', 'time', 'python', 'train.py',
+        'nice', 'python', 'train.py',
         '--type', algo,
         '--optimizer', optimizer,
         '--num-epochs', str(epochs),
@@ -106,27 +172,28 @@ def training_run(
         '--batch-size', str(batch_size),
         '--test',
         '--random-seed', '0',
+        '--results-file', results_file,
         '-v'
     ]
     if likes_only:
         command.append('--likes-only')
+    if bottleneck:
+        command.append('--bottleneck')
+    if backbone_weights:
+        command.extend(['--backbone-weights', backbone_weights])
 
     result = run(
         command,
         stdout=PIPE, stderr=PIPE
     )
-    stdout = result.stdout.decode('utf-8').split('\n')
-    stderr = result.stderr.decode('utf-8').split('\n')
-    try:
-        accuracy_line = stdout[-4]
-        test_set_accuracy = float(
-            accuracy_line[
-                accuracy_line.find('test set accuracy: ') + len('test set accuracy: '):-1
-            ]
+    if result.returncode or not isfile(results_file):
+        print(
+            f'{algo} {optimizer} {size} {layers} failed with exit code {result.returncode}:',
+            *result.stderr.decode('utf-8').split('\n')[-5:], sep='\n', file=sys.stderr
         )
-        return test_set_accuracy, time_string(stderr[-3])
-    except (IndexError, ValueError):
-        return 0, '---'
+        return None
+    with open(results_file) as file:
+        return json.load(file)
 
 
 def current_num_epochs(epochs: Tuple[int, ...], current_epoch: int) -> int:
@@ -136,42 +203,159 @@ def current_num_epochs(epochs: Tuple[int, ...], current_epoch: int) -> int:
 
 def evaluate(
         size: int, layers: Tuple[int, ...], algo: str, optimizer: str, epochs: Tuple[int, ...],
-        item_file: str, batch_size: int, likes_only: bool
-) -> str:
+        item_file: str, batch_size: int, likes_only: bool, bottleneck: bool=False,
+        backbone_weights: Optional[str]=None
+) -> Dict[str, Any]:
+    """
+    Train one configuration in a train.py process per number of epochs, each continuing from the
+    weights the previous one saved.
+    :return: test set accuracies, run time of the first step and the records of all train.py runs
+    """
     weights_file = f'/tmp/{algo}_{size}_{layers}.hdf5'
     if isfile(weights_file):
         remove(weights_file)
 
-    test_set_accuracy = []
-    total_run_time = ""
+    runs = []  # type: List[Optional[Dict[str, Any]]]
     for e in epochs:
-        accuracy, run_time = training_run(
-            current_num_epochs(epochs, e), weights_file, size, layers, algo, optimizer,
-            item_file, batch_size, likes_only
+        runs.append(
+            training_run(
+                current_num_epochs(epochs, e), weights_file, size, layers, algo, optimizer,
+                item_file, batch_size, likes_only, bottleneck, backbone_weights
+            )
         )
-        test_set_accuracy.append(accuracy)
-        total_run_time = run_time if not total_run_time else total_run_time
 
-    return f'|{algo:18}|{optimizer:8}|{size}|{layers}|{total_run_time}|' + \
-           '|'.join([f'{acc:.4f}' for acc in test_set_accuracy]) + '|\n'
+    first_training = runs[0]['phases'].get('run_training', {}) if runs[0] else {}
+    return {
+        'accuracies': [record['test']['accuracy'] if record and record['test'] else 0. for record in runs],
+        'wall_time': first_training.get('wall', 0.),
+        'cpu_time': first_training.get('cpu', 0.),
+        'runs': runs
+    }
+
+
+def evaluate_in_process(
+        engine: Any, size: int, layers: Tuple[int, ...], algo: str, optimizer: str, epochs: Tuple[int, ...]
+) -> Dict[str, Any]:
+    return engine.evaluate(size, layers, algo, optimizer, epochs)._asdict()
+
+
+def result_row(size: int, layers: Tuple[int, ...], algo: str, optimizer: str, result: Dict[str, Any]) -> str:
+    run_time = run_time_string(result['wall_time'], result['cpu_time']) if result['wall_time'] else '---'
+    return table_row(size, layers, algo, optimizer, run_time, result['accuracies'])
+
+
+def table_row(
+        size: int, layers: Tuple[int, ...], algo: str, optimizer: str, run_time: str,
+        test_set_accuracy: Sequence[Optional[float]]
+) -> str:
+    return f'|{algo:18}|{optimizer:8}|{size}|{layers}|{run_time}|' + \
+           '|'.join([f'{acc:.4f}' if acc is not None else '-' for acc in test_set_accuracy]) + '|\n'
+
+
+def precompute_images(item_file: str, sizes: Tuple[int, ...], processes: Optional[int]) -> None:
+    from acquisition.ebay_downloader_io import EbayDownloaderIO
+    from data_sets.image_pyramid import ImagePyramid
+    items = EbayDownloaderIO(dirname(item_file) or '.', items_file=item_file).load_items()
+    ImagePyramid([(size, size) for size in sizes], processes, verbose=True).build(items)
 
 
 def main(args: Namespace) -> None:
     print(args)
+    precompute_images(args.item_file, args.image_sizes, args.image_processes)
     with open(args.output_file, 'w') as f:
         f.writelines(header(args.epochs))
+    results = ResultWriter(args)
+
+    run_sweep(args, results)
+    if args.history_file:
+        results.add_to_history(args.history_file)
+
 
+def run_sweep(args: Namespace, results: 'ResultWriter') -> None:
+    if args.strategy == 'halving':
+        run_successive_halving(args, results)
+        return
+    if args.workers:
+        run_scheduled(args, results)
+        return
+
+    engine = sweep_engine(args) if args.in_process else None
     for size in args.image_sizes:
         for layers in args.layers:
             for algo in args.algorithms:
                 for optimizer in args.optimizers:
-                    with open(args.output_file, 'a') as f:
-                        f.write(
-                            evaluate(
-                                size, layers, algo, optimizer, args.epochs,
-                                args.item_file, args.batch_size, args.likes_only
-                            )
+                    if engine is not None:
+                        result = evaluate_in_process(engine, size, layers, algo, optimizer, args.epochs)
+                    else:
+                        result = evaluate(
+                            size, layers, algo, optimizer, args.epochs,
+                            args.item_file, args.batch_size, args.likes_only,
+                            args.bottleneck, args.backbone_weights
                         )
+                    results.add(size, layers, algo, optimizer, result)
+
+
+def sweep_engine(args: Namespace) -> Any:
+    from performance.sweep_engine import SweepEngine
+    return SweepEngine(**engine_args(args), verbose=True)
+
+
+def engine_args(args: Namespace) -> Dict[str, Any]:
+    return {
+        'item_file': args.item_file, 'batch_size': args.batch_size, 'likes_only': args.likes_only,
+        'bottleneck': args.bottleneck, 'backbone_weights': args.backbone_weights
+    }
+
+
+def run_scheduled(args: Namespace, results: 'ResultWriter') -> None:
+    from performance.scheduler import JobQueue, Scheduler, grid_jobs
+    jobs = grid_jobs(args.image_sizes, args.layers, args.algorithms, args.optimizers, args.epochs)
+    job_results = Scheduler(
+        JobQueue(args.queue_dir), args.workers, args.threads_per_worker, engine_args(args), verbose=True
+    ).run(jobs, args.retry_failed)
+    for job in jobs:
+        if job in job_results:
+            results.add(job.size, job.layers, job.algo, job.optimizer, job_results[job])
+
+
+def run_successive_halving(args: Namespace, results: 'ResultWriter') -> None:
+    from performance.scheduler import grid_jobs
+    from performance.successive_halving import SuccessiveHalving
+    jobs = grid_jobs(args.image_sizes, args.layers, args.algorithms, args.optimizers, args.epochs)
+    job_results = SuccessiveHalving(sweep_engine(args), args.eta, verbose=True).run(jobs)
+    for job in jobs:
+        results.add(job.size, job.layers, job.algo, job.optimizer, job_results[job]._asdict())
+
+
+class ResultWriter:
+    """Appends the results of each configuration to the Markdown table and the JSON output file."""
+
+    def __init__(self, args: Namespace) -> None:
+        self.output_file = args.output_file
+        self.json_output_file = args.json_output_file
+        self.sweep = {
+            'item_file': args.item_file, 'batch_size': args.batch_size, 'likes_only': args.likes_only,
+            'epochs': list(args.epochs), 'bottleneck': args.bottleneck,
+            'backbone_weights': args.backbone_weights, 'strategy': args.strategy
+        }
+        self.results = []  # type: List[Dict[str, Any]]
+
+    def add(
+            self, size: int, layers: Tuple[int, ...], algo: str, optimizer: str, result: Dict[str, Any]
+    ) -> None:
+        with open(self.output_file, 'a') as f:
+            f.write(result_row(size, layers, algo, optimizer, result))
+        self.results.append(
+            {'size': size, 'layers': list(layers), 'algo': algo, 'optimizer': optimizer, **result}
+        )
+        # rewritten completely every time, so the file is valid JSON even if the sweep is interrupted
+        with open(self.json_output_file + '.tmp', 'w') as f:
+            json.dump({'sweep': self.sweep, 'results': self.results}, f, indent=2)
+        replace(self.json_output_file + '.tmp', self.json_output_file)
+
+    def add_to_history(self, history_file: str) -> None:
+        from performance.history import BenchmarkHistory, sweep_entries
+        BenchmarkHistory(history_file).append(sweep_entries({'sweep': self.sweep, 'results': self.results}))
 
 
 def header(epochs: Tuple[int, ...]) -> List[str]:
@@ -0,0 +1,49 @@
+from argparse import ArgumentParser, Namespace
+
+from acquisition.ebay_downloader_io import EbayDownloaderIO
+from inference.bulk_scorer import BulkScorer
+from predict import Predictor, add_cache_argument, add_model_arguments, prediction_cache
+
+OUTPUT_FILE = 'scores.csv'
+BATCH_SIZE = 64
+
+
+def parse_command_line() -> Namespace:
+    parser = ArgumentParser(
+        description="Score all items of a data set with a trained network and write the scores to a CSV file"
+    )
+    add_model_arguments(parser)
+    parser.add_argument('--item-file', '-i', required=True, help="Pickle file of the items to score")
+    parser.add_argument(
+        '--output-file', '-o', default=OUTPUT_FILE,
+        help=f"CSV file the scores are appended to; items already in it are skipped (default: {OUTPUT_FILE})"
+    )
+    parser.add_argument(
+        '--batch-size', '-b', type=int, default=BATCH_SIZE,
+        help=f"Images predicted at once (default: {BATCH_SIZE})"
+    )
+    parser.add_argument(
+        '--decode-workers', type=int, default=None, help="Threads decoding images (default: number of CPUs)"
+    )
+    parser.add_argument(
+        '--top-k', type=int, default=None,
+        help="Write only this many most probable labels per item instead of the probabilities of all labels"
+    )
+    add_cache_argument(parser)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_command_line()
+    items = EbayDownloaderIO(args.save_folder, items_file=args.item_file, verbose=args.verbose).load_items()
+    predictor = Predictor(args)
+    scorer = BulkScorer(
+        predictor.model.predict_on_batch, predictor.decode_image, args.batch_size, args.decode_workers,
+        labels=predictor.labels, cache=prediction_cache(predictor, args.prediction_cache), top_k=args.top_k,
+        verbose=args.verbose
+    )
+    scored = scorer.score(items, args.output_file)
+    print(
+        f'{scored} items scored, {scorer.cached_pictures} pictures found in the cache, '
+        f'{scorer.failed_pictures} pictures could not be read'
+    )
@@ -0,0 +1,48 @@
+from argparse import ArgumentParser, Namespace
+
+from inference.micro_batcher import MicroBatcher
+from inference.server import make_server
+from predict import Predictor, add_cache_argument, add_model_arguments, prediction_cache
+
+DEFAULT_PORT = 8080
+MAX_BATCH_SIZE = 32
+MAX_LATENCY_MS = 10.
+
+
+def parse_command_line() -> Namespace:
+    parser = ArgumentParser(
+        description="Serve predictions of a trained network over HTTP, batching concurrent requests"
+    )
+    add_model_arguments(parser)
+    parser.add_argument('--host', default='localhost', help='Host name or address to listen on')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='TCP port to listen on')
+    parser.add_argument('--socket', default=None, help='Listen on this Unix socket instead of a TCP port')
+    parser.add_argument(
+        '--max-batch-size', type=int, default=MAX_BATCH_SIZE,
+        help='Largest number of images predicted at once'
+    )
+    parser.add_argument(
+        '--max-latency', type=float, default=MAX_LATENCY_MS,
+        help='Longest time in milliseconds a request waits for other requests to fill its batch'
+    )
+    add_cache_argument(parser)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_command_line()
+    predictor = Predictor(args)
+    batcher = MicroBatcher(predictor.model.predict_on_batch, args.max_batch_size, args.max_latency / 1000)
+    server = make_server(
+        batcher, predictor.decode_image, args.host, args.port, args.socket, labels=predictor.labels,
+        cache=prediction_cache(predictor, args.prediction_cache)
+    )
+    print('Serving on', args.socket or '{}:{}'.format(args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.close()
+        print(batcher.stats.summary())
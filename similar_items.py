@@ -0,0 +1,69 @@
+from argparse import ArgumentParser, Namespace
+from os.path import isfile
+
+from acquisition.ebay_downloader_io import EbayDownloaderIO
+from inference.embedding_index import EmbeddingIndex, embedding_model
+from predict import Predictor, add_model_arguments
+
+INDEX_FILE = 'embeddings.npz'
+BATCH_SIZE = 64
+NUM_RESULTS = 10
+PROBES = 8
+# collections with fewer pictures are searched exactly
+MIN_PARTITIONED_PICTURES = 100000
+
+
+def parse_command_line() -> Namespace:
+    parser = ArgumentParser(description="Find items that look like the items you liked")
+    add_model_arguments(parser)
+    parser.add_argument('--item-file', '-i', required=True, help="Pickle file of the items to search")
+    parser.add_argument(
+        '--index-file', default=INDEX_FILE,
+        help=f"File the embeddings of all pictures are stored in; built first if missing "
+             f"(default: {INDEX_FILE})"
+    )
+    parser.add_argument(
+        '--rebuild', action='store_true', help="Build the index even if the index file exists"
+    )
+    parser.add_argument(
+        '--partitions', type=int, default=None,
+        help=f"Number of partitions for approximate search; 0 always searches exactly (default: square root "
+             f"of the number of pictures, if there are more than {MIN_PARTITIONED_PICTURES})"
+    )
+    parser.add_argument(
+        '--probes', type=int, default=PROBES,
+        help=f"Partitions searched per query in approximate search (default: {PROBES})"
+    )
+    parser.add_argument(
+        '--like-item', type=int, action='append',
+        help="Id of an item to find similar items to (default: all liked items)"
+    )
+    parser.add_argument(
+        '--num-results', '-k', type=int, default=NUM_RESULTS,
+        help=f"Number of items found (default: {NUM_RESULTS})"
+    )
+    parser.add_argument('--batch-size', '-b', type=int, default=BATCH_SIZE, help="Images predicted at once")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_command_line()
+    items = EbayDownloaderIO(args.save_folder, items_file=args.item_file, verbose=args.verbose).load_items()
+    if args.rebuild or not isfile(args.index_file):
+        predictor = Predictor(args)
+        index = EmbeddingIndex.build(
+            items, embedding_model(predictor.model).predict_on_batch, predictor.decode_image, args.batch_size,
+            verbose=args.verbose
+        )
+        if args.partitions or (args.partitions is None and len(index) > MIN_PARTITIONED_PICTURES):
+            index.partition(args.partitions)
+        index.save(args.index_file)
+    else:
+        index = EmbeddingIndex.load(args.index_file, args.verbose)
+    liked = args.like_item or [item.id for item in items if item.is_liked]
+    if not liked:
+        raise ValueError('No liked items, pass --like-item')
+    titles = {item.id: item.title for item in items}
+    probes = args.probes if index.partitioned else None
+    for item_id, similarity in index.similar_items(liked, args.num_results, probes):
+        print(f'{similarity:.3f} {item_id} {titles.get(item_id, "")}')
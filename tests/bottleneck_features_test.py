@@ -0,0 +1,70 @@
+from functools import partial
+from os import sep
+from os.path import basename, join, isfile
+
+from keras.applications import VGG16
+
+from acquisition.item import Item
+from acquisition.items import Items
+from data_sets import EbayDataGenerator
+from data_sets.bottleneck_features import BottleneckFeatures
+from tests.test_base import TestBase, create_item_dict
+
+__author__ = 'Lene Preuss <lene.preuss@gmail.com>'
+
+SIZE = (48, 48)
+
+
+class BottleneckFeaturesTest(TestBase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        test_pic = join(sep, *__file__.split('/')[:-1], 'data', 'test.jpg')
+        self.api.get_item = partial(create_item_dict, picture_url=['file://' + test_pic])
+        Item.download_root = self.DOWNLOAD_ROOT
+        items = Items([Item(self.api, self.category, 1)])
+        items[0].tags = {'1'}
+        self.image_data = EbayDataGenerator(items, {'1': 1}, SIZE, test_share=0)
+        self.image_files = items[0].picture_files
+        self.weights_file = join(self.DOWNLOAD_ROOT, 'backbone.h5')
+        save_random_backbone_weights(self.weights_file)
+
+    def test_backbone_weights_are_needed(self) -> None:
+        with self.assertRaises(ValueError):
+            BottleneckFeatures(self.image_data, 'vgg16', None, self.DOWNLOAD_ROOT)
+
+    def test_features_have_backbone_output_size(self) -> None:
+        features = BottleneckFeatures(self.image_data, 'vgg16', self.weights_file, self.DOWNLOAD_ROOT)
+        self.assertEqual((1, 512), features.features(self.image_files).shape)
+        self.assertEqual(512, features.num_features)
+
+    def test_features_are_cached_per_backbone_and_size(self) -> None:
+        features = BottleneckFeatures(self.image_data, 'vgg16', self.weights_file, self.DOWNLOAD_ROOT)
+        computed = features.features(self.image_files)
+        self.assertTrue(isfile(features.cache_file))
+        self.assertTrue(basename(features.cache_file).startswith('features_v2_vgg16_backbone_'))
+        self.assertTrue(features.cache_file.endswith('_48x48.npz'))
+
+        cached = BottleneckFeatures(self.image_data, 'vgg16', self.weights_file, self.DOWNLOAD_ROOT)
+        self.assertEqual(computed.tolist(), cached.features(self.image_files).tolist())
+        self.assertIsNone(cached._backbone)
+
+    def test_uint8_input_features_are_cached_separately(self) -> None:
+        features = BottleneckFeatures(
+            self.image_data, 'vgg16', self.weights_file, self.DOWNLOAD_ROOT, uint8_input=True
+        )
+        self.assertEqual('uint8', features.backbone.input.dtype)
+        self.assertEqual((1, 512), features.features(self.image_files).shape)
+        self.assertTrue(isfile(features.cache_file))
+        self.assertTrue(features.cache_file.endswith('_48x48_uint8.npz'))
+
+    def test_features_are_cached_per_weights_content(self) -> None:
+        features = BottleneckFeatures(self.image_data, 'vgg16', self.weights_file, self.DOWNLOAD_ROOT)
+        # a file of the same name with different weights
+        save_random_backbone_weights(self.weights_file)
+        replaced = BottleneckFeatures(self.image_data, 'vgg16', self.weights_file, self.DOWNLOAD_ROOT)
+        self.assertNotEqual(features.cache_file, replaced.cache_file)
+
+
+def save_random_backbone_weights(weights_file: str) -> None:
+    VGG16(include_top=False, weights=None, input_shape=(*SIZE, 3)).save_weights(weights_file)
@@ -0,0 +1,119 @@
+import csv
+from os.path import join
+from typing import Dict, List
+
+import numpy
+
+from inference.bulk_scorer import BulkScorer, scored_ids, truncate_partial_row
+from inference.prediction_cache import PredictionCache
+from tests.test_base import TestBase
+
+__author__ = 'Lene Preuss <lene.preuss@gmail.com>'
+
+
+def decode(picture: str) -> numpy.ndarray:
+    if picture.endswith('broken'):
+        raise OSError('cannot identify image file')
+    with open(picture) as file:
+        return numpy.full(2, float(file.read()))
+
+
+class BulkScorerTest(TestBase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.items = self.generate_items(5)
+        for i, item in enumerate(self.items):
+            item.picture_files = [self.picture(item.id, i + j) for j in range(i % 3)]
+        self.items[1].picture_files.append('broken')
+        self.output_file = join(self.DOWNLOAD_ROOT, 'scores.csv')
+        self.batch_sizes = []  # type: List[int]
+
+    def picture(self, item_id: int, value: int) -> str:
+        picture = join(self.DOWNLOAD_ROOT, '{}-{}'.format(item_id, value))
+        with open(picture, 'w') as file:
+            file.write(str(value))
+        return picture
+
+    def predict(self, images: numpy.ndarray) -> numpy.ndarray:
+        self.batch_sizes.append(len(images))
+        return images
+
+    def scores(self) -> Dict[str, List[str]]:
+        with open(self.output_file, newline='') as file:
+            return {row[0]: row[1:] for row in csv.reader(file)}
+
+    def test_scores_are_averaged_per_item(self) -> None:
+        scorer = BulkScorer(self.predict, decode, batch_size=2, labels=['<3', ':-('])
+        self.assertEqual(3, scorer.score(self.items, self.output_file))
+        self.assertEqual(
+            {
+                'id': ['pictures', '<3', ':-('], '2': ['1', '1.0', '1.0'], '3': ['2', '2.5', '2.5'],
+                '5': ['1', '4.0', '4.0']
+            },
+            self.scores()
+        )
+        self.assertEqual(1, scorer.failed_pictures)
+        self.assertEqual([2, 2], self.batch_sizes)
+
+    def test_top_labels_are_written(self) -> None:
+        scorer = BulkScorer(
+            lambda images: images * [1., 2., 0.], lambda picture: numpy.full(3, decode(picture)[0]),
+            batch_size=2, labels=['<3', ':-(', 'Pumps'], top_k=2
+        )
+        scorer.score(self.items, self.output_file)
+        self.assertEqual(
+            {
+                'id': ['pictures', 'label_1', 'probability_1', 'label_2', 'probability_2'],
+                '2': ['1', ':-(', '2.0', '<3', '1.0'], '3': ['2', ':-(', '5.0', '<3', '2.5'],
+                '5': ['1', ':-(', '8.0', '<3', '4.0']
+            },
+            self.scores()
+        )
+
+    def test_scoring_resumes(self) -> None:
+        BulkScorer(self.predict, decode, batch_size=2).score(self.items[:2], self.output_file)
+        self.assertEqual({'2'}, scored_ids(self.output_file))
+        scorer = BulkScorer(self.predict, decode, batch_size=2)
+        self.assertEqual(2, scorer.score(self.items, self.output_file))
+        self.assertEqual(['id', '2', '3', '5'], list(self.scores()))
+        self.assertEqual(['pictures', 'class_0', 'class_1'], self.scores()['id'])
+
+    def test_cut_off_rows_are_scored_again(self) -> None:
+        BulkScorer(self.predict, decode, batch_size=2).score(self.items, self.output_file)
+        with open(self.output_file) as file:
+            content = file.read()
+        with open(self.output_file, 'w') as file:
+            file.write(content[:content.rindex(',')])
+        self.assertEqual({'2', '3'}, scored_ids(self.output_file))
+
+    def test_rows_cut_within_a_value_are_replaced_on_resume(self) -> None:
+        BulkScorer(self.predict, decode, batch_size=2).score(self.items, self.output_file)
+        with open(self.output_file) as file:
+            content = file.read()
+        for cut in (len(content) - 2, content.rindex(',') + 1, content.rindex('\n', 0, -1) + 2):
+            with open(self.output_file, 'w') as file:
+                file.write(content[:cut])
+            self.assertEqual({'2', '3'}, scored_ids(self.output_file))
+            scorer = BulkScorer(self.predict, decode, batch_size=2)
+            self.assertEqual(1, scorer.score(self.items, self.output_file))
+            with open(self.output_file) as file:
+                self.assertEqual(content, file.read())
+
+    def test_partial_row_is_truncated_in_small_blocks(self) -> None:
+        with open(self.output_file, 'w') as file:
+            file.write('id,pictures\n2,1\n3,')
+        truncate_partial_row(self.output_file, block_size=2)
+        with open(self.output_file) as file:
+            self.assertEqual('id,pictures\n2,1\n', file.read())
+
+    def test_cached_pictures_are_not_predicted(self) -> None:
+        cache = PredictionCache(join(self.DOWNLOAD_ROOT, 'cache.sqlite'), 'model')
+        BulkScorer(self.predict, decode, batch_size=2, cache=cache).score(self.items[:3], self.output_file)
+        self.assertEqual([2, 2], self.batch_sizes)
+        self.items[4].picture_files.append(self.items[2].picture_files[0])
+        scorer = BulkScorer(self.predict, decode, batch_size=2, cache=cache)
+        self.assertEqual(1, scorer.score(self.items, self.output_file))
+        self.assertEqual([2, 2, 2], self.batch_sizes)
+        self.assertEqual(1, scorer.cached_pictures)
+        self.assertEqual(['2', '3.0', '3.0'], self.scores()['5'])
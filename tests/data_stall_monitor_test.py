@@ -0,0 +1,60 @@
+from time import sleep
+from typing import Generator, Tuple
+from unittest import TestCase
+
+import numpy
+from keras import Sequential
+from keras.layers import Dense
+
+from utils.data_stall_monitor import DataStallMonitor
+
+__author__ = 'Lene Preuss <lene.preuss@gmail.com>'
+
+BATCH_SIZE = 4
+
+
+def batches(delay: float=0.) -> Generator[Tuple[numpy.ndarray, numpy.ndarray], None, None]:
+    while True:
+        sleep(delay)
+        yield numpy.zeros((BATCH_SIZE, 3)), numpy.zeros((BATCH_SIZE, 1))
+
+
+class DataStallMonitorTest(TestCase):
+
+    def train(self, monitor: DataStallMonitor, generator: Generator, compute_time: float) -> dict:
+        """Runs one epoch of three batches the way Keras calls the callback."""
+        logs = {}  # type: dict
+        monitor.on_epoch_begin(0)
+        for batch in range(3):
+            monitor.on_train_batch_begin(batch)
+            next(generator)
+            sleep(compute_time)
+            monitor.on_train_batch_end(batch)
+        monitor.on_epoch_end(0, logs)
+        return logs
+
+    def test_slow_input_stalls_training(self) -> None:
+        monitor = DataStallMonitor()
+        logs = self.train(monitor, monitor.wrap(batches(delay=0.03)), compute_time=0.01)
+        self.assertGreater(logs['data_stall_percent'], 50)
+        self.assertLess(logs['data_stall_percent'], 100)
+        self.assertEqual(0., logs['queue_depth'])
+        self.assertGreater(logs['images_per_second'], 0)
+
+    def test_prefetched_input_does_not_stall_training(self) -> None:
+        monitor = DataStallMonitor()
+        generator = monitor.wrap(batches())
+        prefetched = [next(generator) for _ in range(3)]
+        logs = self.train(monitor, iter(prefetched), compute_time=0.01)  # type: ignore
+        self.assertLess(logs['data_stall_percent'], 5)
+        self.assertEqual(2., logs['queue_depth'])
+
+    def test_statistics_are_added_to_history(self) -> None:
+        model = Sequential([Dense(1, input_shape=(3,))])
+        model.compile(loss='mse', optimizer='sgd')
+        monitor = DataStallMonitor()
+        history = model.fit(
+            monitor.wrap(batches()), steps_per_epoch=2, epochs=2, callbacks=[monitor], verbose=0
+        )
+        for key in ('images_per_second', 'data_stall_percent', 'queue_depth'):
+            self.assertEqual(2, len(history.history[key]))
@@ -1,8 +1,8 @@
-from typing import Tuple, List
+from typing import Dict, Tuple, List
 
 __author__ = 'Lene Preuss <lene.preuss@gmail.com>'
 from functools import partial
-from os import sep, makedirs
+from os import sep, makedirs, stat, utime
 from os.path import join
 
 import numpy
@@ -10,6 +10,7 @@ import numpy
 from acquisition.item import Item
 from acquisition.items import Items
 from data_sets import EbayDataGenerator
+from data_sets.image_archive import ImageArchive, ImageArchiveWriter
 from tests.test_base import TestBase, create_item_dict
 
 
@@ -54,6 +55,64 @@ class EbayDataGeneratorTest(TestBase):
             for j in range(len(labels0[i])):
                 self.assertEqual(labels0[i][j], labels1[i][j])
 
+    def test_generator_reuses_batch_buffers(self) -> None:
+        items, labels = self._generate_items_with_labels(self.NUM_IMAGES)
+        generator = EbayDataGenerator(items, labels, (48, 48), batch_size=1, test_share=0)
+        batches = generator.train_generator(max_queue_size=1)
+        num_buffers = 1 + EbayDataGenerator.BUFFERS_IN_USE
+        images = [next(batches)[0] for _ in range(num_buffers + 1)]
+        self.assertEqual(numpy.uint8, images[0].dtype)
+        self.assertEqual(num_buffers, len({id(batch.base) for batch in images}))
+        self.assertIs(images[0].base, images[num_buffers].base)
+
+    def test_batch_is_written_to_given_arrays(self) -> None:
+        items, labels = self._generate_items_with_labels(self.NUM_IMAGES)
+        generator = EbayDataGenerator(items, labels, (48, 48), batch_size=3, test_share=0)
+        images, one_hot = generator.batch_buffers().next()
+        one_hot.fill(7)
+        batch_labels = generator.labels_for_batch(generator.train.batches, 1, one_hot)
+        self.assertEqual((1, self.NUM_IMAGES), batch_labels.shape)
+        self.assertEqual(1, batch_labels.sum())
+        batch_images = generator.images_for_batch(generator.train.batches, 0, images)
+        self.assertIs(images, batch_images.base)
+        self.assertEqual(
+            generator.images_for_batch(generator.train.batches, 0).tolist(), batch_images.tolist()
+        )
+
+    def test_dataset_yields_batches_unchanged(self) -> None:
+        items, labels = self._generate_items_with_labels(self.NUM_IMAGES)
+        generator = EbayDataGenerator(items, labels, (48, 48), batch_size=1, test_share=0)
+        expected = [
+            label.argmax() for batch in generator.train.batches
+            for label in generator.labels_for_batch([batch], 0)
+        ]
+        dataset = generator.dataset(generator.train_generator(max_queue_size=2), max_queue_size=2)
+        received = [int(batch_labels.numpy().argmax()) for _, batch_labels in dataset.take(self.NUM_IMAGES)]
+        self.assertEqual(expected, received)
+
+    def test_access_is_recorded_when_image_is_read(self) -> None:
+        items, labels = self._generate_items_with_labels(1)
+        items.download_images()
+        picture_file = items[0].picture_files[0]
+        utime(picture_file, (1000, 1000))
+        generator = EbayDataGenerator(items, labels, (48, 48), batch_size=1, test_share=0)
+        self.assertEqual(1000, stat(picture_file).st_atime)
+        next(generator.train_generator())
+        self.assertLess(1000, stat(picture_file).st_atime)
+        self.assertEqual(1000, stat(picture_file).st_mtime)
+
+    def test_access_is_not_recorded_for_images_read_from_archive(self) -> None:
+        items, labels = self._generate_items_with_labels(1)
+        archive_base = join(self.DOWNLOAD_ROOT, 'archive')
+        ImageArchiveWriter(archive_base, (48, 48)).build(items)
+        picture_file = items[0].picture_files[0]
+        utime(picture_file, (1000, 1000))
+        generator = EbayDataGenerator(
+            items, labels, (48, 48), batch_size=1, test_share=0, image_archive=ImageArchive(archive_base)
+        )
+        next(generator.train_generator())
+        self.assertEqual(1000, stat(picture_file).st_atime)
+
     def test_random_seed(self) -> None:
         self.skipTest("Not yet implemented")
 
@@ -77,11 +136,11 @@ class EbayDataGeneratorTest(TestBase):
             generator = EbayDataGenerator(items, labels, (139, 139), test_share=1)
             self._get_from_generator(self.NUM_IMAGES, generator)
 
-    def _generate_items_with_labels(self, num_items: int) -> Tuple[Items, numpy.ndarray]:
+    def _generate_items_with_labels(self, num_items: int) -> Tuple[Items, Dict[str, int]]:
         items = self._generate_items(num_items)
         for i, item in enumerate(items):
             item.tags = [str(i + 1)]
-        return items, [str(i + 1) for i in range(num_items)]
+        return items, {str(i + 1): 1 for i in range(num_items)}
 
     def _generate_items(self, num_items: int) -> Items:
         raw_items = [Item(self.api, self.category, i + 1) for i in range(num_items)]
@@ -0,0 +1,110 @@
+from os.path import join
+from unittest.mock import patch
+
+import numpy
+from keras.layers import Dense, Flatten, Input
+from keras.models import Model
+
+from inference.embedding_index import EmbeddingIndex, embedding_model
+from tests.test_base import TestBase
+
+__author__ = 'Lene Preuss <lene.preuss@gmail.com>'
+
+
+def decode(picture: str) -> numpy.ndarray:
+    if picture == 'broken':
+        raise OSError('cannot identify image file')
+    return numpy.array([3., 4.]) if int(picture) % 2 else numpy.array([4., 3.])
+
+
+class EmbeddingIndexTest(TestBase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        random = numpy.random.RandomState(0)
+        # 20 clusters of 10 pictures each, two pictures per item
+        centers = random.normal(size=(20, 16))
+        self.embeddings = numpy.repeat(centers, 10, axis=0) + 0.05 * random.normal(size=(200, 16))
+        self.item_ids = numpy.arange(200) // 2
+        self.index = EmbeddingIndex.from_embeddings(self.embeddings, self.item_ids)
+
+    def test_embeddings_are_stored_as_unit_float16(self) -> None:
+        self.assertEqual(numpy.float16, self.index.embeddings.dtype)
+        norms = numpy.linalg.norm(self.index.embeddings.astype(numpy.float32), axis=1)
+        self.assertTrue(numpy.allclose(1, norms, atol=1e-3))
+
+    def test_exact_search_finds_neighbours_in_order(self) -> None:
+        rows, similarities = self.index.search(self.embeddings[[3, 57]], k=10)
+        self.assertEqual((2, 10), rows.shape)
+        self.assertEqual([3, 57], rows[:, 0].tolist())
+        self.assertEqual(set(range(10)), set(rows[0]))
+        self.assertEqual(set(range(50, 60)), set(rows[1]))
+        self.assertTrue((numpy.diff(similarities, axis=1) <= 0).all())
+
+    def test_exact_search_is_done_in_blocks(self) -> None:
+        with patch('inference.embedding_index.BLOCK_SIZE', 7):
+            blocked = self.index.search(self.embeddings[:5], k=12)
+        unblocked = self.index.search(self.embeddings[:5], k=12)
+        self.assertTrue(numpy.allclose(unblocked[1], blocked[1]))
+
+    def test_more_results_than_rows(self) -> None:
+        index = EmbeddingIndex.from_embeddings(self.embeddings[:3], [1, 2, 3])
+        rows, _ = index.search(self.embeddings[0], k=5)
+        self.assertEqual([-1, -1], rows[0, 3:].tolist())
+
+    def test_approximate_search_agrees_with_exact_search(self) -> None:
+        exact_rows, _ = self.index.search(self.embeddings[::20], k=5)
+        self.index.partition(20)
+        offsets = self.index.offsets
+        assert offsets is not None
+        self.assertEqual(21, len(offsets))
+        self.assertEqual(200, offsets[-1])
+        approximate_rows, _ = self.index.search(self.embeddings[::20], k=5, probes=3)
+        # partitioning reorders the rows, compare by item
+        self.assertEqual(
+            [set(self.item_ids[rows]) for rows in exact_rows],
+            [set(self.index.item_ids[rows]) for rows in approximate_rows]
+        )
+
+    def test_approximate_search_needs_partitions(self) -> None:
+        with self.assertRaises(ValueError):
+            self.index.search(self.embeddings[0], probes=2)
+
+    def test_similar_items_excludes_query_items(self) -> None:
+        similar = self.index.similar_items([0, 1], k=3)
+        self.assertEqual(3, len(similar))
+        self.assertEqual({2, 3, 4}, {item_id for item_id, _ in similar})
+
+    def test_similar_items_searches_until_enough_items_are_found(self) -> None:
+        # many pictures of item 1 are closest to the query item 0, the other items come after them
+        embeddings = numpy.concatenate(([[1., 0.]], numpy.full((40, 2), [1., 0.01]), [[1., 1.], [0., 1.]]))
+        index = EmbeddingIndex.from_embeddings(embeddings, [0] + [1] * 40 + [2, 3])
+        self.assertEqual([1, 2, 3], [item_id for item_id, _ in index.similar_items([0], k=3)])
+        self.assertEqual([1, 2, 3], [item_id for item_id, _ in index.similar_items([0], k=5)])
+
+    def test_build_skips_unreadable_pictures(self) -> None:
+        items = self.generate_items(3)
+        for item in items:
+            item.picture_files = [str(item.id), 'broken', str(item.id)]
+        index = EmbeddingIndex.build(items, lambda images: images, decode, batch_size=2)
+        self.assertEqual(6, len(index))
+        self.assertEqual(numpy.float16, index.embeddings.dtype)
+        self.assertEqual(sorted([item.id for item in items] * 2), sorted(index.item_ids.tolist()))
+        for embedding, item_id in zip(index.embeddings, index.item_ids):
+            self.assertTrue(numpy.allclose(embedding, decode(str(item_id)) / 5, atol=1e-3))
+
+    def test_save_and_load(self) -> None:
+        self.index.partition(4)
+        index_file = join(self.DOWNLOAD_ROOT, 'index.npz')
+        self.index.save(index_file)
+        loaded = EmbeddingIndex.load(index_file)
+        self.assertTrue(loaded.partitioned)
+        self.assertEqual(self.index.item_ids.tolist(), loaded.item_ids.tolist())
+        self.assertEqual(
+            self.index.similar_items([7], probes=2), loaded.similar_items([7], probes=2)
+        )
+
+    def test_embedding_model_outputs_penultimate_layer(self) -> None:
+        inputs = Input(shape=(4, 4, 3))
+        model = Model(inputs=inputs, outputs=Dense(2, activation='softmax')(Dense(5)(Flatten()(inputs))))
+        self.assertEqual((None, 5), embedding_model(model).output_shape)
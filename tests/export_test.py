@@ -0,0 +1,73 @@
+from os.path import join
+
+import numpy
+from keras.layers import Conv2D, Dense, Flatten, Input
+from keras.models import Model
+
+from inference.export import TFLiteModel, compare_models, export_tflite
+from tests.test_base import TestBase
+
+__author__ = 'Lene Preuss <lene.preuss@gmail.com>'
+
+SIZE = 16
+
+
+class ExportTest(TestBase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        inputs = Input(shape=(SIZE, SIZE, 3))
+        convolved = Conv2D(4, (3, 3), activation='relu')(inputs)
+        outputs = Dense(2, activation='softmax')(Flatten()(convolved))
+        self.model = Model(inputs=inputs, outputs=outputs)
+        self.images = numpy.random.RandomState(0).uniform(-1, 1, (10, SIZE, SIZE, 3)).astype(numpy.float32)
+        self.model_file = join(self.DOWNLOAD_ROOT, 'model.tflite')
+
+    def test_exported_model_predicts_like_original(self) -> None:
+        self.assertGreater(export_tflite(self.model, self.model_file), 0)
+        exported = TFLiteModel(self.model_file)
+        self.assertEqual((SIZE, SIZE), exported.image_size)
+        self.assertTrue(numpy.allclose(
+            self.model.predict_on_batch(self.images), exported.predict(self.images, batch_size=4), atol=1e-5
+        ))
+
+    def test_quantized_models_predict_probabilities(self) -> None:
+        for quantization in ('dynamic', 'int8'):
+            export_tflite(self.model, self.model_file, quantization, self.images)
+            predictions = TFLiteModel(self.model_file).predict_on_batch(self.images)
+            self.assertEqual((10, 2), predictions.shape)
+            self.assertTrue(numpy.allclose(1, predictions.sum(axis=1), atol=0.05))
+            self.assertLess(numpy.abs(predictions - self.model.predict_on_batch(self.images)).max(), 0.2)
+
+    def test_int8_needs_calibration_images(self) -> None:
+        with self.assertRaises(ValueError):
+            export_tflite(self.model, self.model_file, 'int8')
+
+    def test_compare_models(self) -> None:
+        export_tflite(self.model, self.model_file)
+        exported = TFLiteModel(self.model_file)
+        labels = self.model.predict_on_batch(self.images).argmax(axis=1)
+        report = compare_models(
+            self.model.predict_on_batch, exported.predict_on_batch, self.images, batch_size=4, labels=labels
+        )
+        self.assertEqual(1., report['agreement'])
+        self.assertEqual(1., report['reference_accuracy'])
+        self.assertEqual(1., report['candidate_accuracy'])
+        self.assertLess(report['max_difference'] or 0, 1e-5)
+        self.assertGreater(report['speedup'] or 0, 0)
+
+    def test_accuracy_ignores_images_of_unknown_class(self) -> None:
+        export_tflite(self.model, self.model_file)
+        exported = TFLiteModel(self.model_file)
+        labels = self.model.predict_on_batch(self.images).argmax(axis=1)
+        labels[:5] = -1
+        labels[5] = 1 - labels[5]
+        report = compare_models(
+            self.model.predict_on_batch, exported.predict_on_batch, self.images, batch_size=4, labels=labels
+        )
+        self.assertAlmostEqual(0.8, report['reference_accuracy'] or 0)
+        self.assertAlmostEqual(0.8, report['candidate_accuracy'] or 0)
+        report = compare_models(
+            self.model.predict_on_batch, exported.predict_on_batch, self.images, labels=numpy.full(10, -1)
+        )
+        self.assertIsNone(report['reference_accuracy'])
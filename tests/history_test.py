@@ -0,0 +1,106 @@
+from os.path import join
+from typing import Any, Dict, List, Optional
+
+from performance.history import BenchmarkHistory, compare, incomplete, render_markdown, sweep_entries
+from tests.test_base import TestBase
+
+__author__ = 'Lene Preuss <lene.preuss@gmail.com>'
+
+
+def sweep(wall_time: float, accuracies: List[Optional[float]]) -> Dict[str, Any]:
+    return {
+        'sweep': {
+            'batch_size': 2, 'epochs': [2, 4], 'likes_only': True, 'bottleneck': False,
+            'backbone_weights': None
+        },
+        'results': [
+            {
+                'size': 48, 'layers': [8], 'algo': 'vgg16', 'optimizer': 'sgd', 'accuracies': accuracies,
+                'wall_time': wall_time, 'cpu_time': 2 * wall_time,
+                'runs': [{'images_per_second': 12.5}, None]
+            },
+            {
+                'size': 48, 'layers': [8], 'algo': 'nasnet', 'optimizer': 'sgd', 'accuracies': [0., 0.],
+                'wall_time': 0., 'cpu_time': 0.
+            }
+        ]
+    }
+
+
+class HistoryTest(TestBase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.history = BenchmarkHistory(join(self.DOWNLOAD_ROOT, 'history.jsonl'))
+        self.history.append(sweep_entries(sweep(10., [0.6, 0.7]), 'baseline'))
+
+    def test_entries_are_appended_per_sweep(self) -> None:
+        self.history.append(sweep_entries(sweep(10., [0.6, 0.7]), 'current'))
+        self.assertEqual(['baseline', 'current'], self.history.runs())
+        entry = self.history.run('current')[0]
+        self.assertEqual('vgg16', entry['config']['algo'])
+        self.assertEqual([2, 4], entry['config']['epochs'])
+        self.assertEqual(12.5, entry['images_per_second'])
+        self.assertIn('host', entry)
+        self.assertIn('numpy', entry['versions'])
+
+    def test_changes_within_threshold_are_no_regression(self) -> None:
+        current = sweep_entries(sweep(10.5, [0.6, 0.69]), 'current')
+        self.assertEqual([], compare(self.history.run('baseline'), current, 0.1, 0.02))
+
+    def test_slowdown_is_regression(self) -> None:
+        current = sweep_entries(sweep(12., [0.6, 0.7]), 'current')
+        regressions = compare(self.history.run('baseline'), current, 0.1, 0.02)
+        self.assertEqual(
+            [('seconds/epoch', 5., 6.)], [(r.metric, r.baseline, r.current) for r in regressions]
+        )
+
+    def test_run_times_measured_differently_are_not_compared(self) -> None:
+        baseline = sweep_entries(sweep(5., [0.6, 0.7]), 'old')
+        for entry in baseline:
+            del entry['timing']
+        current = sweep_entries(sweep(12., [0.6, 0.6]), 'current')
+        regressions = compare(baseline, current, 0.1, 0.02)
+        self.assertEqual(['accuracy (4 epochs)'], [r.metric for r in regressions])
+
+    def test_accuracy_loss_is_regression(self) -> None:
+        current = sweep_entries(sweep(10., [0.6, 0.65]), 'current')
+        regressions = compare(self.history.run('baseline'), current, 0.1, 0.02)
+        self.assertEqual(
+            [('accuracy (4 epochs)', 0.7, 0.65)], [(r.metric, r.baseline, r.current) for r in regressions]
+        )
+
+    def test_accuracies_are_compared_after_same_number_of_epochs(self) -> None:
+        current = sweep_entries(sweep(10., [0.65, None]), 'current')
+        self.assertEqual([], compare(self.history.run('baseline'), current, 0.1, 0.02))
+        self.assertEqual(
+            ['vgg16 sgd 48 [8]: no accuracy after 4 epochs', 'nasnet sgd 48 [8]: failed again'],
+            [str(entry) for entry in incomplete(self.history.run('baseline'), current)]
+        )
+
+    def test_failed_and_missing_configurations_are_no_regression(self) -> None:
+        failed = sweep(0., [0., 0.])
+        failed['results'] = failed['results'][:1]
+        current = sweep_entries(failed, 'current')
+        self.assertEqual([], compare(self.history.run('baseline'), current, 0.1, 0.02))
+        self.assertEqual(
+            ['vgg16 sgd 48 [8]: failed', 'nasnet sgd 48 [8]: missing'],
+            [str(entry) for entry in incomplete(self.history.run('baseline'), current)]
+        )
+
+    def test_previous_run_is_on_same_host(self) -> None:
+        for run_id, host in (('other', 'other-host'), ('current', None)):
+            entries = sweep_entries(sweep(10., [0.6, 0.7]), run_id)
+            for entry in entries:
+                entry['host'] = host or entry['host']
+            self.history.append(entries)
+        self.assertEqual('baseline', self.history.previous_run('current'))
+        self.assertIsNone(self.history.previous_run('other'))
+        self.assertIsNone(self.history.previous_run('baseline'))
+
+    def test_render_latest_sweep(self) -> None:
+        self.history.append(sweep_entries(sweep(8., [0.6, None]), 'current'))
+        markdown = render_markdown(self.history)
+        self.assertIn('|vgg16|sgd|48|(8,)|4.00s|12.5|0.6000|-|', markdown)
+        self.assertIn('|nasnet|sgd|48|(8,)|---|---|0.0000|0.0000|', markdown)
+        self.assertNotIn('5.00s', markdown)
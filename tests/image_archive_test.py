@@ -0,0 +1,81 @@
+from functools import partial
+from os import sep, makedirs
+from os.path import basename, join
+from shutil import copy
+
+from acquisition.item import Item
+from acquisition.items import Items
+from data_sets import EbayDataGenerator
+from data_sets.image_archive import ImageArchive, ImageArchiveWriter, shard_file
+from data_sets.image_pyramid import load_scaled_image
+from tests.test_base import TestBase, create_item_dict
+
+__author__ = 'Lene Preuss <lene.preuss@gmail.com>'
+
+SIZE = (48, 48)
+
+
+class ImageArchiveTest(TestBase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.test_pic = join(sep, *__file__.split('/')[:-1], 'data', 'test.jpg')
+        self.archive_base = join(self.DOWNLOAD_ROOT, 'archive')
+        Item.download_root = self.DOWNLOAD_ROOT
+
+    def test_original_bytes_are_stored(self) -> None:
+        items = self._generate_items_with_pictures(1)
+        self.assertEqual(1, ImageArchiveWriter(self.archive_base).build(items))
+        archive = ImageArchive(self.archive_base)
+        with open(self.test_pic, 'rb') as file:
+            self.assertEqual(file.read(), archive.encoded(items[0].picture_files[0]).tobytes())
+        self.assertEqual((32, 32), archive.open_image(items[0].picture_files[0]).size)
+
+    def test_scaled_images_equal_images_scaled_from_files(self) -> None:
+        items = self._generate_items_with_pictures(1)
+        ImageArchiveWriter(self.archive_base, SIZE).build(items)
+        archive = ImageArchive(self.archive_base)
+        image_file = items[0].picture_files[0]
+        self.assertEqual(SIZE, archive.size)
+        self.assertEqual(
+            load_scaled_image(image_file, SIZE).tolist(), archive.load_scaled_image(image_file, SIZE).tolist()
+        )
+
+    def test_new_shard_is_started_when_shard_is_full(self) -> None:
+        items = self._generate_items_with_pictures(3)
+        ImageArchiveWriter(self.archive_base, shard_size=1).build(items)
+        archive = ImageArchive(self.archive_base)
+        self.assertEqual(3, len(archive))
+        with open(shard_file(self.archive_base, 2), 'rb') as file:
+            self.assertEqual(file.read(), archive.encoded(sorted(archive._entries)[2]).tobytes())
+
+    def test_images_are_found_after_moving(self) -> None:
+        items = self._generate_items_with_pictures(1)
+        ImageArchiveWriter(self.archive_base, SIZE).build(items)
+        moved = join(self.DOWNLOAD_ROOT, '3f', 'a2', basename(items[0].picture_files[0]))
+        archive = ImageArchive(self.archive_base)
+        self.assertIn(moved, archive)
+        self.assertEqual(SIZE, archive.open_image(moved).size)
+
+    def test_generator_reads_from_archive(self) -> None:
+        items = self._generate_items_with_pictures(2)
+        ImageArchiveWriter(self.archive_base, SIZE).build(items)
+        generator = EbayDataGenerator(
+            items, {'1': 1, '2': 1}, SIZE, batch_size=2, test_share=0,
+            image_archive=ImageArchive(self.archive_base)
+        )
+        images, labels = next(generator.train_generator())
+        self.assertEqual((2, *SIZE, 3), images.shape)
+
+    def _generate_items_with_pictures(self, num_items: int) -> Items:
+        items = []
+        for i in range(num_items):
+            # every item needs its own picture file
+            picture_dir = join(self.DOWNLOAD_ROOT, 'source', str(i), 'a', 'b')
+            makedirs(picture_dir)
+            picture = copy(self.test_pic, join(picture_dir, 'test.jpg'))
+            self.api.get_item = partial(create_item_dict, picture_url=['file://' + picture])
+            item = Item(self.api, self.category, i + 1)
+            item.tags = {str(i + 1)}
+            items.append(item)
+        return Items(items)
@@ -0,0 +1,86 @@
+from os import makedirs, stat, utime
+from os.path import join, isfile, dirname
+from typing import List
+
+from acquisition import image_storage
+from acquisition.image_cache import ImageCache
+from acquisition.item import Item
+from acquisition.items import Items
+from tests.test_base import TestBase, create_item_dict
+
+__author__ = 'Lene Preuss <lene.preuss@gmail.com>'
+
+FILE_SIZE = 100
+
+
+class ImageCacheTest(TestBase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        Item.download_root = self.DOWNLOAD_ROOT
+        self.items = Items(
+            [self._create_item(i, 'http://example.com/a/b/c/{}.jpg'.format(i)) for i in range(4)]
+        )
+        for i, item in enumerate(self.items):
+            # item 0 is the least recently used one
+            utime(item.picture_files[0], (1000 + i, 1000))
+
+    def test_nothing_evicted_within_budget(self) -> None:
+        self.assertEqual((0, 0), ImageCache(self.DOWNLOAD_ROOT, 4 * FILE_SIZE).evict(self.items))
+        self.assertEqual([True] * 4, self._existing())
+
+    def test_least_recently_used_are_evicted_first(self) -> None:
+        evicted, freed = ImageCache(self.DOWNLOAD_ROOT, 2 * FILE_SIZE).evict(self.items)
+        self.assertEqual((2, 2 * FILE_SIZE), (evicted, freed))
+        self.assertEqual([False, False, True, True], self._existing())
+        self.assertEqual([], self.items[0].picture_files)
+        self.assertFalse(self.items.is_download_complete)
+
+    def test_liked_items_are_not_evicted(self) -> None:
+        self.items[0].like()
+        ImageCache(self.DOWNLOAD_ROOT, 2 * FILE_SIZE).evict(self.items)
+        self.assertEqual([True, False, False, True], self._existing())
+
+    def test_scaled_copies_are_evicted_with_their_image(self) -> None:
+        scaled_copy = join(self.DOWNLOAD_ROOT, '48x48', 'a_b_c_0.jpg.png')
+        self._write(scaled_copy)
+        ImageCache(self.DOWNLOAD_ROOT, 4 * FILE_SIZE).evict(self.items)
+        self.assertFalse(isfile(scaled_copy))
+        self.assertEqual([False, True, True, True], self._existing())
+
+    def test_record_access_protects_image(self) -> None:
+        image_storage.record_access(self.items[0].picture_files)
+        ImageCache(self.DOWNLOAD_ROOT, 3 * FILE_SIZE).evict(self.items)
+        self.assertEqual([True, False, True, True], self._existing())
+
+    def test_recent_access_is_not_rewritten(self) -> None:
+        picture_file = self.items[0].picture_files[0]
+        image_storage.record_access([picture_file])
+        recorded = stat(picture_file).st_atime_ns
+        utime(picture_file, ns=(recorded - 1000, stat(picture_file).st_mtime_ns))
+        image_storage.record_access([picture_file])
+        self.assertEqual(recorded - 1000, stat(picture_file).st_atime_ns)
+
+    def test_remove_unreferenced(self) -> None:
+        self._write(join(self.DOWNLOAD_ROOT, 'unreferenced.jpg'))
+        self.assertEqual(
+            (1, FILE_SIZE), ImageCache(self.DOWNLOAD_ROOT, 0).remove_unreferenced(self.items)
+        )
+        self.assertEqual([True] * 4, self._existing())
+        self.assertFalse(isfile(join(self.DOWNLOAD_ROOT, 'unreferenced.jpg')))
+
+    def _create_item(self, item_id: int, url: str) -> Item:
+        self.api.get_item = lambda i: create_item_dict(i, picture_url=[url])
+        item = Item(self.api, self.category, item_id)
+        item.picture_files = [Item.url_to_file(url)]
+        self._write(item.picture_files[0])
+        return item
+
+    def _existing(self) -> List[bool]:
+        return [isfile(Item.url_to_file(item.picture_urls[0])) for item in self.items]
+
+    @staticmethod
+    def _write(file_name: str) -> None:
+        makedirs(dirname(file_name), exist_ok=True)
+        with open(file_name, 'wb') as file:
+            file.write(b'x' * FILE_SIZE)
@@ -0,0 +1,102 @@
+from functools import partial
+from os import remove, sep, stat, utime
+from os.path import basename, join, isfile
+
+import numpy
+from PIL import Image
+
+from acquisition.item import Item
+from acquisition.items import Items
+from data_sets.contains_images import ContainsImages, add_border
+from data_sets.image_pyramid import (
+    ImagePyramid, clear_manifest_cache, load_scaled_image, precomputed, scale_to_sizes, scaled_image_file
+)
+from tests.test_base import TestBase, create_item_dict
+
+__author__ = 'Lene Preuss <lene.preuss@gmail.com>'
+
+SIZES = ((48, 48), (64, 64))
+
+
+class ImagePyramidTest(TestBase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.test_pic = join(sep, *__file__.split('/')[:-1], 'data', 'test.jpg')
+        self.api.get_item = partial(create_item_dict, picture_url=['file://' + self.test_pic])
+        Item.download_root = self.DOWNLOAD_ROOT
+
+    def tearDown(self) -> None:
+        clear_manifest_cache()
+        super().tearDown()
+
+    def test_build_writes_all_sizes(self) -> None:
+        items = Items([Item(self.api, self.category, 1)])
+        written = ImagePyramid(SIZES, processes=1).build(items)
+        self.assertEqual(len(SIZES), written)
+        for size in SIZES:
+            scaled_file = scaled_image_file(items[0].picture_files[0], size)
+            self.assertTrue(isfile(scaled_file))
+            self.assertEqual(size, Image.open(scaled_file).size)
+
+    def test_build_skips_existing_sizes(self) -> None:
+        items = Items([Item(self.api, self.category, 1)])
+        ImagePyramid(SIZES[:1], processes=1).build(items)
+        self.assertEqual(len(SIZES) - 1, ImagePyramid(SIZES, processes=1).build(items))
+
+    def test_scaled_image_equals_image_scaled_on_the_fly(self) -> None:
+        items = Items([Item(self.api, self.category, 1)])
+        items.download_images()
+        image_file = items[0].picture_files[0]
+        on_the_fly = load_scaled_image(image_file, SIZES[0])
+        scale_to_sizes(image_file, SIZES)
+        self.assertTrue(isfile(scaled_image_file(image_file, SIZES[0])))
+        self.assertEqual(on_the_fly.tolist(), load_scaled_image(image_file, SIZES[0]).tolist())
+        self.assertEqual(
+            numpy.shape(
+                ContainsImages.scale_image(Image.open(image_file).convert('RGB'), SIZES[0], add_border)
+            ),
+            load_scaled_image(image_file, SIZES[0]).shape
+        )
+
+    def test_build_lists_scaled_copies_in_manifest(self) -> None:
+        items = Items([Item(self.api, self.category, 1)])
+        ImagePyramid(SIZES[:1], processes=1).build(items)
+        self.assertEqual({basename(items[0].picture_files[0])}, precomputed(self.DOWNLOAD_ROOT, SIZES[0]))
+        self.assertEqual(set(), precomputed(self.DOWNLOAD_ROOT, SIZES[1]))
+
+    def test_scaled_copies_missing_from_manifest_are_not_used(self) -> None:
+        items = Items([Item(self.api, self.category, 1)])
+        items.download_images()
+        image_file = items[0].picture_files[0]
+        on_the_fly = load_scaled_image(image_file, SIZES[0])
+        scale_to_sizes(image_file, SIZES[:1])
+        Image.new('RGB', SIZES[0]).save(scaled_image_file(image_file, SIZES[0]), format='PNG')
+        self.assertEqual(on_the_fly.tolist(), load_scaled_image(image_file, SIZES[0]).tolist())
+
+    def test_scaled_copies_older_than_original_are_rebuilt(self) -> None:
+        items = Items([Item(self.api, self.category, 1)])
+        ImagePyramid(SIZES, processes=1).build(items)
+        image_file = items[0].picture_files[0]
+        modified = stat(image_file).st_mtime_ns - 10 ** 9
+        for size in SIZES:
+            utime(scaled_image_file(image_file, size), ns=(modified, modified))
+        self.assertEqual(len(SIZES), ImagePyramid(SIZES, processes=1).build(items))
+        self.assertEqual(0, ImagePyramid(SIZES, processes=1).build(items))
+
+    def test_downloading_an_image_again_removes_its_scaled_copies(self) -> None:
+        items = Items([Item(self.api, self.category, 1)])
+        ImagePyramid(SIZES, processes=1).build(items)
+        image_file = items[0].picture_files[0]
+        Image.new('RGB', SIZES[0]).save(scaled_image_file(image_file, SIZES[0]), format='PNG')
+        remove(image_file)
+        items[0].download_images()
+        for size in SIZES:
+            self.assertFalse(isfile(scaled_image_file(image_file, size)))
+        self.assertEqual(
+            numpy.shape(
+                ContainsImages.scale_image(Image.open(image_file).convert('RGB'), SIZES[0], add_border)
+            ),
+            load_scaled_image(image_file, SIZES[0]).shape
+        )
+        self.assertNotEqual(0, load_scaled_image(image_file, SIZES[0]).max())
@@ -0,0 +1,106 @@
+from functools import partial
+from os import sep, makedirs
+from os.path import join, isfile, dirname, normpath
+from unittest.mock import patch
+
+from acquisition import image_storage
+from acquisition.item import Item
+from tests.test_base import TestBase, create_item_dict
+
+__author__ = 'Lene Preuss <lene.preuss@gmail.com>'
+
+
+class ImageStorageTest(TestBase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.test_pic = join(sep, *__file__.split('/')[:-1], 'data', 'test.jpg')
+        self.api.get_item = partial(create_item_dict, picture_url=['file://' + self.test_pic])
+        Item.download_root = self.DOWNLOAD_ROOT
+
+    def tearDown(self) -> None:
+        super().tearDown()
+        image_storage.clear_layout_cache()
+
+    def test_flat_layout_by_default(self) -> None:
+        self.assertFalse(image_storage.is_sharded(self.DOWNLOAD_ROOT))
+        self.assertEqual(
+            join(self.DOWNLOAD_ROOT, 'a.jpg'), image_storage.image_path(self.DOWNLOAD_ROOT, 'a.jpg')
+        )
+
+    def test_migrate_moves_files_into_shards(self) -> None:
+        self._create_files('a.jpg', 'b.jpg')
+        self.assertEqual(2, image_storage.migrate_to_sharded(self.DOWNLOAD_ROOT))
+        self.assertTrue(image_storage.is_sharded(self.DOWNLOAD_ROOT))
+        for name in ('a.jpg', 'b.jpg'):
+            self.assertFalse(isfile(join(self.DOWNLOAD_ROOT, name)))
+            self.assertTrue(isfile(image_storage.sharded_path(self.DOWNLOAD_ROOT, name)))
+            self.assertEqual(
+                image_storage.sharded_path(self.DOWNLOAD_ROOT, name),
+                image_storage.image_path(self.DOWNLOAD_ROOT, name)
+            )
+
+    def test_migrate_moves_scaled_copies_along(self) -> None:
+        self._create_files('a.jpg', join('48x48', 'a.jpg.png'))
+        image_storage.migrate_to_sharded(self.DOWNLOAD_ROOT)
+        sharded_dir = dirname(image_storage.sharded_path(self.DOWNLOAD_ROOT, 'a.jpg'))
+        self.assertTrue(isfile(join(sharded_dir, '48x48', 'a.jpg.png')))
+
+    def test_image_files_lists_both_layouts(self) -> None:
+        self._create_files('a.jpg')
+        image_storage.migrate_to_sharded(self.DOWNLOAD_ROOT)
+        self._create_files('b.jpg')
+        self.assertCountEqual(
+            [image_storage.sharded_path(self.DOWNLOAD_ROOT, 'a.jpg'), join(self.DOWNLOAD_ROOT, 'b.jpg')],
+            image_storage.image_files(self.DOWNLOAD_ROOT)
+        )
+
+    def test_unmigrated_files_are_found_while_migrating(self) -> None:
+        self._create_files('a.jpg')
+        with open(join(self.DOWNLOAD_ROOT, image_storage.LAYOUT_FILE), 'w') as file:
+            file.write(image_storage.MIGRATING)
+        self.assertTrue(image_storage.is_sharded(self.DOWNLOAD_ROOT))
+        self.assertEqual(
+            join(self.DOWNLOAD_ROOT, 'a.jpg'), image_storage.image_path(self.DOWNLOAD_ROOT, 'a.jpg')
+        )
+
+    def test_flat_path_is_not_checked_after_migration(self) -> None:
+        image_storage.migrate_to_sharded(self.DOWNLOAD_ROOT)
+        self.assertEqual(image_storage.SHARDED, image_storage.layout(self.DOWNLOAD_ROOT))
+        self._create_files('a.jpg')
+        self.assertEqual(
+            image_storage.sharded_path(self.DOWNLOAD_ROOT, 'a.jpg'),
+            image_storage.image_path(self.DOWNLOAD_ROOT, 'a.jpg')
+        )
+
+    def test_migration_by_other_process_is_noticed(self) -> None:
+        self.assertFalse(image_storage.is_sharded(self.DOWNLOAD_ROOT))
+        with open(join(self.DOWNLOAD_ROOT, image_storage.LAYOUT_FILE), 'w') as file:
+            file.write(image_storage.SHARDED)
+        self.assertFalse(image_storage.is_sharded(self.DOWNLOAD_ROOT))
+        with patch('acquisition.image_storage.LAYOUT_CACHE_SECONDS', 0.):
+            self.assertTrue(image_storage.is_sharded(self.DOWNLOAD_ROOT))
+
+    def test_download_into_sharded_root(self) -> None:
+        image_storage.migrate_to_sharded(self.DOWNLOAD_ROOT)
+        item = Item(self.api, self.category, 1)
+        item.download_images()
+        self.assertEqual(1, len(item.picture_files))
+        self.assertEqual(
+            normpath(self.DOWNLOAD_ROOT), normpath(dirname(dirname(dirname(item.picture_files[0]))))
+        )
+
+    def test_relocate_picture_files_after_migration(self) -> None:
+        item = Item(self.api, self.category, 1)
+        item.download_images()
+        flat_file = item.picture_files[0]
+        image_storage.migrate_to_sharded(self.DOWNLOAD_ROOT)
+        item.relocate_picture_files()
+        self.assertNotEqual(flat_file, item.picture_files[0])
+        self.assertTrue(isfile(item.picture_files[0]))
+
+    def _create_files(self, *names: str) -> None:
+        for name in names:
+            makedirs(dirname(join(self.DOWNLOAD_ROOT, name)), exist_ok=True)
+            with open(join(self.DOWNLOAD_ROOT, name), 'w') as file:
+                file.write(name)
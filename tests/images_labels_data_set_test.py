@@ -62,6 +62,12 @@ class ImagesLabelsDataSetTest(unittest.TestCase):
         self.assertLessEqual(normalized.max(), 1.)
         self.assertGreaterEqual(normalized.min(), 0.)
 
+    def test_keep_uint8(self) -> None:
+        data = create_random_image_data(0, 255)
+        data_set = ImagesLabelsDataSet(data, create_empty_label_data(), keep_uint8=True)
+        self.assertEqual(numpy.uint8, data_set.input.dtype)
+        self.assertEqual(data.tolist(), data_set.input.tolist())
+
 
 def _create_empty_data_set() -> ImagesLabelsDataSet:
     images = create_empty_image_data()
@@ -0,0 +1,100 @@
+import json
+from io import BytesIO
+from os.path import join
+from threading import Thread
+from typing import Any, BinaryIO, Dict, Optional, Union
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import numpy
+from PIL import Image
+
+from inference.micro_batcher import MicroBatcher
+from inference.prediction_cache import PredictionCache, image_hash
+from inference.server import make_server
+from tests.test_base import TestBase
+
+__author__ = 'Lene Preuss <lene.preuss@gmail.com>'
+
+
+def decode(image: Union[str, BinaryIO]) -> numpy.ndarray:
+    with Image.open(image) as opened:
+        return numpy.asarray(opened.convert('RGB').resize((4, 4)), dtype=numpy.float32)
+
+
+def predict(images: numpy.ndarray) -> numpy.ndarray:
+    brightness = images.mean(axis=(1, 2, 3)) / 255
+    return numpy.stack([brightness, 1 - brightness], axis=1)
+
+
+def fail(images: numpy.ndarray) -> numpy.ndarray:
+    raise ValueError('model broken')
+
+
+class InferenceServerTest(TestBase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.start_server()
+
+    def start_server(self, cache: Optional[PredictionCache]=None, model: Any=predict) -> None:
+        self.batcher = MicroBatcher(model)
+        self.server = make_server(self.batcher, decode, port=0, labels=['<3', ':-('], cache=cache)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://localhost:{}'.format(self.server.socket.getsockname()[1])
+
+    def tearDown(self) -> None:
+        self.stop_server()
+        super().tearDown()
+
+    def stop_server(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        self.batcher.close()
+
+    def request(self, path: str, body: Optional[bytes]=None, content_type: str='') -> Dict[str, Any]:
+        request = Request(self.url + path, data=body, headers={'Content-Type': content_type})
+        with urlopen(request) as response:
+            return json.loads(response.read().decode('utf-8'))
+
+    def test_predict_image_bytes(self) -> None:
+        image = BytesIO()
+        Image.new('RGB', (8, 8), color=(255, 255, 255)).save(image, format='PNG')
+        response = self.request('/predict', image.getvalue(), 'image/png')
+        self.assertEqual([[1., 0.]], response['predictions'])
+        self.assertEqual(['<3', ':-('], response['labels'])
+
+    def test_predict_image_files(self) -> None:
+        image_file = join(self.DOWNLOAD_ROOT, 'inference_server_test.png')
+        Image.new('RGB', (8, 8)).save(image_file)
+        response = self.request(
+            '/predict', json.dumps({'images': [image_file, image_file]}).encode('utf-8'), 'application/json'
+        )
+        self.assertEqual([[0., 1.], [0., 1.]], response['predictions'])
+        self.assertEqual(2, self.request('/stats')['requests'])
+
+    def test_cached_images_are_not_predicted(self) -> None:
+        image = BytesIO()
+        Image.new('RGB', (8, 8)).save(image, format='PNG')
+        cache = PredictionCache(':memory:', 'model')
+        cache.put({image_hash(image.getvalue()): numpy.array([0.25, 0.75])})
+        self.stop_server()
+        self.start_server(cache)
+        response = self.request('/predict', image.getvalue(), 'image/png')
+        self.assertEqual([[0.25, 0.75]], response['predictions'])
+        self.assertEqual(0, self.request('/stats')['requests'])
+
+    def test_invalid_image_is_rejected(self) -> None:
+        with self.assertRaises(HTTPError) as context:
+            self.request('/predict', b'no image', 'image/png')
+        self.assertEqual(400, context.exception.code)
+
+    def test_model_failure_is_server_error(self) -> None:
+        self.stop_server()
+        self.start_server(model=fail)
+        image = BytesIO()
+        Image.new('RGB', (8, 8)).save(image, format='PNG')
+        with self.assertRaises(HTTPError) as context:
+            self.request('/predict', image.getvalue(), 'image/png')
+        self.assertEqual(500, context.exception.code)
+        self.assertIn('model broken', json.loads(context.exception.read().decode('utf-8'))['error'])
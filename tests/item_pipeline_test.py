@@ -0,0 +1,85 @@
+from functools import partial
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+from os.path import join
+from threading import Thread
+from typing import Any, Dict, List
+
+import numpy
+from PIL import Image
+
+from acquisition.item import Item
+from inference.bulk_scorer import BulkScorer
+from inference.item_pipeline import ItemPredictionPipeline, item_id_from_url
+from tests.test_base import TestBase, create_item_dict
+
+__author__ = 'Lene Preuss <lene.preuss@gmail.com>'
+
+
+def decode(picture: str) -> numpy.ndarray:
+    with Image.open(picture) as image:
+        return numpy.asarray(image.convert('L'), dtype=numpy.float32).mean(keepdims=True) / 255
+
+
+class ItemPipelineTest(TestBase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        Item.download_root = join(self.DOWNLOAD_ROOT, 'cache')
+        self.server = HTTPServer(
+            ('localhost', 0), partial(QuietRequestHandler, directory=self.DOWNLOAD_ROOT)
+        )
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.pictures = {}  # type: Dict[int, List[str]]
+        for item_id, brightness in ((1, [255]), (2, [0, 255]), (3, [0, 0, 0])):
+            self.pictures[item_id] = [self.picture(item_id, i, value) for i, value in enumerate(brightness)]
+        self.api.get_item = self.get_item
+        self.batch_sizes = []  # type: List[int]
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        super().tearDown()
+
+    def picture(self, item_id: int, index: int, brightness: int) -> str:
+        file_name = '{}-{}.png'.format(item_id, index)
+        Image.new('L', (4, 4), color=brightness).save(join(self.DOWNLOAD_ROOT, file_name))
+        return 'http://localhost:{}/{}'.format(self.server.server_port, file_name)
+
+    def get_item(self, item_id: int) -> Dict[str, Any]:
+        if item_id not in self.pictures:
+            raise AttributeError('no such item')
+        return create_item_dict(item_id, picture_url=self.pictures[item_id])
+
+    def predict(self, images: numpy.ndarray) -> numpy.ndarray:
+        self.batch_sizes.append(len(images))
+        return numpy.concatenate([images, 1 - images], axis=1)
+
+    def test_item_id_from_url(self) -> None:
+        self.assertEqual(123, item_id_from_url('123'))
+        self.assertEqual(123, item_id_from_url('https://www.ebay.de/itm/123'))
+        self.assertEqual(123, item_id_from_url('https://www.ebay.de/itm/2019-Kleid-Rot/123?hash=item1c'))
+        with self.assertRaises(ValueError):
+            item_id_from_url('https://www.ebay.de/sch/i.html?_nkw=kleid')
+
+    def test_items_are_predicted_in_order(self) -> None:
+        pipeline = ItemPredictionPipeline(self.api, BulkScorer(self.predict, decode, batch_size=2))
+        urls = ['https://www.ebay.de/itm/Kleid/{}'.format(i) for i in (3, 4, 1, 2)]
+        results = list(pipeline.predict(urls))
+        self.assertEqual(urls, [result.url for result in results])
+        self.assertEqual([0., 0.5, 1.], [results[i].prediction[0] for i in (0, 3, 2)])  # type: ignore
+        self.assertIsNone(results[1].prediction)
+        self.assertIn('not found', str(results[1].error))
+        self.assertTrue(all(size == 2 for size in self.batch_sizes))
+
+    def test_downloaded_pictures_are_cached(self) -> None:
+        pipeline = ItemPredictionPipeline(self.api, BulkScorer(self.predict, decode))
+        first = list(pipeline.predict(['1']))[0]
+        self.server.shutdown()
+        second = list(pipeline.predict(['1']))[0]
+        self.assertEqual(first.prediction.tolist(), second.prediction.tolist())  # type: ignore
+
+
+class QuietRequestHandler(SimpleHTTPRequestHandler):
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
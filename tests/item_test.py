@@ -1,9 +1,12 @@
 
 from functools import partial
-from os import sep
-from os.path import join, isfile
+from os import makedirs, sep, stat
+from os.path import join, isfile, basename
+
+from PIL import Image
 
 from acquisition.item import Item
+from acquisition.items import Items
 from tests.test_base import TestBase, create_item_dict
 
 __author__ = 'Lene Preuss <lene.preuss@gmail.com>'
@@ -90,3 +93,61 @@ class ItemTest(TestBase):
         item = Item(self.api, self.category, 1)
 
         item.download_images()  # should just ignore the error
+
+    def test_download_images_with_max_edge_stores_smaller_master(self) -> None:
+        test_pic = join(sep, *__file__.split('/')[:-1], 'data', 'test.jpg')
+        self.api.get_item = partial(create_item_dict, picture_url=['file://' + test_pic])
+        Item.download_root = self.DOWNLOAD_ROOT
+        item = Item(self.api, self.category, 1)
+
+        item.download_images(max_edge=16)
+
+        self.assertEqual(1, len(item.picture_files))
+        with Image.open(item.picture_files[0]) as image:
+            self.assertEqual((16, 16), image.size)
+        self.assertEqual({item.picture_files[0]: (16, 16)}, item.picture_sizes)
+
+    def test_download_images_with_max_edge_keeps_original(self) -> None:
+        test_pic = join(sep, *__file__.split('/')[:-1], 'data', 'test.jpg')
+        self.api.get_item = partial(create_item_dict, picture_url=['file://' + test_pic])
+        Item.download_root = self.DOWNLOAD_ROOT
+        originals_dir = join(self.DOWNLOAD_ROOT, 'originals')
+        item = Item(self.api, self.category, 1)
+
+        item.download_images(max_edge=16, originals_dir=originals_dir)
+
+        with Image.open(join(originals_dir, basename(item.picture_files[0]))) as image:
+            self.assertEqual((32, 32), image.size)
+
+    def test_downloaded_items_are_converted_to_masters(self) -> None:
+        test_pic = join(sep, *__file__.split('/')[:-1], 'data', 'test.jpg')
+        self.api.get_item = partial(create_item_dict, picture_url=['file://' + test_pic])
+        Item.download_root = self.DOWNLOAD_ROOT
+        items = Items([Item(self.api, self.category, 1)])
+        items.download_images()
+        del items[0].picture_sizes  # as pickled before masters were introduced
+        image_file = items[0].picture_files[0]
+        scaled_file = join(self.DOWNLOAD_ROOT, '8x8', basename(image_file) + '.png')
+        makedirs(join(self.DOWNLOAD_ROOT, '8x8'))
+        Image.new('RGB', (8, 8)).save(scaled_file, format='PNG')
+
+        items.download_images(max_edge=16)
+
+        with Image.open(image_file) as image:
+            self.assertEqual((16, 16), image.size)
+        self.assertEqual({image_file: (16, 16)}, items[0].picture_sizes)
+        self.assertFalse(isfile(scaled_file))
+
+    def test_masters_are_not_stored_again(self) -> None:
+        test_pic = join(sep, *__file__.split('/')[:-1], 'data', 'test.jpg')
+        self.api.get_item = partial(create_item_dict, picture_url=['file://' + test_pic])
+        Item.download_root = self.DOWNLOAD_ROOT
+        items = Items([Item(self.api, self.category, 1)])
+        items.download_images(max_edge=16)
+        modified = stat(items[0].picture_files[0]).st_mtime_ns
+
+        items.download_images(max_edge=16)
+        self.assertEqual(modified, stat(items[0].picture_files[0]).st_mtime_ns)
+        items.download_images(max_edge=8)
+        with Image.open(items[0].picture_files[0]) as image:
+            self.assertEqual((8, 8), image.size)
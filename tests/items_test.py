@@ -86,6 +86,12 @@ class ItemsTest(TestBase):
         tags = items.get_valid_tags(3)
         self.assertNotIn('<3', tags.keys())
 
+    def test_filter_by_category_name(self) -> None:
+        self.category.name = 'Sandalen'
+        items = self.generate_items(2)
+        self.assertEqual(2, len(items.filter(category='sandalen')))
+        self.assertEqual(0, len(items.filter(category='Pumps')))
+
     def test_filter_items_without_complete_tags(self) -> None:
         item1 = Item(self.api, self.category, 1)
         item1.tags = {'blah:blub'}
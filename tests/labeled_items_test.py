@@ -0,0 +1,56 @@
+import numpy
+
+from data_sets.image_file_data_sets import nth_index_and_value
+from data_sets.labeled_items import LabeledItems, top_k, top_labels
+from tests.test_base import TestBase
+
+__author__ = 'Lene Preuss <lene.preuss@gmail.com>'
+
+
+class LabeledItemsTest(TestBase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.predictions = numpy.array([
+            [0.1, 0.4, 0.0, 0.5],
+            [0.3, 0.2, 0.3, 0.2],
+        ])
+
+    def test_top_k_is_sorted(self) -> None:
+        indices, values = top_k(self.predictions, 2)
+        self.assertEqual([[3, 1], [0, 2]], indices.tolist())
+        self.assertEqual([[0.5, 0.4], [0.3, 0.3]], values.tolist())
+
+    def test_top_k_resolves_ties_by_index(self) -> None:
+        indices, _ = top_k(numpy.array([[0.2, 0.4, 0.2, 0.4, 0.2]]), 3)
+        self.assertEqual([[1, 3, 0]], indices.tolist())
+
+    def test_top_k_larger_than_number_of_classes(self) -> None:
+        indices, _ = top_k(self.predictions, 10)
+        self.assertEqual([[3, 1, 0, 2], [0, 2, 1, 3]], indices.tolist())
+
+    def test_top_k_ranks_nan_last(self) -> None:
+        predictions = numpy.array([[numpy.nan, 0.4, numpy.nan, 0.5], [numpy.nan] * 4])
+        indices, values = top_k(predictions, 3)
+        self.assertEqual([[3, 1, 0], [0, 1, 2]], indices.tolist())
+        self.assertEqual([0.5, 0.4], values[0, :2].tolist())
+        self.assertTrue(numpy.isnan(values[0, 2]) and numpy.isnan(values[1]).all())
+        self.assertEqual([[('d', 0.5), ('b', 0.4)], []], top_labels(predictions, ['a', 'b', 'c', 'd']))
+
+    def test_top_labels_applies_threshold(self) -> None:
+        self.assertEqual(
+            [[('d', 0.5), ('b', 0.4)], [('a', 0.3), ('c', 0.3)]],
+            top_labels(self.predictions, ['a', 'b', 'c', 'd'], k=3, threshold=0.25)
+        )
+
+    def test_labels_sorted_by_probability(self) -> None:
+        labeled = LabeledItems(self.generate_items(1), {'a': 0, 'b': 0, 'c': 0, 'd': 0})
+        self.assertEqual(
+            [('d', 0.5), ('b', 0.4), ('a', 0.1)],
+            list(labeled.labels_sorted_by_probability([0.1, 0.4, 0., 0.5]).items())
+        )
+
+    def test_nth_index_and_value_with_ties(self) -> None:
+        self.assertEqual(
+            [(0, 0.4), (2, 0.4), (1, 0.1)], [nth_index_and_value([0.4, 0.1, 0.4], n) for n in (1, 2, 3)]
+        )
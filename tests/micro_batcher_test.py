@@ -0,0 +1,63 @@
+from threading import Thread
+from time import sleep
+from typing import List
+from unittest import TestCase
+
+import numpy
+
+from inference.micro_batcher import MicroBatcher
+
+__author__ = 'Lene Preuss <lene.preuss@gmail.com>'
+
+
+class MicroBatcherTest(TestCase):
+
+    def setUp(self) -> None:
+        self.batch_sizes = []  # type: List[int]
+
+    def predict(self, images: numpy.ndarray) -> numpy.ndarray:
+        self.batch_sizes.append(len(images))
+        return images.sum(axis=1)
+
+    def test_predictions_belong_to_their_images(self) -> None:
+        batcher = MicroBatcher(self.predict, max_batch_size=4, max_latency=0.05)
+        predictions = batcher.predict([numpy.full(2, i) for i in range(10)])
+        batcher.close()
+        self.assertEqual([2 * i for i in range(10)], predictions)
+
+    def test_concurrent_requests_are_batched(self) -> None:
+        batcher = MicroBatcher(self.predict, max_batch_size=8, max_latency=0.2)
+        threads = [Thread(target=batcher.predict, args=([numpy.ones(2)],)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        batcher.close()
+        self.assertEqual([8], self.batch_sizes)
+        self.assertEqual(8, batcher.stats.summary()['mean_batch_size'])
+
+    def test_batch_is_not_held_longer_than_latency_window(self) -> None:
+        batcher = MicroBatcher(self.predict, max_batch_size=8, max_latency=0.01)
+        batcher.submit(numpy.ones(2))
+        sleep(0.1)
+        self.assertEqual([1], self.batch_sizes)
+        batcher.close()
+
+    def test_errors_are_passed_to_requests(self) -> None:
+        def fail(images: numpy.ndarray) -> numpy.ndarray:
+            raise ValueError('model failed')
+
+        batcher = MicroBatcher(fail)
+        with self.assertRaises(ValueError):
+            batcher.predict([numpy.ones(2)])
+        batcher.close()
+
+    def test_stats(self) -> None:
+        batcher = MicroBatcher(self.predict, max_latency=0.)
+        self.assertIsNone(batcher.stats.summary()['p50'])
+        batcher.predict([numpy.ones(2)] * 3)
+        batcher.close()
+        summary = batcher.stats.summary()
+        self.assertEqual(3, summary['requests'])
+        self.assertLessEqual(summary['p50'], summary['p99'])
+        self.assertGreater(summary['throughput'], 0)
@@ -0,0 +1,56 @@
+from os import listdir
+from os.path import join
+from unittest.mock import patch
+
+import numpy
+from keras.layers import Dense, Flatten, Input
+from keras.models import Model
+
+from inference.model_bundle import ModelBundle, bundle_dir
+from tests.test_base import TestBase
+
+__author__ = 'Lene Preuss <lene.preuss@gmail.com>'
+
+
+class ModelBundleTest(TestBase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        inputs = Input(shape=(8, 6, 3))
+        self.model = Model(inputs=inputs, outputs=Dense(3, activation='softmax')(Flatten()(inputs)))
+        self.directory = join(self.DOWNLOAD_ROOT, 'model.bundle')
+
+    def test_bundle_dir(self) -> None:
+        self.assertEqual('data/weights_likes_48.bundle', bundle_dir('data/weights_likes_48.hdf5'))
+
+    def test_saved_bundle_predicts_like_model(self) -> None:
+        ModelBundle(self.model, {'b': 1, 'a': 0, '<3': 2}, (6, 8), network_type='dense').save(self.directory)
+        self.assertTrue(ModelBundle.exists(self.directory))
+        bundle = ModelBundle.load(self.directory)
+        self.assertEqual(['a', 'b', '<3'], bundle.labels)
+        self.assertEqual((6, 8), bundle.image_size)
+        self.assertEqual('add_border', bundle.preprocessing['resize'])
+        self.assertEqual('dense', bundle.network_type)
+        images = numpy.random.RandomState(0).uniform(0, 255, (4, 8, 6, 3))
+        self.assertTrue(
+            numpy.allclose(self.model.predict_on_batch(images), bundle.model.predict_on_batch(images))
+        )
+
+    def test_missing_bundle(self) -> None:
+        self.assertFalse(ModelBundle.exists(self.directory))
+        with self.assertRaises(FileNotFoundError):
+            ModelBundle.load(self.directory)
+
+    def test_save_replaces_existing_bundle(self) -> None:
+        ModelBundle(self.model, {'a': 0, 'b': 1, 'c': 2}, (6, 8)).save(self.directory)
+        ModelBundle(self.model, {'x': 0, 'y': 1, 'z': 2}, (6, 8)).save(self.directory)
+        self.assertEqual(['x', 'y', 'z'], ModelBundle.load(self.directory).labels)
+        self.assertEqual(['model.bundle'], [f for f in listdir(self.DOWNLOAD_ROOT) if 'bundle' in f])
+
+    def test_failed_save_keeps_previous_bundle(self) -> None:
+        ModelBundle(self.model, {'a': 0, 'b': 1, 'c': 2}, (6, 8)).save(self.directory)
+        with patch.object(self.model, 'save_weights', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                ModelBundle(self.model, {'x': 0, 'y': 1, 'z': 2}, (6, 8)).save(self.directory)
+        self.assertEqual(['a', 'b', 'c'], ModelBundle.load(self.directory).labels)
+        self.assertEqual(['model.bundle'], [f for f in listdir(self.DOWNLOAD_ROOT) if 'bundle' in f])
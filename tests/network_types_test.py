@@ -0,0 +1,81 @@
+import numpy
+from os.path import join
+
+from keras.applications import densenet, inception_v3, vgg16, VGG16
+from keras.layers import Input
+from keras.models import Model, model_from_json
+
+from network_types import (
+    CUSTOM_OBJECTS, InputNormalization, freeze_layers, inception as inception_model, vgg16 as vgg16_model
+)
+from tests.test_base import TestBase
+
+__author__ = 'Lene Preuss <lene.preuss@gmail.com>'
+
+SHAPE = (48, 48, 3)
+
+
+class NetworkTypesTest(TestBase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.images = numpy.random.RandomState(0).randint(0, 256, (2, *SHAPE)).astype(numpy.uint8)
+
+    def test_input_normalization_matches_preprocess_input(self) -> None:
+        for mode, preprocess_input in (
+                ('tf', inception_v3.preprocess_input), ('caffe', vgg16.preprocess_input),
+                ('torch', densenet.preprocess_input)
+        ):
+            inputs = Input(shape=SHAPE, dtype='uint8')
+            normalized = Model(inputs=inputs, outputs=InputNormalization(mode)(inputs))
+            self.assertTrue(
+                numpy.allclose(
+                    preprocess_input(self.images.astype(numpy.float32)),
+                    normalized.predict_on_batch(self.images), atol=1e-4
+                ), mode
+            )
+
+    def test_invalid_normalization_mode(self) -> None:
+        with self.assertRaises(ValueError):
+            InputNormalization('bgr')
+
+    def test_model_takes_float_input_by_default(self) -> None:
+        model = vgg16_model(input_shape=SHAPE, classes=2, connected_layers=(4,))
+        self.assertEqual('float32', model.input.dtype)
+
+    def test_uint8_input_model_normalizes_in_first_layer(self) -> None:
+        model = vgg16_model(input_shape=SHAPE, classes=2, connected_layers=(4,), uint8_input=True)
+        self.assertEqual('uint8', model.input.dtype)
+        self.assertIsInstance(model.layers[1], InputNormalization)
+        self.assertEqual('caffe', model.layers[1].mode)
+        self.assertEqual((2, 2), model.predict_on_batch(self.images).shape)
+
+    def test_uint8_input_model_is_serializable(self) -> None:
+        model = vgg16_model(input_shape=SHAPE, classes=2, connected_layers=(4,), uint8_input=True)
+        loaded = model_from_json(model.to_json(), custom_objects=CUSTOM_OBJECTS)
+        loaded.set_weights(model.get_weights())
+        self.assertTrue(
+            numpy.allclose(model.predict_on_batch(self.images), loaded.predict_on_batch(self.images))
+        )
+
+    def test_pretrained_model_normalizes_float_input(self) -> None:
+        weights_file = join(self.DOWNLOAD_ROOT, 'vgg16_notop.h5')
+        VGG16(include_top=False, weights=None, input_shape=SHAPE).save_weights(weights_file)
+        model = vgg16_model(input_shape=SHAPE, classes=2, connected_layers=(4,), weights=weights_file)
+        self.assertEqual('float32', model.input.dtype)
+        self.assertIsInstance(model.layers[1], InputNormalization)
+
+    def test_fully_connected_layers_can_not_be_frozen(self) -> None:
+        model = vgg16_model(input_shape=SHAPE, classes=2, connected_layers=(4,))
+        num_backbone_layers = len(model.layers) - 3
+        self.assertEqual(num_backbone_layers, freeze_layers(model, num_backbone_layers))
+        with self.assertRaises(ValueError):
+            freeze_layers(model, num_backbone_layers + 1)
+        with self.assertRaises(ValueError):
+            freeze_layers(model, up_to=model.layers[-1].name)
+
+    def test_freeze_up_to_layer_name_ending_a_block(self) -> None:
+        model = inception_model(input_shape=(75, 75, 3), classes=2, connected_layers=(4,))
+        names = [layer.name for layer in model.layers]
+        self.assertEqual(names.index('mixed9') + 1, freeze_layers(model, up_to='mixed9'))
+        self.assertTrue(model.get_layer('mixed9_1').trainable)
@@ -0,0 +1,70 @@
+import pstats
+from io import StringIO
+from os import listdir
+from os.path import join
+from tempfile import TemporaryDirectory
+from time import sleep
+from unittest import TestCase
+
+from utils.phase_timer import PhaseTimer
+
+__author__ = 'Lene Preuss <lene.preuss@gmail.com>'
+
+
+class PhaseTimerTest(TestCase):
+
+    def test_phases_are_timed_separately(self) -> None:
+        timer = PhaseTimer()
+        with timer.phase('first'):
+            sleep(0.01)
+        with timer.phase('second'):
+            pass
+        self.assertEqual(['first', 'second'], list(timer.as_dict().keys()))
+        self.assertGreaterEqual(timer.wall_time('first'), 0.01)
+        self.assertLess(timer.wall_time('second'), 0.01)
+        self.assertEqual(0., timer.wall_time('third'))
+
+    def test_repeated_phases_add_up(self) -> None:
+        timer = PhaseTimer()
+        for _ in range(2):
+            with timer.phase('phase'):
+                sleep(0.01)
+        self.assertGreaterEqual(timer.wall_time('phase'), 0.02)
+
+    def test_time_is_recorded_when_phase_raises(self) -> None:
+        timer = PhaseTimer()
+        with self.assertRaises(ValueError):
+            with timer.phase('failing'):
+                raise ValueError()
+        self.assertIn('failing', timer.as_dict())
+
+    def test_nested_phases(self) -> None:
+        timer = PhaseTimer()
+        with timer.phase('outer'):
+            with timer.phase('inner'):
+                sleep(0.01)
+        self.assertEqual(['outer/inner', 'outer'], list(timer.as_dict().keys()))
+        self.assertGreaterEqual(timer.wall_time('outer'), timer.wall_time('outer/inner'))
+
+    def test_table_lists_nested_phases_below_outer_phase(self) -> None:
+        timer = PhaseTimer()
+        with timer.phase('first'):
+            with timer.phase('inner'):
+                pass
+        with timer.phase('second'):
+            pass
+        lines = timer.table().splitlines()
+        self.assertEqual(5, len(lines))
+        for line, phase in zip(lines, ['Phase', 'first', '  inner', 'second', 'Total']):
+            self.assertTrue(line.startswith(phase + ' '), line)
+
+    def test_outer_phases_are_profiled(self) -> None:
+        with TemporaryDirectory() as profile_dir:
+            timer = PhaseTimer(profile_dir)
+            with timer.phase('outer'):
+                with timer.phase('inner'):
+                    sleep(0.01)
+            self.assertEqual(['outer.prof'], listdir(profile_dir))
+            output = StringIO()
+            pstats.Stats(join(profile_dir, 'outer.prof'), stream=output).print_stats()
+            self.assertIn('time.sleep', output.getvalue())
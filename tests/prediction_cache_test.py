@@ -0,0 +1,49 @@
+from os.path import join
+
+import numpy
+
+from inference.prediction_cache import PredictionCache, file_hash, image_hash, model_fingerprint
+from tests.test_base import TestBase
+
+__author__ = 'Lene Preuss <lene.preuss@gmail.com>'
+
+
+class PredictionCacheTest(TestBase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.cache_file = join(self.DOWNLOAD_ROOT, 'cache.sqlite')
+        self.weights_file = join(self.DOWNLOAD_ROOT, 'weights.hdf5')
+        with open(self.weights_file, 'wb') as file:
+            file.write(b'weights')
+
+    def test_predictions_are_persistent(self) -> None:
+        cache = PredictionCache(self.cache_file, 'model')
+        cache.put({'a': numpy.array([0.25, 0.75]), 'b': numpy.array([1., 0.])})
+        cache.close()
+        cache = PredictionCache(self.cache_file, 'model')
+        found = cache.get(['a', 'c'])
+        self.assertEqual(['a'], list(found))
+        self.assertEqual([0.25, 0.75], found['a'].tolist())
+        self.assertEqual(2, len(cache))
+
+    def test_predictions_are_separate_per_model(self) -> None:
+        PredictionCache(self.cache_file, 'model').put({'a': numpy.array([1., 0.])})
+        self.assertEqual({}, PredictionCache(self.cache_file, 'retrained model').get(['a']))
+
+    def test_many_images_are_looked_up(self) -> None:
+        cache = PredictionCache(self.cache_file, 'model')
+        cache.put({str(i): numpy.array([i]) for i in range(1200)})
+        self.assertEqual(1200, len(cache.get(str(i) for i in range(1500))))
+
+    def test_fingerprint_depends_on_weights_and_size(self) -> None:
+        fingerprint = model_fingerprint('{}', self.weights_file, (48, 48))
+        self.assertEqual(fingerprint, model_fingerprint('{}', self.weights_file, (48, 48)))
+        self.assertNotEqual(fingerprint, model_fingerprint('{}', self.weights_file, (64, 64)))
+        self.assertNotEqual(fingerprint, model_fingerprint('{"layers": []}', self.weights_file, (48, 48)))
+        with open(self.weights_file, 'ab') as file:
+            file.write(b' retrained')
+        self.assertNotEqual(fingerprint, model_fingerprint('{}', self.weights_file, (48, 48)))
+
+    def test_file_hash_is_content_hash(self) -> None:
+        self.assertEqual(image_hash(b'weights'), file_hash(self.weights_file))
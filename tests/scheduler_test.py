@@ -0,0 +1,130 @@
+import json
+import os
+from os import utime
+from os.path import join
+from time import time
+from unittest.mock import patch
+
+from performance.scheduler import (
+    JobQueue, Job, grid_jobs, run_worker, settings_key, MAX_ATTEMPTS, STALE_SECONDS
+)
+from tests.test_base import TestBase
+
+__author__ = 'Lene Preuss <lene.preuss@gmail.com>'
+
+EPOCHS = (1, 2)
+
+
+class SchedulerTest(TestBase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.jobs = grid_jobs((48, 64), ((8,),), ('vgg16', 'vgg19'), ('sgd',), EPOCHS)
+        self.queue = JobQueue(self.DOWNLOAD_ROOT)
+        self.queue.submit(self.jobs)
+
+    def test_grid_jobs_in_report_order(self) -> None:
+        self.assertEqual(
+            [(48, 'vgg16'), (48, 'vgg19'), (64, 'vgg16'), (64, 'vgg19')],
+            [(job.size, job.algo) for job in self.jobs]
+        )
+        self.assertEqual(Job(48, (8,), 'vgg16', 'sgd', EPOCHS), self.jobs[0])
+
+    def test_every_job_is_claimed_once(self) -> None:
+        claimed = [self.queue.claim() for _ in range(len(self.jobs))]
+        self.assertEqual(sorted(self.jobs), sorted(claimed))
+        self.assertIsNone(JobQueue(self.DOWNLOAD_ROOT).claim())
+
+    def test_preferred_size_is_claimed_first(self) -> None:
+        job = self.queue.claim(64)
+        self.assertEqual(64, job.size if job else None)
+
+    def test_finished_jobs_are_not_run_again(self) -> None:
+        for job in self.jobs:
+            self.queue.complete(job, {'accuracies': [0.5, 0.6]})
+        self.queue.submit(self.jobs)
+        self.assertIsNone(self.queue.claim())
+        self.assertEqual({'accuracies': [0.5, 0.6]}, self.queue.result(self.jobs[0]))
+
+    def test_stale_claims_are_taken_over(self) -> None:
+        for _ in self.jobs:
+            self.queue.claim()
+        claim_file = join(self.DOWNLOAD_ROOT, 'claims', self.jobs[0].id + '.json')
+        utime(claim_file, (time() - STALE_SECONDS - 1, time() - STALE_SECONDS - 1))
+        self.assertEqual(self.jobs[0], self.queue.claim())
+        self.assertEqual(1, len(self.queue.errors(self.jobs[0])))
+        self.assertTrue(self.queue.errors(self.jobs[0])[0].startswith('Worker stopped: process'))
+
+    def test_job_killing_its_worker_is_given_up_after_max_attempts(self) -> None:
+        job = self.jobs[0]
+        claim_file = join(self.DOWNLOAD_ROOT, 'claims', job.id + '.json')
+        for _ in range(MAX_ATTEMPTS):
+            self.assertEqual(job, self.queue.claim(job.size))
+            utime(claim_file, (time() - STALE_SECONDS - 1, time() - STALE_SECONDS - 1))
+        self.assertNotIn(job, [self.queue.claim(job.size) for _ in self.jobs])
+        self.assertEqual(MAX_ATTEMPTS, len(self.queue.errors(job)))
+
+    def test_claims_of_dead_local_workers_are_taken_over(self) -> None:
+        for _ in self.jobs:
+            self.queue.claim()
+        claim_file = join(self.DOWNLOAD_ROOT, 'claims', self.jobs[1].id + '.json')
+        with open(claim_file) as file:
+            claim = json.load(file)
+        claim['pid'] = _unused_pid()
+        with open(claim_file, 'w') as file:
+            json.dump(claim, file)
+        self.assertEqual(self.jobs[1], self.queue.claim())
+
+    def test_job_id_depends_on_epochs_and_settings(self) -> None:
+        job = self.jobs[0]
+        other_settings = settings_key({'batch_size': 8})
+        ids = {job.id, job._replace(epochs=(1, 3)).id, job._replace(settings=other_settings).id}
+        self.assertEqual(3, len(ids))
+
+    def test_only_jobs_with_own_settings_are_claimed(self) -> None:
+        settings = settings_key({'batch_size': 8})
+        self.assertIsNone(self.queue.claim(settings=settings))
+        job = self.jobs[0]._replace(settings=settings)
+        self.queue.submit([job])
+        self.assertEqual(job, self.queue.claim(settings=settings))
+
+    def test_failed_jobs_are_retried(self) -> None:
+        job = self.queue.claim()
+        assert job is not None
+        self.queue.fail(job, 'out of memory')
+        self.assertFalse(self.queue.is_done(job))
+        self.assertEqual(['out of memory'], self.queue.errors(job))
+        self.assertEqual(job, self.queue.claim(job.size))
+
+    def test_failed_jobs_are_given_up_after_max_attempts(self) -> None:
+        job = self.jobs[0]
+        for _ in range(MAX_ATTEMPTS):
+            self.queue.fail(job, 'out of memory')
+        self.assertNotIn(job, [self.queue.claim() for _ in self.jobs])
+        self.queue.submit([job])
+        self.assertEqual(['out of memory'] * MAX_ATTEMPTS, self.queue.errors(job))
+        self.queue.submit([job], retry_failed=True)
+        self.assertEqual([], self.queue.errors(job))
+
+    def test_worker_does_not_store_result_of_failed_job(self) -> None:
+        jobs = [job._replace(settings=settings_key({})) for job in self.jobs]
+        self.queue.submit(jobs)
+        with patch('performance.sweep_engine.SweepEngine') as engine:
+            engine.return_value.evaluate.side_effect = RuntimeError('out of memory')
+            self.assertEqual(0, run_worker(self.DOWNLOAD_ROOT, {}))
+        self.assertEqual(len(jobs) * MAX_ATTEMPTS, engine.return_value.evaluate.call_count)
+        for job in jobs:
+            self.assertIsNone(self.queue.result(job))
+            self.assertEqual(['RuntimeError: out of memory'] * MAX_ATTEMPTS, self.queue.errors(job))
+
+
+def _unused_pid() -> int:
+    pid = 2 ** 22
+    while True:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return pid
+        except PermissionError:
+            pass
+        pid -= 1
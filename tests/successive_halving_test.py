@@ -0,0 +1,72 @@
+from os import listdir
+from os.path import dirname
+from typing import List, Tuple
+from unittest import TestCase
+
+from performance.scheduler import grid_jobs
+from performance.successive_halving import SuccessiveHalving
+from performance.sweep_engine import SweepResult, TrainingFailed
+
+__author__ = 'Lene Preuss <lene.preuss@gmail.com>'
+
+EPOCHS = (1, 2, 4)
+ALGOS = ('vgg16', 'vgg19', 'resnet50', 'inception', 'xception', 'densenet121', 'nasnet', 'inception_resnet')
+ACCURACY = {algo: 0.5 + 0.01 * i for i, algo in enumerate(ALGOS)}
+
+
+class FakeEngine:
+    """Stands in for SweepEngine: accuracies depend on the network type only, densenet121 fails."""
+
+    def __init__(self) -> None:
+        self.calls = []  # type: List[Tuple[str, int, int]]
+        self.stored_models = []  # type: List[int]
+
+    def train(
+            self, size: int, layers: Tuple[int, ...], algo: str, optimizer: str, initial_epoch: int,
+            epochs: int, model_file: str
+    ) -> SweepResult:
+        self.calls.append((algo, initial_epoch, epochs))
+        self.stored_models.append(len(listdir(dirname(model_file))))
+        if algo == 'densenet121':
+            raise TrainingFailed('too small')
+        open(model_file, 'w').close()
+        return SweepResult([ACCURACY[algo] + 0.001 * epochs], 1., 2.)
+
+
+class SuccessiveHalvingTest(TestCase):
+
+    def setUp(self) -> None:
+        self.engine = FakeEngine()
+        self.jobs = grid_jobs((48,), ((8,),), ALGOS, ('sgd',), EPOCHS)
+        self.results = SuccessiveHalving(self.engine, eta=2).run(self.jobs)  # type: ignore
+
+    def test_only_best_configurations_continue(self) -> None:
+        trained_for = {algo: max(epochs for a, _, epochs in self.engine.calls if a == algo) for algo in ALGOS}
+        self.assertEqual(4, trained_for['inception_resnet'])
+        self.assertEqual(2, trained_for['nasnet'])
+        self.assertEqual(2, trained_for['xception'])
+        self.assertEqual(1, trained_for['vgg16'])
+
+    def test_training_continues_where_it_stopped(self) -> None:
+        self.assertEqual(
+            [('inception_resnet', 0, 1), ('inception_resnet', 1, 2), ('inception_resnet', 2, 4)],
+            [call for call in self.engine.calls if call[0] == 'inception_resnet']
+        )
+
+    def test_failed_configurations_are_dropped_at_once(self) -> None:
+        self.assertEqual(1, len([call for call in self.engine.calls if call[0] == 'densenet121']))
+        self.assertEqual([0., 0., 0.], self.results[self.jobs[ALGOS.index('densenet121')]].accuracies)
+
+    def test_unreached_steps_have_no_accuracy(self) -> None:
+        result = self.results[self.jobs[0]]
+        self.assertEqual([ACCURACY['vgg16'] + 0.001, None, None], result.accuracies)
+        self.assertEqual((1., 2.), (result.wall_time, result.cpu_time))
+
+    def test_models_of_dropped_configurations_are_deleted(self) -> None:
+        # 7 of 8 configurations trained in the first step, 3 continue to the second and 1 to the third
+        self.assertEqual([0, 1, 2, 3, 4, 5, 5, 6], self.engine.stored_models[:8])
+        self.assertEqual([3, 3, 3, 1], self.engine.stored_models[8:])
+
+    def test_eta_must_reduce(self) -> None:
+        with self.assertRaises(ValueError):
+            SuccessiveHalving(self.engine, eta=1)  # type: ignore
@@ -0,0 +1,68 @@
+from functools import partial
+from os import sep
+from os.path import join
+
+from keras.models import load_model
+
+from acquisition.ebay_downloader_io import EbayDownloaderIO
+from acquisition.item import Item
+from acquisition.items import Items
+from category import Category
+from network_types import CUSTOM_OBJECTS
+from performance.sweep_engine import SweepEngine, TrainingFailed
+from tests.test_base import TestBase, create_item_dict
+
+__author__ = 'Lene Preuss <lene.preuss@gmail.com>'
+
+SIZE = 48
+
+
+class SweepEngineTest(TestBase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        test_pic = join(sep, *__file__.split('/')[:-1], 'data', 'test.jpg')
+        self.api.get_item = partial(create_item_dict, picture_url=['file://' + test_pic])
+        Item.download_root = self.DOWNLOAD_ROOT
+        category = Category(
+            {'CategoryID': '1', 'CategoryName': 'Kleider', 'CategoryNamePath': '0:1', 'LeafCategory': 'true'}
+        )
+        items = Items([Item(self.api, category, i) for i in range(4)])
+        items[0].like()
+        items[1].like()
+        EbayDownloaderIO(self.DOWNLOAD_ROOT, items_file='items.pickle').save_items(items)
+        self.engine = SweepEngine(
+            join(self.DOWNLOAD_ROOT, 'items.pickle'), batch_size=2, likes_only=True, test_share=0.5
+        )
+
+    def test_evaluate_returns_accuracy_per_number_of_epochs(self) -> None:
+        result = self.engine.evaluate(SIZE, (4,), 'vgg16', 'sgd', (1, 2))
+        self.assertEqual(2, len(result.accuracies))
+        self.assertTrue(all(accuracy is not None and 0 <= accuracy <= 1 for accuracy in result.accuracies))
+        self.assertGreater(result.wall_time, 0)
+
+    def test_images_are_decoded_once_per_size(self) -> None:
+        self.engine.evaluate(SIZE, (4,), 'vgg16', 'sgd', (1,))
+        decoded = self.engine._decoded['train'][0]
+        self.assertEqual((2, SIZE, SIZE, 3), decoded.shape)
+        self.engine.evaluate(SIZE, (4,), 'vgg19', 'adam', (1,))
+        self.assertIs(decoded, self.engine._decoded['train'][0])
+
+    def test_failing_configuration_has_zero_accuracy(self) -> None:
+        result = self.engine.evaluate(SIZE, (4,), 'BWAHAHAH FAIL!', 'sgd', (1, 2))
+        self.assertEqual(([0., 0.], 0.), (result.accuracies, result.wall_time))
+
+    def test_training_continues_with_optimizer_state(self) -> None:
+        model_file = join(self.DOWNLOAD_ROOT, 'model.hdf5')
+        self.engine.train(SIZE, (4,), 'vgg16', 'adam', 0, 1, model_file)
+        result = self.engine.train(SIZE, (4,), 'vgg16', 'adam', 1, 2, model_file)
+        self.assertGreater(result.wall_time, 0)
+        # one batch of two training images per epoch
+        self.assertEqual(2, int(load_model(model_file, custom_objects=CUSTOM_OBJECTS).optimizer.iterations))
+
+    def test_unreadable_model_fails_training(self) -> None:
+        model_file = join(self.DOWNLOAD_ROOT, 'model.hdf5')
+        with open(model_file, 'w') as file:
+            file.write('not a model')
+        with self.assertRaises(TrainingFailed):
+            self.engine.train(SIZE, (4,), 'vgg16', 'adam', 1, 2, model_file)
@@ -2,7 +2,7 @@ import unittest
 from os.path import isdir
 from os import makedirs
 from shutil import rmtree
-from typing import Dict, Any
+from typing import Any, Dict, List, Optional, Union
 from unittest.mock import Mock
 
 from acquisition.item import Item
@@ -33,7 +33,9 @@ class TestBase(unittest.TestCase):
         return Items(raw_items)
 
 
-def create_item_dict(item_id: int, specifics: str=None, picture_url: str=None) -> Dict[str, Any]:
+def create_item_dict(
+        item_id: int, specifics: str=None, picture_url: Optional[Union[str, List[str]]]=None
+) -> Dict[str, Any]:
     return {
         'ItemID': item_id,
         'Title': TestBase.MOCK_TITLE,
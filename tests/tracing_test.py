@@ -0,0 +1,58 @@
+import json
+from os.path import join
+from threading import Thread
+
+from utils import tracing
+from tests.test_base import TestBase
+
+__author__ = 'Lene Preuss <lene.preuss@gmail.com>'
+
+
+class TracingTest(TestBase):
+
+    def tearDown(self) -> None:
+        tracing.stop_tracing()
+        super().tearDown()
+
+    def test_nothing_is_recorded_without_tracing(self) -> None:
+        with tracing.span('span'):
+            pass
+        self.assertIsNone(tracing.stop_tracing())
+
+    def test_spans_are_recorded(self) -> None:
+        tracer = tracing.start_tracing()
+        with tracing.span('outer', 'test'):
+            with tracing.span('inner', 'test', item_id=1):
+                pass
+        inner, outer = tracer.events
+        self.assertEqual(('inner', 'test', {'item_id': 1}), (inner['name'], inner['cat'], inner['args']))
+        self.assertLessEqual(outer['ts'], inner['ts'])
+        self.assertGreaterEqual(outer['dur'], inner['dur'])
+
+    def test_spans_are_recorded_when_code_raises(self) -> None:
+        tracer = tracing.start_tracing()
+        with self.assertRaises(ValueError):
+            with tracing.span('failing'):
+                raise ValueError()
+        self.assertEqual(['failing'], [event['name'] for event in tracer.events])
+
+    def test_threads_are_distinguished(self) -> None:
+        tracer = tracing.start_tracing()
+
+        def work() -> None:
+            with tracing.span('work'):
+                pass
+
+        threads = [Thread(target=work, name='worker-{}'.format(i)) for i in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(2, len({event['tid'] for event in tracer.events}))
+
+        trace_file = join(self.DOWNLOAD_ROOT, 'trace.json')
+        tracer.save(trace_file)
+        with open(trace_file) as file:
+            events = json.load(file)['traceEvents']
+        thread_names = {event['args']['name'] for event in events if event['ph'] == 'M'}
+        self.assertEqual({'worker-0', 'worker-1'}, thread_names)
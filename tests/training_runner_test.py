@@ -1,8 +1,16 @@
 __author__ = 'Lene Preuss <lene.preuss@gmail.com>'
 
+import json
+from os.path import isfile, join
+
+from keras.applications import VGG16
 from recordclass import recordclass
+from acquisition.items import Items
+from data_sets.image_archive import ImageArchiveWriter
 from tests.test_base import TestBase
-from train import TrainingRunner
+from train import TrainingRunner, BottleneckTrainingRunner, check_arguments
+from inference.model_bundle import ModelBundle, bundle_dir
+from network_types import CUSTOM_OBJECTS, unfreeze_layers
 
 
 class Args(
@@ -10,7 +18,9 @@ class Args(
         'Args', [
             'verbose', 'image_size', 'min_valid_tag', 'likes_only', 'category', 'batch_size', 'demo',
             'num_epochs', 'test', 'save_folder', 'item_file', 'weights_file', 'type',
-            'optimizer', 'layers', 'test_set_share', 'random_seed', 'tensorboard'
+            'optimizer', 'layers', 'test_set_share', 'random_seed', 'tensorboard',
+            'image_archive', 'bottleneck', 'backbone_weights', 'uint8_input', 'freeze_layers',
+            'freeze_up_to', 'fine_tune_epochs', 'results_file', 'timings', 'profile_dir'
         ]
     )
 ):
@@ -21,7 +31,10 @@ class Args(
             demo=False, num_epochs=0, test=False, save_folder=TestBase.DOWNLOAD_ROOT,
             item_file='', weights_file='',
             type='inception', optimizer='adam', layers=(1,), test_set_share=0.2, random_seed=None,
-            tensorboard=False
+            tensorboard=False, image_archive=None, bottleneck=False, backbone_weights=None,
+            uint8_input=False,
+            freeze_layers=None, freeze_up_to=None, fine_tune_epochs=0, results_file=None,
+            timings=None, profile_dir=None
         )
 
 
@@ -40,3 +53,168 @@ class TrainingRunnerTest(TestBase):
             args = Args.default_args()
             args.type = 'BWAHAHAH FAIL!'
             TrainingRunner(args)
+
+    def test_bottleneck_trains_only_fully_connected_layers(self) -> None:
+        args = Args.default_args()
+        args.type = 'vgg16'
+        args.image_size = 48
+        args.bottleneck = True
+        args.backbone_weights = self._backbone_weights()
+        runner = BottleneckTrainingRunner(args)
+        self.assertEqual((None, 512), runner.model.input_shape)
+
+    def test_freeze_layers(self) -> None:
+        args = Args.default_args()
+        args.type = 'vgg16'
+        args.image_size = 48
+        args.freeze_layers = 4
+        runner = TrainingRunner(args)
+        self.assertEqual(4, runner.num_frozen_layers)
+        self.assertEqual(
+            [False] * 4 + [True] * (len(runner.model.layers) - 4),
+            [layer.trainable for layer in runner.model.layers]
+        )
+
+    def test_freeze_up_to_block(self) -> None:
+        args = Args.default_args()
+        args.type = 'vgg16'
+        args.image_size = 48
+        args.freeze_up_to = 'block2'
+        runner = TrainingRunner(args)
+        frozen = [layer.name for layer in runner.model.layers if not layer.trainable]
+        self.assertEqual('block2_pool', frozen[-1])
+        unfreeze_layers(runner.model)
+        self.assertTrue(all(layer.trainable for layer in runner.model.layers))
+
+    def test_freeze_up_to_nonexisting_layer(self) -> None:
+        args = Args.default_args()
+        args.type = 'vgg16'
+        args.image_size = 48
+        args.freeze_up_to = 'BWAHAHAH FAIL!'
+        with self.assertRaises(ValueError):
+            TrainingRunner(args)
+
+    def test_bottleneck_without_backbone_weights_is_rejected(self) -> None:
+        args = Args.default_args()
+        args.bottleneck = True
+        with self.assertRaises(ValueError):
+            check_arguments(args)
+
+    def test_freezing_with_bottleneck_is_rejected(self) -> None:
+        args = Args.default_args()
+        args.bottleneck = True
+        args.backbone_weights = 'imagenet'
+        args.freeze_up_to = 'block2'
+        with self.assertRaises(ValueError):
+            check_arguments(args)
+
+    def test_fine_tuning_without_frozen_layers_is_rejected(self) -> None:
+        args = Args.default_args()
+        args.fine_tune_epochs = 1
+        with self.assertRaises(ValueError):
+            check_arguments(args)
+        args.freeze_layers = 4
+        check_arguments(args)
+
+    def test_image_archive_with_other_image_size_is_rebuilt(self) -> None:
+        args = Args.default_args()
+        args.type = 'vgg16'
+        args.image_size = 48
+        args.image_archive = join(TestBase.DOWNLOAD_ROOT, 'archive')
+        runner = TrainingRunner(args)
+        ImageArchiveWriter(args.image_archive, (32, 32)).build(Items([]))
+        archive = runner._get_image_archive(Items([]))
+        self.assertIsNotNone(archive)
+        self.assertEqual((48, 48), archive.size)  # type: ignore
+
+    def test_results_file(self) -> None:
+        args = Args.default_args()
+        args.type = 'vgg16'
+        args.image_size = 48
+        args.results_file = join(TestBase.DOWNLOAD_ROOT, 'results.json')
+        TrainingRunner(args).run()
+        with open(args.results_file) as file:
+            results = json.load(file)
+        self.assertEqual('vgg16', results['config']['type'])
+        self.assertEqual(
+            [
+                'get_image_data/prepare_items', 'get_image_data', 'setup_model/load_weights', 'setup_model',
+                'run_training', 'run_test', 'run_demo'
+            ],
+            list(results['phases'].keys())
+        )
+        self.assertGreater(results['phases']['setup_model']['wall'], 0)
+        self.assertGreater(results['peak_rss'], 0)
+        self.assertEqual([], results['epochs'])
+
+    def test_model_is_saved_outside_of_timed_training(self) -> None:
+        args = Args.default_args()
+        args.type = 'vgg16'
+        args.image_size = 48
+        args.weights_file = 'test.hdf5'
+        args.results_file = join(TestBase.DOWNLOAD_ROOT, 'results.json')
+        runner = TrainingRunner(args)
+        # the test data set has no training pictures, so pretend an epoch was trained
+        runner.run_training = lambda: runner.epoch_results.append({'epoch': 1})  # type: ignore
+        runner.run()
+        with open(args.results_file) as file:
+            phases = list(json.load(file)['phases'].keys())
+        self.assertEqual(phases.index('run_training') + 1, phases.index('save_model'))
+        self.assertTrue(isfile(join(bundle_dir(runner.io.weights_file(runner._fit_type())), 'bundle.json')))
+
+    def test_timings(self) -> None:
+        args = Args.default_args()
+        args.type = 'vgg16'
+        args.image_size = 48
+        args.timings = join(TestBase.DOWNLOAD_ROOT, 'timings.json')
+        TrainingRunner(args).run()
+        with open(args.timings) as file:
+            timings = json.load(file)
+        self.assertIn('get_image_data/prepare_items', timings)
+        self.assertLessEqual(
+            timings['get_image_data/prepare_items']['wall'], timings['get_image_data']['wall']
+        )
+
+    def test_save_model_writes_bundle(self) -> None:
+        args = Args.default_args()
+        args.type = 'vgg16'
+        args.image_size = 48
+        args.weights_file = 'test.hdf5'
+        runner = TrainingRunner(args)
+        runner.save_model()
+        bundle = ModelBundle.load(bundle_dir(runner.io.weights_file(runner._fit_type())))
+        self.assertEqual((48, 48), bundle.image_size)
+        self.assertEqual('vgg16', bundle.network_type)
+        self.assertEqual(runner.model.to_json(), bundle.model.to_json())
+
+    def test_bottleneck_bundle_predicts_from_images(self) -> None:
+        args = Args.default_args()
+        args.type = 'vgg16'
+        args.image_size = 48
+        args.bottleneck = True
+        args.backbone_weights = self._backbone_weights()
+        args.weights_file = 'test.hdf5'
+        runner = BottleneckTrainingRunner(args)
+        runner.save_model()
+        bundle = ModelBundle.load(bundle_dir(runner.io.weights_file(runner._fit_type())), CUSTOM_OBJECTS)
+        self.assertEqual((None, 48, 48, 3), bundle.model.input_shape)
+        self.assertEqual(runner.model.output_shape, bundle.model.output_shape)
+
+    def test_uint8_input_bundle_records_normalization(self) -> None:
+        args = Args.default_args()
+        args.type = 'vgg16'
+        args.image_size = 48
+        args.uint8_input = True
+        args.weights_file = 'test.hdf5'
+        runner = TrainingRunner(args)
+        self.assertEqual('uint8', runner.model.input.dtype)
+        runner.save_model()
+        bundle = ModelBundle.load(bundle_dir(runner.io.weights_file(runner._fit_type())), CUSTOM_OBJECTS)
+        self.assertEqual('caffe', bundle.preprocessing['normalization'])
+        self.assertEqual('uint8', bundle.model.input.dtype)
+
+    @staticmethod
+    def _backbone_weights() -> str:
+        weights_file = join(TestBase.DOWNLOAD_ROOT, 'backbone.h5')
+        VGG16(include_top=False, weights=None, input_shape=(48, 48, 3)).save_weights(weights_file)
+        return weights_file
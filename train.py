@@ -1,19 +1,26 @@
+import json
 from argparse import ArgumentParser, Namespace
 from pprint import pprint
-from typing import Callable, Tuple, Dict, List
+from typing import Any, Callable, Tuple, Dict, List, Optional
 
 from PIL import Image
 import numpy
-from keras import Model
-from keras.callbacks import Callback, ModelCheckpoint, ReduceLROnPlateau, EarlyStopping, TensorBoard
+from keras import Model, optimizers
+from keras.callbacks import Callback, History, ModelCheckpoint, ReduceLROnPlateau, EarlyStopping, TensorBoard
 
 from acquisition.ebay_downloader_io import EbayDownloaderIO
 from acquisition.items import Items
-from data_sets.ebay_data_generator import EbayDataGenerator
+from data_sets.bottleneck_features import BottleneckFeatures
+from data_sets.ebay_data_generator import EbayDataGenerator, BatchGenerator
+from data_sets.image_archive import ImageArchive, ImageArchiveWriter
+from inference.model_bundle import ModelBundle, bundle_dir
+from utils.data_stall_monitor import DataStallMonitor
+from utils.phase_timer import PhaseTimer, peak_rss
 from utils.with_verbose import WithVerbose
 from network_types import (
     inception, xception, vgg16, vgg19, resnet50, inception_resnet_v2,
-    densenet121, densenet169, densenet201, nasnet
+    densenet121, densenet169, densenet201, nasnet, head, freeze_layers, unfreeze_layers,
+    BACKBONES, NORMALIZATIONS, normalizes_input
 )
 from data_sets.contains_images import add_border
 
@@ -21,6 +28,9 @@ MIN_TAG_NUM = 10
 SAVE_FOLDER = 'data'
 DEFAULT_IMAGE_SIZE = 139
 DEFAULT_TEST_SET_SHARE = 0.2
+FINE_TUNE_LEARNING_RATE_FACTOR = 0.1
+# labels predicted with a lower probability are not shown in the demo
+DEMO_THRESHOLD = 0.01
 
 
 def parse_command_line() -> Namespace:
@@ -45,6 +55,11 @@ def parse_command_line() -> Namespace:
         '--images-file', default=None,
         help='Pickle file from which to load precomputed image data set'
     )
+    parser.add_argument(
+        '--image-archive', default=None,
+        help='Packed image archive (without extension) to read images from; created if not present or '
+             'if its images have a different size'
+    )
     parser.add_argument(
         '--weights-file', '-w', default=None,
         help='HDF5 file from which to load precomputed set of weights'
@@ -89,12 +104,132 @@ def parse_command_line() -> Namespace:
         '--layers', default=[1024], type=int, nargs='+',
         help='Additional fully connected layers before the output layer'
     )
+    parser.add_argument(
+        '--bottleneck', action='store_true',
+        help='Only train the fully connected layers, on cached features computed by the fixed network; '
+             'needs --backbone-weights'
+    )
+    parser.add_argument(
+        '--backbone-weights', default=None,
+        help="Weights for the network without the fully connected layers: 'imagenet' or a weights file, "
+             "e.g. a local copy of the ImageNet weights without top (default: random initialization). "
+             "The network then normalizes the images as the weights expect"
+    )
+    parser.add_argument(
+        '--uint8-input', action='store_true',
+        help='Pass the images to the network as uint8 and normalize them in its first layer, as the '
+             'pretrained backbone expects'
+    )
+    parser.add_argument(
+        '--freeze-layers', type=int, default=None,
+        help='Number of layers of the network, counted from the input, which are not trained'
+    )
+    parser.add_argument(
+        '--freeze-up-to', default=None,
+        help='Name of the last layer or block of layers (e.g. "block3", "mixed5") which is not trained'
+    )
+    parser.add_argument(
+        '--fine-tune-epochs', type=int, default=0,
+        help='Number of epochs to train all layers, with reduced learning rate, after training the '
+             'unfrozen layers'
+    )
+    parser.add_argument(
+        '--results-file', default=None,
+        help='JSON file to which configuration, run times, memory usage and results of the run are written'
+    )
+    parser.add_argument(
+        '--timings', nargs='?', const='', default=None, metavar='TIMINGS_FILE',
+        help='Print the time spent in each phase of the run, and write it to TIMINGS_FILE as JSON if given'
+    )
+    parser.add_argument(
+        '--profile-dir', default=None,
+        help='Profile every phase of the run and write the statistics to PROFILE_DIR/<phase>.prof'
+    )
 
-    return parser.parse_args()
+    args = parser.parse_args()
+    try:
+        check_arguments(args)
+    except ValueError as error:
+        parser.error(str(error))
+    return args
+
+
+def check_arguments(args: Namespace) -> None:
+    """
+    :param args: command line arguments
+    :raises ValueError: if arguments are combined which do not work together
+    """
+    freezing = bool(args.freeze_layers) or args.freeze_up_to is not None
+    if args.bottleneck and not args.backbone_weights:
+        raise ValueError(
+            '--bottleneck needs --backbone-weights, features of a random backbone can not be reproduced'
+        )
+    if args.bottleneck and freezing:
+        raise ValueError(
+            '--freeze-layers and --freeze-up-to can not be used with --bottleneck, which only trains the '
+            'fully connected layers'
+        )
+    if args.fine_tune_epochs and not freezing:
+        raise ValueError(
+            '--fine-tune-epochs needs --freeze-layers or --freeze-up-to, without frozen layers all layers '
+            'are trained from the start'
+        )
+
+
+def schedule_callbacks(verbose: bool=False) -> List[Callback]:
+    """
+    :param verbose: If set, print changes of the learning rate and early stops
+    :return: the callbacks adapting the learning rate and the number of epochs, shared by all ways of
+             training a network so that their results are comparable
+    """
+    return [
+        # if loss does not change for 2 iterations, change learning rate
+        ReduceLROnPlateau(monitor='acc', factor=0.5, patience=2, verbose=verbose),
+        # if loss does not change for 4 iterations, finish training
+        EarlyStopping(monitor='acc', min_delta=0, patience=4, verbose=verbose),
+    ]
+
+
+def prepare_items(
+        items: Items, min_valid_tag: int, likes_only: bool, category: Optional[str], verbose: bool=False
+) -> Tuple[Items, Dict[str, int]]:
+    """
+    Select the items and tags a network is trained on.
+    :param items: all downloaded items
+    :param min_valid_tag: minimum number of times a tag has to occur to be considered valid
+    :param likes_only: If set, train only against whether an item is liked
+    :param category: If set, only use items of this category
+    :param verbose: If set, print status information
+    :return: the selected items, with their tags restricted to the valid tags, and the valid tags
+    """
+    if likes_only:
+        for item in items:
+            if '<3' not in item.tags:
+                item.tags.add(':-(')
+        valid_tags = {'<3': 0, ':-(': 0}
+    else:
+        valid_tags = items.get_valid_tags(min_valid_tag)
+    if category:
+        items = items.filter(category=category)
+        if len(items) == 0:
+            raise ValueError('No items of category {}: {}'.format(category, items.categories()))
+    items.update_tags(valid_tags)
+    category_string = '{}: '.format(category) if category else ''
+    WithVerbose.print_status(
+        verbose,
+        '{}{} items, {} liked'.format(
+            category_string,
+            len(items),
+            len([i for i in items if '<3' in i.tags])
+        )
+    )
+    return items, valid_tags
 
 
 class TrainingRunner(WithVerbose):
 
+    LOSS_FUNCTION = 'mean_squared_error'
+
     NETWORK_TYPES = {
         'inception': inception,
         'xception': xception,
@@ -109,7 +244,9 @@ class TrainingRunner(WithVerbose):
     }
 
     def __init__(self, args: Namespace) -> None:
+        check_arguments(args)
         WithVerbose.__init__(self, args.verbose)
+        self.timer = PhaseTimer(args.profile_dir)
         self.image_size = args.image_size
         self.min_valid_tag = args.min_valid_tag
         self.likes_only = args.likes_only
@@ -122,28 +259,107 @@ class TrainingRunner(WithVerbose):
             args.save_folder, args.image_size, args.item_file, args.weights_file,
             verbose=self.verbose
         )
-        self.loss_function = 'mean_squared_error'
+        self.loss_function = self.LOSS_FUNCTION
         self.optimizer = args.optimizer
+        self.network_name = args.type
         self.neural_network_type = self.decode_network_name(args.type)
         self.fully_connected_layers = args.layers
         self.tensorboard = args.tensorboard
         self.log_dir = './logs'  # TODO: CLI arg
-        self.image_data = self._get_image_data(args.test_set_share, args. random_seed)
-        self.model = self.setup_model()
+        self.image_archive_base = args.image_archive
+        self.backbone_weights = args.backbone_weights
+        self.uint8_input = args.uint8_input
+        self.freeze_layers = args.freeze_layers
+        self.freeze_up_to = args.freeze_up_to
+        self.fine_tune_epochs = args.fine_tune_epochs
+        self.results_file = args.results_file
+        self.timings = args.timings
+        self.epoch_results = []  # type: List[Dict[str, float]]
+        self.trained_images = 0
+        self.test_result = None  # type: Optional[Dict[str, float]]
+        with self.timer.phase('get_image_data'):
+            self.image_data = self._get_image_data(args.test_set_share, args. random_seed)
+        with self.timer.phase('setup_model'):
+            self.model = self.setup_model()
 
     def run(self) -> None:
-        self.run_training()
-        self.run_test()
-        self.run_demo()
+        with self.timer.phase('run_training'):
+            self.run_training()
+        if self.epoch_results:
+            # timed apart from the training, so saving does not count against the images per second
+            with self.timer.phase('save_model'):
+                self.save_model()
+        with self.timer.phase('run_test'):
+            self.run_test()
+        with self.timer.phase('run_demo'):
+            self.run_demo()
+        if self.results_file:
+            self.write_results(self.results_file)
+        if self.timings is not None:
+            self.report_timings(self.timings)
+
+    def report_timings(self, timings_file: str) -> None:
+        """
+        Print the wall clock and CPU time spent in each phase of the run.
+        :param timings_file: JSON file the timings are also written to, if not empty
+        :return: None
+        """
+        print(self.timer.table())
+        if timings_file:
+            with open(timings_file, 'w') as file:
+                json.dump(self.timer.as_dict(), file, indent=2)
+
+    def write_results(self, results_file: str) -> None:
+        """
+        Write a machine readable record of this run.
+        :param results_file: JSON file the record is written to
+        :return: None
+        """
+        self._print_status('Saving', results_file)
+        with open(results_file, 'w') as file:
+            json.dump(self.results(), file, indent=2)
+
+    def results(self) -> Dict[str, Any]:
+        """
+        :return: configuration, wall clock and CPU time per phase, peak memory usage, training
+                 throughput, loss and metrics per epoch and test set results of this run
+        """
+        training_time = self.timer.wall_time('run_training')
+        return {
+            'config': self.config(),
+            'phases': self.timer.as_dict(),
+            'peak_rss': peak_rss(),
+            'trained_images': self.trained_images,
+            'images_per_second': self.trained_images / training_time if training_time else None,
+            'epochs': self.epoch_results,
+            'test': self.test_result,
+        }
 
-    def callbacks(self) -> List[Callback]:
-        return [
+    def config(self) -> Dict[str, Any]:
+        return {
+            'type': self.network_name, 'optimizer': self.optimizer, 'image_size': self.image_size,
+            'batch_size': self.batch_size, 'layers': list(self.fully_connected_layers),
+            'num_epochs': self.num_epochs, 'fine_tune_epochs': self.fine_tune_epochs,
+            'likes_only': self.likes_only, 'category': self.category,
+            'backbone_weights': self.backbone_weights, 'uint8_input': self.uint8_input,
+            'num_frozen_layers': self.num_frozen_layers,
+            'bottleneck': isinstance(self, BottleneckTrainingRunner),
+            'num_items': self.image_data.num_items, 'num_classes': self.image_data.num_classes,
+            'train_images': len(self.image_data.train.chunks),
+            'test_images': len(self.image_data.test.chunks),
+        }
+
+    def callbacks(self, stall_monitor: Optional[DataStallMonitor]=None) -> List[Callback]:
+        """
+        :param stall_monitor: Monitor for the training data generator, if training from a generator
+        :return: the callbacks used in training
+        """
+        # measures input pipeline stalls and adds them to the logs, so it must run first
+        monitor = [stall_monitor] if stall_monitor is not None else []  # type: List[Callback]
+        return monitor + [
             # save weights after every iteration
             ModelCheckpoint(self.io.weights_file_base + '.{epoch:02d}.hdf5', verbose=self.verbose),
-            # if loss does not change for 2 iterations, change learning rate
-            ReduceLROnPlateau(monitor='acc', factor=0.5, patience=2, verbose=self.verbose),
-            # if loss does not change for 4 iterations, finish training
-            EarlyStopping(monitor='acc', min_delta=0, patience=4, verbose=self.verbose),
+            *schedule_callbacks(self.verbose),
             # write log for visualization in TensorBoard
             TensorBoard(
                 log_dir=self.log_dir, batch_size=self.batch_size, histogram_freq=0,
@@ -153,84 +369,149 @@ class TrainingRunner(WithVerbose):
 
     def run_training(self) -> None:
         if self.num_epochs:
-            self.model.fit_generator(
-                self.image_data.train_generator(),
+            stall_monitor = DataStallMonitor()
+            history = self.model.fit_generator(
+                self.image_data.dataset(stall_monitor.wrap(self.image_data.train_generator())),
                 steps_per_epoch=self.image_data.train_length(), epochs=self.num_epochs,
-                callbacks=self.callbacks(), verbose=self.verbose
+                callbacks=self.callbacks(stall_monitor), verbose=self.verbose
             )
-            self.io.save_weights(self.model, self._fit_type(), self._num_items)
+            self._record_history(history)
+        if self.fine_tune_epochs and self.num_frozen_layers:
+            self.run_fine_tuning()
+
+    def run_fine_tuning(self) -> None:
+        """
+        Continue training with all layers unfrozen and a reduced learning rate, so the pretrained
+        layers adapt to the data set without losing what they learned.
+        :return: None
+        """
+        unfreeze_layers(self.model)
+        optimizer = optimizers.get(self.optimizer)
+        optimizer.learning_rate = optimizer.learning_rate * FINE_TUNE_LEARNING_RATE_FACTOR
+        self.model.compile(loss=self.loss_function, optimizer=optimizer, metrics=['accuracy'])
+        self.num_frozen_layers = 0
+        self._print_status(f'Fine tuning all {len(self.model.layers)} layers')
+        stall_monitor = DataStallMonitor()
+        history = self.model.fit_generator(
+            self.image_data.dataset(stall_monitor.wrap(self.image_data.train_generator())),
+            steps_per_epoch=self.image_data.train_length(),
+            initial_epoch=self.num_epochs, epochs=self.num_epochs + self.fine_tune_epochs,
+            callbacks=self.callbacks(stall_monitor), verbose=self.verbose
+        )
+        self._record_history(history)
+
+    def save_model(self) -> None:
+        """
+        Save the weights, and next to them a model bundle the predictors can load without knowing how the
+        model was built.
+        :return: None
+        """
+        self.io.save_weights(self.model, self._fit_type(), self._num_items)
+        directory = bundle_dir(self.io.weights_file(self._fit_type(), self._num_items))
+        self._print_status('Saving', directory)
+        ModelBundle(
+            self._inference_model(), self.image_data.labels_to_numbers, self.image_data.size,
+            {'resize': 'add_border', 'normalization': self._normalization()}, self.network_name
+        ).save(directory)
+
+    def _normalization(self) -> Optional[str]:
+        """:return: how the model normalizes its input, None if it takes the pixel values unchanged"""
+        if not normalizes_input(self.uint8_input, self.backbone_weights):
+            return None
+        return NORMALIZATIONS[BACKBONES[self.network_name]]
 
     def run_test(self) -> None:
         if self.test:
             loss_and_metrics = self.model.evaluate_generator(
-                self.image_data.test_generator(), steps=self.image_data.test_length(), max_queue_size=2
+                self.image_data.dataset(self.image_data.test_generator()), steps=self.image_data.test_length()
             )
-            print()
-            print('test set loss:', loss_and_metrics[0], 'test set accuracy:', loss_and_metrics[1])
+            self._report_test_result(loss_and_metrics)
+
+    def _report_test_result(self, loss_and_metrics: List[float]) -> None:
+        self.test_result = {'loss': float(loss_and_metrics[0]), 'accuracy': float(loss_and_metrics[1])}
+        print()
+        print('test set loss:', loss_and_metrics[0], 'test set accuracy:', loss_and_metrics[1])
+
+    def _record_history(self, history: History) -> None:
+        for i, epoch in enumerate(history.epoch):
+            self.epoch_results.append(
+                {'epoch': epoch + 1, **{name: float(values[i]) for name, values in history.history.items()}}
+            )
+        self.trained_images += len(self.image_data.train.chunks) * len(history.epoch)
 
     def run_demo(self) -> None:
+        if not self.demo:
+            return
         for item in [i for i in self._prepare_items()[0] if '<3' in i.tags][:self.demo]:
-            images = numpy.asarray([
-                self.image_data.downscale(Image.open(file).convert('RGB'), method=add_border)
-                for file in item.picture_files
-            ])
-            for image in images:
-                self.image_data.show_image(image)
-            predictions = self.model.predict(images, batch_size=len(images), verbose=1)
-            for prediction in predictions:
-                pprint(
-                    [
-                        (label, prob)
-                        for label, prob in self.image_data.labels_sorted_by_probability(prediction).items()
-                        if prob > 0.01
-                    ]
-                )
+            predictions = self._predict_pictures(item.picture_files)
+            for labels in self.image_data.top_labels(predictions, threshold=DEMO_THRESHOLD):
+                pprint(labels)
+
+    def _predict_pictures(self, image_files: List[str]) -> numpy.ndarray:
+        images = numpy.asarray([
+            self.image_data.downscale(Image.open(file).convert('RGB'), method=add_border)
+            for file in image_files
+        ])
+        for image in images:
+            self.image_data.show_image(image)
+        return self.model.predict(images, batch_size=len(images), verbose=1)
 
     def _get_image_data(self, test_set_share: float, random_seed: int) -> EbayDataGenerator:
         items, valid_tags = self._prepare_items()
         return EbayDataGenerator(
             items, valid_tags, (self.image_size, self.image_size),
             batch_size=self.batch_size, random_seed=random_seed, test_share=test_set_share,
-            verbose=self.verbose
+            image_archive=self._get_image_archive(items), verbose=self.verbose
         )
 
+    def _get_image_archive(self, items: Items) -> Optional[ImageArchive]:
+        if not self.image_archive_base:
+            return None
+        size = (self.image_size, self.image_size)
+        if ImageArchive.exists(self.image_archive_base):
+            try:
+                archive = ImageArchive(self.image_archive_base)
+                if archive.size == size:
+                    return archive
+                archive.close()
+                self._print_status(f'Image archive has image size {archive.size}, rebuilding')
+            except ValueError as error:
+                self._print_status(f'{error}, rebuilding image archive')
+        ImageArchiveWriter(self.image_archive_base, size, verbose=self.verbose).build(items)
+        return ImageArchive(self.image_archive_base)
+
     def setup_model(self) -> Model:
-        model = self.neural_network_type(
-            input_shape=(*self.image_data.size, self.image_data.DEPTH),
-            classes=self.image_data.num_classes,
-            connected_layers=self.fully_connected_layers
-        )
+        model = self._build_model()
+        self.num_frozen_layers = freeze_layers(model, self.freeze_layers, self.freeze_up_to)
         model.compile(loss=self.loss_function, optimizer=self.optimizer, metrics=['accuracy'])
 
         num_layers = len(model.layers)
-        self._print_status(f'Model compiled - {self.neural_network_type.__name__}, {num_layers} layers')
-        self.io.load_weights(model, self._fit_type(), self._num_items)
+        self._print_status(
+            f'Model compiled - {self.neural_network_type.__name__}, {num_layers} layers, '
+            f'{self.num_frozen_layers} frozen'
+        )
+        with self.timer.phase('load_weights'):
+            self.io.load_weights(model, self._fit_type(), self._num_items)
         return model
 
-    def _prepare_items(self) -> Tuple[Items, Dict[str, int]]:
-        items = self.io.load_items()
-        self._num_items = len(items)
-        if self.likes_only:
-            for item in items:
-                if '<3' not in item.tags:
-                    item.tags.add(':-(')
-            valid_tags = {'<3': 0, ':-(': 0}
-        else:
-            valid_tags = items.get_valid_tags(self.min_valid_tag)
-        if self.category:
-            items = items.filter(category=self.category)
-            if len(items) == 0:
-                raise ValueError('No items of category {}: {}'.format(self.category, items.categories()))
-        items.update_tags(valid_tags)
-        category_string = '{}: '.format(self.category) if self.category else ''
-        self._print_status(
-            '{}{} items, {} liked'.format(
-                category_string,
-                len(items),
-                len([i for i in items if '<3' in i.tags])
-            )
+    def _build_model(self) -> Model:
+        return self.neural_network_type(
+            input_shape=(*self.image_data.size, self.image_data.DEPTH),
+            classes=self.image_data.num_classes,
+            connected_layers=self.fully_connected_layers,
+            weights=self.backbone_weights,
+            uint8_input=self.uint8_input
         )
-        return items, valid_tags
+
+    def _inference_model(self) -> Model:
+        """:return: the model predicting from images"""
+        return self.model
+
+    def _prepare_items(self) -> Tuple[Items, Dict[str, int]]:
+        with self.timer.phase('prepare_items'):
+            items = self.io.load_items()
+            self._num_items = len(items)
+            return prepare_items(items, self.min_valid_tag, self.likes_only, self.category, self.verbose)
 
     def _fit_type(self) -> str:
         type = 'likes' if self.likes_only else 'full'
@@ -244,6 +525,60 @@ class TrainingRunner(WithVerbose):
             raise ValueError('Invalid Neural Network name "{}"'.format(network_type))
 
 
+class BottleneckTrainingRunner(TrainingRunner):
+    """
+    Trains only the fully connected layers, on the bottleneck features the fixed network without its
+    fully connected layers computes for every picture. The features are computed once per network,
+    network weights and image size and cached in the save folder, so trying out different fully
+    connected layers or optimizers only costs the training of these layers.
+    """
+
+    def run_training(self) -> None:
+        if self.num_epochs:
+            features, labels = self._features_and_labels(self.image_data.train)
+            self._record_history(
+                self.model.fit(
+                    features, labels, batch_size=self.batch_size, epochs=self.num_epochs,
+                    callbacks=self.callbacks(), verbose=self.verbose
+                )
+            )
+
+    def run_test(self) -> None:
+        if self.test:
+            features, labels = self._features_and_labels(self.image_data.test)
+            self._report_test_result(self.model.evaluate(features, labels, batch_size=self.batch_size))
+
+    def _predict_pictures(self, image_files: List[str]) -> numpy.ndarray:
+        features = self.bottleneck_features.features(image_files)
+        return self.model.predict(features, batch_size=len(features), verbose=1)
+
+    def _build_model(self) -> Model:
+        self.bottleneck_features = BottleneckFeatures(
+            self.image_data, self.network_name, self.backbone_weights, self.io.base_dir, self.uint8_input,
+            self.verbose
+        )
+        return head(
+            self.bottleneck_features.num_features, self.image_data.num_classes, self.fully_connected_layers
+        )
+
+    def _inference_model(self) -> Model:
+        backbone = self.bottleneck_features.backbone
+        # apply the layers of the head one by one instead of nesting the head, so the bundled model is
+        # a plain chain of layers like the models trained on images
+        x = backbone.output
+        for layer in self.model.layers[1:]:
+            x = layer(x)
+        return Model(inputs=backbone.input, outputs=x)
+
+    def _features_and_labels(self, data_set: BatchGenerator) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        features = self.bottleneck_features.features([image_file for _, image_file in data_set.chunks])
+        return features, self.image_data.labels_for_batch([data_set.chunks], 0)
+
+    def _fit_type(self) -> str:
+        return 'bottleneck_' + super()._fit_type()
+
+
 if __name__ == '__main__':
-    runner = TrainingRunner(args=parse_command_line())
+    args = parse_command_line()
+    runner = BottleneckTrainingRunner(args) if args.bottleneck else TrainingRunner(args)
     runner.run()
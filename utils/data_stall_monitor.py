@@ -0,0 +1,77 @@
+from time import perf_counter
+from typing import Any, Dict, Generator, Iterable, List, Optional, Tuple
+
+import numpy
+from keras.callbacks import Callback
+
+Batch = Tuple[numpy.ndarray, numpy.ndarray]
+
+
+class DataStallMonitor(Callback):  # type: ignore
+    """
+    Keras callback measuring how long training waits for the input pipeline. The training data
+    generator must be wrapped with wrap(), which records when every batch is ready. A batch which
+    becomes ready only after the previous batch finished training stalls training for the difference.
+
+    At the end of every epoch the logs get the keys
+     - images_per_second: trained images per second of wall clock time
+     - data_stall_percent: share of the epoch spent waiting for input
+     - queue_depth: average number of batches ready but not trained yet when a batch starts training
+    so they end up in the History, TensorBoard and everything else reading the logs. The callback
+    must therefore be placed before these callbacks.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._ready_times = []  # type: List[float]
+        self._batch_sizes = []  # type: List[int]
+        self._batch = 0
+        self._epoch_start = 0.
+        self._previous_end = 0.
+        self._wait_time = 0.
+        self._images = 0
+        self._queue_depths = []  # type: List[int]
+
+    def wrap(self, generator: Iterable[Batch]) -> Generator[Batch, None, None]:
+        """
+        :param generator: the generator of (images, labels) training batches
+        :return: generator yielding the same batches, recording when each was produced
+        """
+        for images, labels in generator:
+            self._batch_sizes.append(len(images))
+            self._ready_times.append(perf_counter())
+            yield images, labels
+
+    def on_epoch_begin(self, epoch: int, logs: Optional[Dict[str, Any]]=None) -> None:
+        self._epoch_start = self._previous_end = perf_counter()
+        self._wait_time = 0.
+        self._images = 0
+        self._queue_depths = []
+
+    def on_train_batch_begin(self, batch: int, logs: Optional[Dict[str, Any]]=None) -> None:
+        self._queue_depths.append(max(len(self._ready_times) - self._batch, 0))
+
+    def on_train_batch_end(self, batch: int, logs: Optional[Dict[str, Any]]=None) -> None:
+        end = perf_counter()
+        ready = self._ready_times[self._batch] if self._batch < len(self._ready_times) else end
+        self._wait_time += min(max(ready - self._previous_end, 0.), end - self._previous_end)
+        if self._batch < len(self._batch_sizes):
+            self._images += self._batch_sizes[self._batch]
+        self._batch += 1
+        self._previous_end = end
+
+    def on_epoch_end(self, epoch: int, logs: Optional[Dict[str, Any]]=None) -> None:
+        if logs is None:
+            return
+        logs.update(self.epoch_statistics(perf_counter() - self._epoch_start))
+
+    def epoch_statistics(self, elapsed: float) -> Dict[str, float]:
+        """
+        :param elapsed: wall clock time of the epoch so far
+        :return: throughput, share of time waiting for input and average queue depth of the epoch
+        """
+        return {
+            'images_per_second': self._images / elapsed if elapsed else 0.,
+            'data_stall_percent': 100 * self._wait_time / elapsed if elapsed else 0.,
+            'queue_depth': float(numpy.mean(self._queue_depths)) if self._queue_depths else 0.,
+        }
@@ -0,0 +1,103 @@
+import cProfile
+import resource
+import sys
+from contextlib import contextmanager
+from os import makedirs, times
+from os.path import join
+from time import perf_counter
+from typing import Dict, Iterator, List, Optional
+
+
+class PhaseTimer:
+    """
+    Wall clock and CPU time spent in the named phases of a program run. Phases may be nested; a nested
+    phase is recorded as "<outer phase>/<inner phase>".
+    """
+
+    def __init__(self, profile_dir: Optional[str]=None) -> None:
+        """
+        :param profile_dir: If set, every outermost phase is profiled and its statistics written to
+                            <profile_dir>/<phase>.prof, to be read with pstats or snakeviz
+        """
+        self.phases = {}  # type: Dict[str, Dict[str, float]]
+        self.profile_dir = profile_dir
+        self._stack = []  # type: List[str]
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Context manager measuring the code run inside it. Times for the same phase entered repeatedly
+        are added up.
+        :param name: name of the phase
+        """
+        self._stack.append(name)
+        path = '/'.join(self._stack)
+        profile = cProfile.Profile() if self.profile_dir and len(self._stack) == 1 else None
+        start_wall, start_cpu = perf_counter(), cpu_time()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            times_spent = self.phases.setdefault(path, {'wall': 0., 'cpu': 0.})
+            times_spent['wall'] += perf_counter() - start_wall
+            times_spent['cpu'] += cpu_time() - start_cpu
+            self._stack.pop()
+            if profile is not None:
+                self._dump(profile, name)
+
+    def wall_time(self, name: str) -> float:
+        return self.phases.get(name, {}).get('wall', 0.)
+
+    def as_dict(self) -> Dict[str, Dict[str, float]]:
+        return {name: dict(times_spent) for name, times_spent in self.phases.items()}
+
+    def table(self) -> str:
+        """
+        :return: table of all phases with their wall clock and CPU time and share of the total time
+        """
+        total = sum(times_spent['wall'] for name, times_spent in self.phases.items() if '/' not in name)
+        width = max([len('Phase')] + [_indented_length(name) for name in self.phases])
+        lines = [
+            '{:{width}} {:>10} {:>10} {:>7}'.format('Phase', 'Wall [s]', 'CPU [s]', 'Share', width=width)
+        ]
+        for name in sorted(self.phases, key=self._position):
+            times_spent = self.phases[name]
+            lines.append(
+                '{:{width}} {:10.2f} {:10.2f} {:6.1f}%'.format(
+                    '  ' * name.count('/') + name.split('/')[-1], times_spent['wall'], times_spent['cpu'],
+                    100 * times_spent['wall'] / total if total else 0., width=width
+                )
+            )
+        lines.append('{:{width}} {:10.2f}'.format('Total', total, width=width))
+        return '\n'.join(lines)
+
+    def _position(self, name: str) -> List[int]:
+        """Sort key putting every nested phase right below its outer phase, in order of first entry."""
+        order = list(self.phases)
+        parts = name.split('/')
+        return [order.index('/'.join(parts[:i + 1])) for i in range(len(parts))]
+
+    def _dump(self, profile: cProfile.Profile, name: str) -> None:
+        assert self.profile_dir is not None
+        makedirs(self.profile_dir, exist_ok=True)
+        profile.dump_stats(join(self.profile_dir, name + '.prof'))
+
+
+def cpu_time() -> float:
+    """User and system time of this process, including all its threads, like time(1) reports it."""
+    cpu = times()
+    return cpu.user + cpu.system
+
+
+def peak_rss() -> int:
+    """Largest resident set size of this process so far, in bytes."""
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def _indented_length(name: str) -> int:
+    return 2 * name.count('/') + len(name.split('/')[-1])
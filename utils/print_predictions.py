@@ -25,17 +25,10 @@ def print_prediction(
     # pprint(image_data.labels_sorted_by_probability(label))
     image_data.show_image(images)
     print('predictions:')
-    pprint(
-        [
-            (label, prob)
-            for label, prob in image_data.labels_sorted_by_probability(
-                model.predict(
-                    images.reshape(1, *image_data.size, image_data.DEPTH), batch_size=1, verbose=1
-                )[0]
-            ).items()
-            if prob > 0.01
-        ]
+    predictions = model.predict(
+        images.reshape(1, *image_data.size, image_data.DEPTH), batch_size=1, verbose=1
     )
+    pprint(image_data.top_labels(predictions, threshold=0.01)[0])
 
 
 def parse_args() -> Namespace:
@@ -0,0 +1,113 @@
+"""
+Tracing of where a program spends its time, exported as Chrome trace events.
+
+Code marks interesting operations with span(), which costs next to nothing unless tracing was started
+with start_tracing(). The recorded spans carry the process and thread they ran in, so a trace viewer
+(chrome://tracing, https://ui.perfetto.dev) shows them as one timeline per thread.
+"""
+
+import json
+import threading
+from contextlib import contextmanager
+from os import getpid
+from time import perf_counter
+from typing import Any, ContextManager, Dict, Iterator, List, Optional
+
+
+class Tracer:
+    """Collects the spans recorded by all threads of the process."""
+
+    def __init__(self) -> None:
+        self.events = []  # type: List[Dict[str, Any]]
+        self._lock = threading.Lock()
+        self._start = perf_counter()
+        self._thread_names = {}  # type: Dict[int, str]
+
+    @contextmanager
+    def span(self, name: str, category: str='', **args: Any) -> Iterator[None]:
+        """
+        Record the code run inside the context manager as a span.
+        :param name: name of the span shown in the trace viewer
+        :param category: category of the span, can be used to filter spans in the trace viewer
+        :param args: further information shown with the span
+        """
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, category, start, perf_counter(), **args)
+
+    def add(self, name: str, category: str, start: float, end: float, **args: Any) -> None:
+        """
+        Record a span measured by the caller.
+        :param start: perf_counter() at the start of the span
+        :param end: perf_counter() at the end of the span
+        """
+        thread = threading.current_thread()
+        event = {
+            'name': name, 'cat': category, 'ph': 'X', 'pid': getpid(), 'tid': thread.ident,
+            'ts': (start - self._start) * 1e6, 'dur': (end - start) * 1e6, 'args': args
+        }
+        with self._lock:
+            self.events.append(event)
+            self._thread_names.setdefault(thread.ident or 0, thread.name)
+
+    def trace_events(self) -> Dict[str, Any]:
+        """
+        :return: the recorded spans in the Chrome trace event format
+        """
+        with self._lock:
+            thread_names = [
+                {'name': 'thread_name', 'ph': 'M', 'pid': getpid(), 'tid': tid, 'args': {'name': name}}
+                for tid, name in self._thread_names.items()
+            ]
+            return {'traceEvents': thread_names + list(self.events), 'displayTimeUnit': 'ms'}
+
+    def save(self, trace_file: str) -> None:
+        with open(trace_file, 'w') as file:
+            json.dump(self.trace_events(), file)
+
+
+class _NoSpan:
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *exc_info: Any) -> None:
+        pass
+
+
+_NO_SPAN = _NoSpan()
+_tracer = None  # type: Optional[Tracer]
+
+
+def start_tracing() -> Tracer:
+    """
+    Record all spans from now on.
+    :return: the Tracer recording the spans
+    """
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+
+def stop_tracing() -> Optional[Tracer]:
+    """
+    Stop recording spans.
+    :return: the Tracer which recorded the spans so far, None if tracing was not started
+    """
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+def span(name: str, category: str='', **args: Any) -> ContextManager[None]:
+    """
+    Context manager recording the code run inside it as a span, if tracing is started.
+    :param name: name of the span shown in the trace viewer
+    :param category: category of the span, can be used to filter spans in the trace viewer
+    :param args: further information shown with the span
+    """
+    tracer = _tracer
+    if tracer is None:
+        return _NO_SPAN
+    return tracer.span(name, category, **args)